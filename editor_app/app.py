@@ -39,6 +39,7 @@ from copy import copy
 import customwidgets as cwdg
 import widgets as wdg
 import auxiliaries as aux
+from history import SpriteHistory, HISTORY_MEMORY_MB
 
 import pathgenerator.widget as pg_wdg
 
@@ -179,6 +180,13 @@ class MainWindowUi(QMainWindow):
             lambda x, mode=0: self.setCurrentImportOffsetMode(mode))
         self.actionTileCenter.triggered.connect(
             lambda x, mode=1: self.setCurrentImportOffsetMode(mode))
+
+        self.actionDitherFloydSteinberg.triggered.connect(
+            lambda x, mode=0: self.setCurrentImportDither(mode))
+        self.actionDitherOrdered.triggered.connect(
+            lambda x, mode=1: self.setCurrentImportDither(mode))
+        self.actionDitherNone.triggered.connect(
+            lambda x, mode=2: self.setCurrentImportDither(mode))
         
         self.actionPathTileGenerator.triggered.connect(self.openPathTileGenerator)
 
@@ -306,8 +314,9 @@ class MainWindowUi(QMainWindow):
                 self.settings['background_color'] = 0
                 self.settings['background_color_custom'] = (0, 0, 0)
                 self.settings['palette'] = 0
-                self.settings['history_maximum'] = 5
+                self.settings['history_memory'] = HISTORY_MEMORY_MB
                 self.settings['import_offset_mode'] = 0
+                self.settings['import_dither'] = 0
 
                 self.settings['small_scenery_defaults'] = {}
                 self.settings['large_scenery_defaults'] = {}
@@ -317,10 +326,13 @@ class MainWindowUi(QMainWindow):
         self.last_open_folder_sprites = None
         self.setCurrentImportColor(self.settings['transparency_color'])
         self.setCurrentPalette(self.settings['palette'], update_widgets=False)
+        SpriteHistory.setMaxMemory(self.settings.get('history_memory', HISTORY_MEMORY_MB))
         self.setCurrentBackgroundColor(self.settings.get(
             'background_color', 0), update_widgets=False)
         self.setCurrentImportOffsetMode(
             self.settings.get('import_offset_mode', 0))
+        self.setCurrentImportDither(
+            self.settings.get('import_dither', 0))
 
     def saveSettings(self):
         path = self.app_data_path
@@ -341,6 +353,9 @@ class MainWindowUi(QMainWindow):
                 self.settings['background_color'], update_widgets=update_widgets)
             self.setCurrentImportOffsetMode(
                 self.settings['import_offset_mode'])
+            self.setCurrentImportDither(
+                self.settings['import_dither'])
+            SpriteHistory.setMaxMemory(self.settings['history_memory'])
 
             self.saveSettings()
 
@@ -440,6 +455,23 @@ class MainWindowUi(QMainWindow):
             self.actionTileBottom.setChecked(False)
             self.actionTileCenter.setChecked(True)
 
+    def setCurrentImportDither(self, mode):
+        if mode == 0:
+            self.current_import_dither = 'floyd-steinberg'
+            self.actionDitherFloydSteinberg.setChecked(True)
+            self.actionDitherOrdered.setChecked(False)
+            self.actionDitherNone.setChecked(False)
+        elif mode == 1:
+            self.current_import_dither = 'ordered'
+            self.actionDitherFloydSteinberg.setChecked(False)
+            self.actionDitherOrdered.setChecked(True)
+            self.actionDitherNone.setChecked(False)
+        elif mode == 2:
+            self.current_import_dither = 'none'
+            self.actionDitherFloydSteinberg.setChecked(False)
+            self.actionDitherOrdered.setChecked(False)
+            self.actionDitherNone.setChecked(True)
+
     def loadObjectFromPath(self, filepath):
         try:
             o = obj.load(filepath, openpath=self.openpath)
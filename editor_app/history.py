@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Undo history of sprite layers.
+
+A change is stored as delta: the offsets and sizes of the sprite before and after, and the bounding box of the
+changed pixels with their content before and after, compressed with zlib. The pixels are stored as palette
+indices when they are exact palette colors, else as RGBA. The history is bounded by memory instead of a number
+of steps, and the layers changed by one operation form one transaction that is undone and redone as a whole.
+"""
+
+import zlib
+from contextlib import contextmanager
+from copy import copy
+import numpy as np
+from PIL import Image
+
+HISTORY_MEMORY_MB = 64
+
+
+def _frame(sprite):
+    return sprite.x, sprite.y, sprite.image.width, sprite.image.height
+
+
+def _paste(canvas: np.ndarray, data: np.ndarray, x: int, y: int):
+    """Copies data into canvas at (x, y), clipped to the canvas."""
+    left, top = max(x, 0), max(y, 0)
+    right = min(x + data.shape[1], canvas.shape[1])
+    bottom = min(y + data.shape[0], canvas.shape[0])
+
+    if left < right and top < bottom:
+        canvas[top:bottom, left:right] = data[top-y:bottom-y, left-x:right-x]
+
+
+class SpriteDelta:
+    """Difference between two states of a sprite."""
+    __slots__ = ('frames', 'rect', 'palette', 'indexed', 'data', 'nbytes')
+
+    def __init__(self, before, after):
+        self.frames = (_frame(before), _frame(after))
+        self.palette = before.palette
+        self.rect = None
+        self.data = (None, None)
+        self.nbytes = 64
+
+        # both states on their common frame, in sprite coordinates
+        left = min(frame[0] for frame in self.frames)
+        top = min(frame[1] for frame in self.frames)
+        right = max(frame[0] + frame[2] for frame in self.frames)
+        bottom = max(frame[1] + frame[3] for frame in self.frames)
+
+        states = []
+        for sprite in (before, after):
+            canvas = np.zeros((bottom-top, right-left, 4), dtype=np.uint8)
+            _paste(canvas, np.asarray(sprite.image.convert('RGBA')), sprite.x-left, sprite.y-top)
+            states.append(canvas)
+
+        changed = (states[0] != states[1]).any(axis=2)
+        if not changed.any():
+            return
+
+        rows = np.flatnonzero(changed.any(axis=1))
+        columns = np.flatnonzero(changed.any(axis=0))
+        x0, x1 = int(columns[0]), int(columns[-1])+1
+        y0, y1 = int(rows[0]), int(rows[-1])+1
+        self.rect = (left+x0, top+y0, x1-x0, y1-y0)
+
+        regions = [state[y0:y1, x0:x1] for state in states]
+
+        # palette indices are only stored if they give back the exact pixels
+        table = self.palette.indexTable()
+        indices = [self.palette.lookupIndices(region)[0] for region in regions]
+        self.indexed = all(np.array_equal(table[ind], region) for ind, region in zip(indices, regions))
+
+        stored = indices if self.indexed else regions
+        self.data = tuple(zlib.compress(np.ascontiguousarray(array).tobytes(), 1) for array in stored)
+        self.nbytes += sum(len(data) for data in self.data)
+
+    def isEmpty(self):
+        return self.rect is None and self.frames[0] == self.frames[1]
+
+    def _region(self, state: int, as_indices: bool = False):
+        _, _, width, height = self.rect
+        array = np.frombuffer(zlib.decompress(self.data[state]), dtype=np.uint8)
+        if self.indexed:
+            indices = array.reshape(height, width)
+            return indices if as_indices else self.palette.indexTable()[indices]
+
+        return array.reshape(height, width, 4)
+
+    def _apply(self, sprite, state: int):
+        # the current sprite is taken to be the other state, only its pixels in the changed box are replaced
+        x, y, width, height = self.frames[state]
+        x_other, y_other, _, _ = self.frames[1-state]
+
+        # indexed sprites are restored on their index array if the delta is stored as indices too
+        if sprite.isIndexed() and (self.indexed or not self.rect) and sprite.palette is self.palette:
+            canvas = np.zeros((height, width), dtype=np.uint8)
+            _paste(canvas, sprite.indices, x_other-x, y_other-y)
+            if self.rect:
+                _paste(canvas, self._region(state, as_indices=True), self.rect[0]-x, self.rect[1]-y)
+
+            sprite.setIndices(canvas)
+        else:
+            canvas = np.zeros((height, width, 4), dtype=np.uint8)
+            _paste(canvas, np.asarray(sprite.image.convert('RGBA')), x_other-x, y_other-y)
+            if self.rect:
+                _paste(canvas, self._region(state), self.rect[0]-x, self.rect[1]-y)
+
+            sprite.image = Image.fromarray(canvas, 'RGBA')
+
+        sprite.x = x
+        sprite.y = y
+
+    def undo(self, sprite):
+        self._apply(sprite, 0)
+
+    def redo(self, sprite):
+        self._apply(sprite, 1)
+
+
+class SpriteHistory:
+    """Undo and redo stacks of transactions, each a list of (layer, SpriteDelta).
+
+    record remembers the sprites of layers before they are changed and finish computes the deltas once the
+    operation has ended; if finish is not called, the next record, undo or redo does it. Operations that record
+    and change several layers one after another are grouped with transaction().
+
+    The history also keeps the last state of each layer that it knows of. Changes that were not recorded are
+    found by comparing against it and become a step of their own, so the deltas are only applied to the states
+    they were computed from. Only the layers that are redrawn, recorded, undone or redone are compared, so the
+    cost follows the change and not the number of layers."""
+
+    # memory budget of every history, set from the settings by the main window
+    max_bytes = HISTORY_MEMORY_MB*1024*1024
+
+    def __init__(self, max_bytes: int = None):
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.undo_stack = []
+        self.redo_stack = []
+        self.nbytes = 0
+
+        # (layer, sprite copy) of the transaction that is being recorded
+        self._pending = None
+        self._depth = 0
+
+        # (layer, sprite, sprite copy) of the last known state by layer id
+        self._known = {}
+
+    @classmethod
+    def setMaxMemory(cls, megabytes: int):
+        cls.max_bytes = megabytes*1024*1024
+
+    def record(self, *layers):
+        """Remembers the current sprites of layers, which are about to change together."""
+        if self._depth == 0:
+            self.finish()
+            self._pending = []
+
+        self._sync(layers)
+
+        for layer in layers:
+            if not any(pending_layer is layer for pending_layer, _ in self._pending):
+                self._pending.append((layer, copy(layer.sprite)))
+
+        self._clearRedo()
+
+    def finish(self, *layers):
+        """Computes the deltas of the recorded layers, the operation that changed them has ended. Changes of the
+        given layers that were not recorded are added as a step of their own."""
+        if self._depth == 0:
+            self._seal()
+            self._sync(layers)
+
+    @contextmanager
+    def transaction(self):
+        """All layers recorded within the block are undone as one step."""
+        if self._depth == 0:
+            self.finish()
+            self._pending = []
+
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            self.finish()
+
+    def _seal(self):
+        pending, self._pending = self._pending, None
+        if not pending:
+            return
+
+        transaction = []
+        for layer, before in pending:
+            delta = SpriteDelta(before, layer.sprite)
+            self._remember(layer)
+            if not delta.isEmpty():
+                transaction.append((layer, delta))
+
+        self._push(transaction)
+
+    def _remember(self, layer):
+        self._known[id(layer)] = (layer, layer.sprite, copy(layer.sprite))
+
+    def _sync(self, layers):
+        """Adds the changes of layers since their last known state as a step, except for the layers that are
+        being recorded."""
+        pending = {id(layer) for layer, _ in self._pending or ()}
+        transaction = []
+        for layer in layers:
+            if id(layer) in pending or id(layer) not in self._known:
+                continue
+
+            # versions are unique per change, so only changed sprites are compared pixel by pixel
+            _, sprite, known = self._known[id(layer)]
+            if (layer.sprite.version == known.version and (layer.sprite is sprite or known.version != 0) and
+                    (layer.sprite.x, layer.sprite.y) == (known.x, known.y)):
+                continue
+
+            delta = SpriteDelta(known, layer.sprite)
+            self._remember(layer)
+            if not delta.isEmpty():
+                transaction.append((layer, delta))
+
+        if transaction:
+            self._push(transaction)
+            self._clearRedo()
+
+    def _push(self, transaction):
+        if transaction:
+            self.undo_stack.append(transaction)
+            self.nbytes += self._size(transaction)
+            self._trim()
+
+    @staticmethod
+    def _size(transaction):
+        return sum(delta.nbytes for _, delta in transaction)
+
+    def _trim(self):
+        # the last step is always kept, even if it alone is larger than the budget
+        trimmed = False
+        while self.nbytes > self.max_bytes and len(self.undo_stack) > 1:
+            self.nbytes -= self._size(self.undo_stack.pop(0))
+            trimmed = True
+
+        # layers without steps do not need their last state anymore
+        if trimmed:
+            in_use = {id(layer) for transaction in self.undo_stack + self.redo_stack for layer, _ in transaction}
+            if self._pending:
+                in_use.update(id(layer) for layer, _ in self._pending)
+            self._known = {key: value for key, value in self._known.items() if key in in_use}
+
+    def _clearRedo(self):
+        for transaction in self.redo_stack:
+            self.nbytes -= self._size(transaction)
+        self.redo_stack = []
+
+    def canUndo(self):
+        return bool(self.undo_stack) or bool(self._pending)
+
+    def canRedo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """Undoes the last transaction. Returns the layers that changed."""
+        if self._depth:
+            return []
+
+        self.finish()
+        if not self.undo_stack:
+            return []
+
+        # changes that were not recorded are undone first
+        self._sync([layer for layer, _ in self.undo_stack[-1]])
+
+        transaction = self.undo_stack.pop()
+        for layer, delta in reversed(transaction):
+            delta.undo(layer.sprite)
+            self._remember(layer)
+        self.redo_stack.append(transaction)
+
+        return [layer for layer, _ in transaction]
+
+    def redo(self):
+        """Redoes the last undone transaction. Returns the layers that changed."""
+        if self._depth:
+            return []
+
+        self.finish()
+        if not self.redo_stack:
+            return []
+
+        # a change that was not recorded ends the redo history like any other change
+        self._sync([layer for layer, _ in self.redo_stack[-1]])
+        if not self.redo_stack:
+            return []
+
+        transaction = self.redo_stack.pop()
+        for layer, delta in transaction:
+            delta.redo(layer.sprite)
+            self._remember(layer)
+        self.undo_stack.append(transaction)
+
+        return [layer for layer, _ in transaction]
+
+    def clear(self):
+        self.undo_stack = []
+        self.redo_stack = []
+        self.nbytes = 0
+        self._pending = None
+        self._known = {}
@@ -242,9 +242,10 @@ class PathGenerator:
             if base.image.size == (1, 1):
                 return 'Not all base images loaded!'
 
-            primary_check = (base.checkPrimaryColor() or primary_check)
-            secondary_check = (base.checkSecondaryColor() or secondary_check)
-            tertiary_check = (base.checkTertiaryColor() or tertiary_check)
+            histogram = base.colorHistogram()
+            primary_check = ('1st Remap' in histogram or primary_check)
+            secondary_check = ('2nd Remap' in histogram or secondary_check)
+            tertiary_check = ('3rd Remap' in histogram or tertiary_check)
 
             if self.settings['rotationMode'] == 0:
                 break
@@ -44,6 +44,8 @@ from rctobject import objects as obj
 import widgetsSS
 import widgetsLS
 
+from history import SpriteHistory, HISTORY_MEMORY_MB
+
 
 # Object Tab
 
@@ -222,6 +224,11 @@ class SpriteTab(QWidget):
 
         self.lastpos = (0, 0)
 
+        # active PaintStroke and its layer while the mouse is pressed
+        self.stroke = None
+        self.stroke_layer = None
+        self.stroke_protection = False
+
         # Sprite zoom
         self.zoom_factor = 1
         self.slider_zoom.valueChanged.connect(self.zoomChanged)
@@ -247,8 +254,10 @@ class SpriteTab(QWidget):
             self.layers.setItem(0, 0, layer)
             self.addLayerToCanvas(layer)
 
-        self.protected_pixels = Image.new(
-            '1', (self.canvas_width, self.canvas_height))
+        # protection mask of the active layer in canvas coordinates, see generateProtectionMask
+        self.protected_pixels = np.zeros((self.canvas_height, self.canvas_width), dtype=bool)
+        self.protection_key = None
+        self.airbrush_strength = None
 
         self.lastpath = filepath
         self.saved = False
@@ -487,8 +496,8 @@ class SpriteTab(QWidget):
 
         self.view.updateCanvasSize()
 
-        self.protected_pixels = Image.new(
-            '1', (self.canvas_width, self.canvas_height))
+        self.protected_pixels = np.zeros((self.canvas_height, self.canvas_width), dtype=bool)
+        self.protection_key = None
 
     def setNewCanvasBase(self, x=None, y=None):
         if x:
@@ -574,16 +583,17 @@ class SpriteTab(QWidget):
         current_row = layers.giveActiveRow()
         current_column = layers.giveActiveColumn()
         
-        for row in range(num_rows):
-            for col in range(num_columns):
-                layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
-                layer.addSpriteToHistory()
-                sprite = layer.sprite
-
-                for color in selected_colors:
-                    sprite.remapColor(color, color_remap)
+        with layers.giveHistory().transaction():
+            for row in range(num_rows):
+                for col in range(num_columns):
+                    layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
+                    layer.addSpriteToHistory()
+                    sprite = layer.sprite
+
+                    for color in selected_colors:
+                        sprite.remapColor(color, color_remap)
                     
-                layer.updateLayer()
+                    layer.updateLayer()
 
         if all_views and self.locked:
             self.object_tab.sprites_tab.updateAllViews()
@@ -599,14 +609,15 @@ class SpriteTab(QWidget):
         current_row = layers.giveActiveRow()
         current_column = layers.giveActiveColumn()
         
-        for row in range(num_rows):
-            for col in range(num_columns):
-                layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())        
-                layer.addSpriteToHistory()
-                sprite = layer.sprite
-                sprite.changeBrightnessColor(step, selected_colors)
+        with layers.giveHistory().transaction():
+            for row in range(num_rows):
+                for col in range(num_columns):
+                    layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())        
+                    layer.addSpriteToHistory()
+                    sprite = layer.sprite
+                    sprite.changeBrightnessColor(step, selected_colors)
                     
-                layer.updateLayer()
+                    layer.updateLayer()
 
         if all_views and self.locked:
             self.object_tab.sprites_tab.updateAllViews()
@@ -621,16 +632,17 @@ class SpriteTab(QWidget):
         current_row = layers.giveActiveRow()
         current_column = layers.giveActiveColumn()
         
-        for row in range(num_rows):
-            for col in range(num_columns):
-                layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
+        with layers.giveHistory().transaction():
+            for row in range(num_rows):
+                for col in range(num_columns):
+                    layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
         
         
-                layer.addSpriteToHistory()
-                sprite = layer.sprite
-                sprite.removeColor(selected_colors)
+                    layer.addSpriteToHistory()
+                    sprite = layer.sprite
+                    sprite.removeColor(selected_colors)
                     
-                layer.updateLayer()
+                    layer.updateLayer()
 
         if all_views and self.locked:
             self.object_tab.sprites_tab.updateAllViews()
@@ -645,14 +657,15 @@ class SpriteTab(QWidget):
         current_row = layers.giveActiveRow()
         current_column = layers.giveActiveColumn()
         
-        for row in range(num_rows):
-            for col in range(num_columns):
-                layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
-                layer.addSpriteToHistory()
-                sprite = layer.sprite
-                sprite.invertShadingColor(selected_colors)
+        with layers.giveHistory().transaction():
+            for row in range(num_rows):
+                for col in range(num_columns):
+                    layer = layers.item((row+current_row) % layers.rowCount(), (col+current_column) % layers.columnCount())
+                    layer.addSpriteToHistory()
+                    sprite = layer.sprite
+                    sprite.invertShadingColor(selected_colors)
                     
-                layer.updateLayer()
+                    layer.updateLayer()
 
         if all_views and self.locked:
             self.object_tab.sprites_tab.updateAllViews()
@@ -688,82 +701,64 @@ class SpriteTab(QWidget):
 
         self.updateView()
 
-    def draw(self, x, y, shade):
+    def startStroke(self, source=None):
+        """Starts painting on the active layer. With a source sprite, overdraw paints its pixels."""
+        self.finishStroke()
+
         layer = self.currentActiveLayer()
         sprite = layer.sprite
-        canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
 
         coords = (int(layer.base_x+sprite.x),
                   int(layer.base_y+sprite.y))
 
-        canvas.paste(sprite.image, coords, mask=sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
-
-        brushsize = self.main_window.giveBrushsize()
-        brushshape = self.main_window.giveBrushshape()
-
-        draw = ImageDraw.Draw(canvas)
-        if brushsize != 1:
-            if brushshape == cwdg.BrushShapes.SQUARE:
-                draw.rectangle(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.ROUND:
-                draw.ellipse(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.TILE:
-                x_mod = brushsize % 2
-                y_mod = brushsize % 2
-
-                for i in range(brushsize):
-                    if i < int(brushsize/2):
-                        draw.line([(x+i,  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod - int(i/2)), (x+i,
-                                  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod + int(i/2))], fill=shade, width=1)
-                    else:
-                        draw.line(
-                            [(x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod -
-                              int((brushsize - i - 1) / 2)),
-                             (x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod +
-                              int((brushsize - i - 1) / 2))],
-                            fill=shade, width=1)
-
-        else:
-            draw.point((x, y), shade)
-
-        if self.lastpos != (x, y):
-            x0, y0 = self.lastpos
-            if brushsize % 2 == 0:
-                x_mod = -1 if y > y0 else 0
-                y_mod = -1 if x > x0 else 0
-            else:
-                x_mod = 0
-                y_mod = 0
-
-            if brushshape == cwdg.BrushShapes.TILE:
-                brushsize = int(brushsize/2)
+        self.stroke = PaintStroke(sprite, coords[0], coords[1], self.canvas_width, self.canvas_height,
+                                  self.protected_pixels, source, self.airbrush_strength)
+        self.stroke_layer = layer
+        layer.startStroke(self.stroke)
 
-            draw.line([(int(x0+brushsize/2)+x_mod, int(y0+brushsize/2)+y_mod), (int(
-                x+brushsize/2)+x_mod, int(y+brushsize/2)+y_mod)], fill=shade, width=brushsize)
+        # whether the cached protection mask belongs to the layer and can be updated when the stroke ends
+        self.stroke_protection = (self.protection_key is not None and
+                                  self.protection_key == self.protectionKey(layer, self.protection_key[-1]))
 
-            self.lastpos = (x, y)
-
-        canvas.paste(canvas_protect, mask=self.protected_pixels)
+    def finishStroke(self):
+        """Crops the painted buffer and writes it back into the sprite of the layer."""
+        if self.stroke is None:
+            return
 
-        bbox = canvas.getbbox()
+        stroke, layer = self.stroke, self.stroke_layer
+        self.stroke = None
+        self.stroke_layer = None
 
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -layer.base_x + bbox[0]
-            y_offset = -layer.base_y + bbox[1]
+        result = stroke.result()
+        if result:
+            image, x, y = result
+            x_offset = -layer.base_x + x
+            y_offset = -layer.base_y + y
         else:
+            image = Image.new('RGBA', (1, 1))
             x_offset = 0
             y_offset = 0
 
-        sprite.image = canvas
+        layer.sprite.image = image
         layer.setSpriteOffset(x_offset, y_offset)
+        layer.updateLayer()
 
-        self.updateView()
+        if self.stroke_protection and stroke.dirty:
+            self.updateProtectionMask(stroke, layer)
+
+        self.layerUpdated.emit()
+
+    def draw(self, x, y, shade):
+        if self.stroke is None:
+            self.startStroke()
+
+        color = tuple(shade) if len(shade) == 4 else (*shade, 255)
+        rect = self.stroke.dab(x, y, self.lastpos, self.main_window.giveBrushsize(),
+                               self.main_window.giveBrushshape(), color)
+        self.lastpos = (x, y)
+
+        if rect:
+            self.stroke_layer.updateStroke(self.stroke, rect)
 
     def erase(self, x, y):
         self.draw(x, y, (0, 0, 0, 0))
@@ -785,139 +780,65 @@ class SpriteTab(QWidget):
             indices[0], indices[1])
 
     def overdraw(self, x, y):
-        working_sprite = self.working_sprite
-        layer = self.currentActiveLayer()
-        sprite = layer.sprite
-        canvas_mask = Image.new(
-            '1', (self.canvas_width, self.canvas_height), color=1)
-        canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
-
-        coords = (int(layer.base_x+sprite.x),
-                  int(layer.base_y+sprite.y))
-
-        canvas.paste(working_sprite.image, coords, mask=working_sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
-
-        brushsize = self.main_window.giveBrushsize()
-
-        brushshape = self.main_window.giveBrushshape()
-
-        draw = ImageDraw.Draw(canvas_mask)
-        shade = 0
-        if brushsize != 1:
-            if brushshape == cwdg.BrushShapes.SQUARE:
-                draw.rectangle(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.ROUND:
-                draw.ellipse(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.TILE:
-                x_mod = brushsize % 2
-                y_mod = brushsize % 2
-
-                for i in range(brushsize):
-                    if i < int(brushsize/2):
-                        draw.line([(x+i,  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod - int(i/2)), (x+i,
-                                  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod + int(i/2))], fill=shade, width=1)
-                    else:
-                        draw.line(
-                            [(x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod -
-                              int((brushsize - i - 1) / 2)),
-                             (x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod +
-                              int((brushsize - i - 1) / 2))],
-                            fill=shade, width=1)
-
-        else:
-            draw.point((x, y), shade)
-
-        if self.lastpos != (x, y):
-            x0, y0 = self.lastpos
-            if brushsize % 2 == 0:
-                x_mod = -1 if y > y0 else 0
-                y_mod = -1 if x > x0 else 0
-            else:
-                x_mod = 0
-                y_mod = 0
-
-            if brushshape == cwdg.BrushShapes.TILE:
-                brushsize = int(brushsize/2)
-
-            draw.line([(int(x0+brushsize/2)+x_mod, int(y0+brushsize/2)+y_mod), (int(
-                x+brushsize/2)+x_mod, int(y+brushsize/2)+y_mod)], fill=shade, width=brushsize)
+        if self.stroke is None:
+            self.startStroke(self.working_sprite)
 
-            self.lastpos = (x, y)
+        rect = self.stroke.dab(x, y, self.lastpos, self.main_window.giveBrushsize(),
+                               self.main_window.giveBrushshape())
+        self.lastpos = (x, y)
 
-        canvas_mask.paste(self.protected_pixels, mask=self.protected_pixels)
-
-        canvas.paste(canvas_protect, mask=canvas_mask)
-
-        bbox = canvas.getbbox()
-
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -layer.base_x + bbox[0]
-            y_offset = -layer.base_y + bbox[1]
-        else:
-            x_offset = 0
-            y_offset = 0
-
-        sprite.image = canvas
-        layer.setSpriteOffset(x_offset, y_offset)
-
-        self.updateView()
+        if rect:
+            self.stroke_layer.updateStroke(self.stroke, rect)
 
     def fill(self, x, y, shade):
-        layer = self.currentActiveLayer()
-        sprite = layer.sprite
-        canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
+        self.startStroke()
+        self.stroke.fill(x, y, (shade[0], shade[1], shade[2], 255))
+        self.finishStroke()
 
+    def protectionKey(self, layer, colors):
+        sprite = layer.sprite
         coords = (int(layer.base_x+sprite.x),
                   int(layer.base_y+sprite.y))
 
-        canvas.paste(sprite.image, coords, mask=sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
+        return (sprite.version, sprite.palette.name, coords, self.canvas_width, self.canvas_height, tuple(colors))
 
-        ImageDraw.floodfill(
-            canvas, (x, y), (shade[0], shade[1], shade[2], 255))
+    def generateProtectionMask(self):
+        layer = self.currentActiveLayer()
+        sprite = layer.sprite
+        colors = self.main_window.tool_widget.color_select_panel.notSelectedColors()
 
-        canvas.paste(canvas_protect, mask=self.protected_pixels)
+        # the mask only depends on the layer image, its position and the protected colors
+        key = self.protectionKey(layer, colors)
+        if key != self.protection_key:
+            mask = Image.new('1', (self.canvas_width, self.canvas_height))
+            mask.paste(sprite.giveProtectedPixelMask(colors), key[2])
 
-        bbox = canvas.getbbox()
+            self.protected_pixels = np.array(mask)
+            self.protection_key = key
 
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -layer.base_x + bbox[0]
-            y_offset = -layer.base_y + bbox[1]
+        # the airbrush noise is drawn per brush stamp by the stroke
+        if self.main_window.giveBrush() == cwdg.Brushes.AIRBRUSH:
+            self.airbrush_strength = self.main_window.giveAirbrushStrength()
         else:
-            x_offset = 0
-            y_offset = 0
+            self.airbrush_strength = None
 
-        sprite.image = canvas
-        layer.setSpriteOffset(x_offset, y_offset)
-
-        self.updateView()
-
-    def generateProtectionMask(self):
-        layer = self.currentActiveLayer()
+    def updateProtectionMask(self, stroke, layer):
+        """Recomputes the protection mask in the painted part of a finished stroke, so that the next stroke
+        on the layer does not have to rebuild it."""
+        left, top, right, bottom = stroke.dirty
         sprite = layer.sprite
+        colors = self.protection_key[-1]
+        region = stroke.canvas[top:bottom, left:right]
 
-        coords = (int(layer.base_x+sprite.x),
-                  int(layer.base_y+sprite.y))
-        
-        self.protected_pixels = Image.new(
-            '1', (self.canvas_width, self.canvas_height))
-        self.protected_pixels.paste(sprite.giveProtectedPixelMask(
-            self.main_window.tool_widget.color_select_panel.notSelectedColors()), coords)
+        # same lookup as Sprite.giveProtectedPixelMask on the written back sprite
+        if sprite.isIndexed():
+            indices, _ = sprite.palette.lookupIndices(region)
+            protected = spr.protectedIndexLut(colors, sprite.palette)[indices]
+        else:
+            protected = np.asarray(spr.protectColorMask(Image.fromarray(region), colors, sprite.palette))
 
-        if self.main_window.giveBrush() == cwdg.Brushes.AIRBRUSH:
-            strength = self.main_window.giveAirbrushStrength()
-            noise_mask = Image.fromarray(np.random.choice(a=[True, False], size=(
-                self.canvas_width, self.canvas_height), p=[1-strength, strength]).T)
-            self.protected_pixels.paste(noise_mask, mask=noise_mask)
+        self.protected_pixels[top:bottom, left:right] = protected
+        self.protection_key = self.protectionKey(layer, colors)
 
     def updateView(self, emit_signal=True):
         if self.currentActiveLayer() is not None:
@@ -1118,14 +1039,20 @@ class SpriteTab(QWidget):
         self.object_tab.addSpriteToHistoryAllViews()
 
     def undo(self):
-        layer = self.currentActiveLayer()
-        layer.undo()
-
-        self.updateView()
+        self.finishStroke()
+        self.updateUndoneLayers(self.giveLayers().giveHistory().undo())
 
     def redo(self):
-        layer = self.currentActiveLayer()
-        layer.redo()
+        self.finishStroke()
+        self.updateUndoneLayers(self.giveLayers().giveHistory().redo())
+
+    def updateUndoneLayers(self, layers):
+        for layer in layers:
+            layer.updateLayer()
+
+        # a transaction can span other layers and views of the object
+        if self.locked and any(layer is not self.currentActiveLayer() for layer in layers):
+            self.object_tab.sprites_tab.updateAllViews()
 
         self.updateView()
 
@@ -1172,6 +1099,7 @@ class SpriteTab(QWidget):
                             transparent_color=self.main_window.current_import_color,
                             selected_colors=selected_colors,
                             alpha_threshold=0,
+                            dither=self.main_window.current_import_dither,
                             offset=(0, offset_y),
                             auto_offset_mode=self.main_window.current_import_offset_mode),
                         self.main_window, self.base_x, self.base_y, 0, 0, f'Layer {self.layercount}')
@@ -1381,6 +1309,7 @@ class SpriteViewWidget(QGraphicsView):
         x = round(screen_pos.x())
         y = round(screen_pos.y())
 
+        self.tab.finishStroke()
         self.tab.lastpos = (x, y)
 
         if event.button() == QtCore.Qt.LeftButton:
@@ -1586,6 +1515,8 @@ class SpriteViewWidget(QGraphicsView):
 
     def mouseReleaseEvent(self, event):
         modifiers = QApplication.keyboardModifiers()
+
+        self.tab.finishStroke()
         
         if event.button() == QtCore.Qt.LeftButton:
             if self.space_pressed:
@@ -1600,6 +1531,148 @@ class SpriteViewWidget(QGraphicsView):
             self.mouse_pressed = False
         super().mouseReleaseEvent(event)
 
+# Painting
+
+
+def drawBrush(draw, x, y, lastpos, brushsize, brushshape, fill):
+    """Draws the brush at (x, y) and the line from lastpos to it."""
+    if brushsize != 1:
+        if brushshape == cwdg.BrushShapes.SQUARE:
+            draw.rectangle(
+                [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=fill)
+        elif brushshape == cwdg.BrushShapes.ROUND:
+            draw.ellipse(
+                [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=fill)
+        elif brushshape == cwdg.BrushShapes.TILE:
+            x_mod = brushsize % 2
+            y_mod = brushsize % 2
+
+            for i in range(brushsize):
+                if i < int(brushsize/2):
+                    draw.line([(x+i,  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod - int(i/2)), (x+i,
+                              y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod + int(i/2))], fill=fill, width=1)
+                else:
+                    draw.line(
+                        [(x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod -
+                          int((brushsize - i - 1) / 2)),
+                         (x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod +
+                          int((brushsize - i - 1) / 2))],
+                        fill=fill, width=1)
+
+    else:
+        draw.point((x, y), fill)
+
+    if lastpos != (x, y):
+        x0, y0 = lastpos
+        if brushsize % 2 == 0:
+            x_mod = -1 if y > y0 else 0
+            y_mod = -1 if x > x0 else 0
+        else:
+            x_mod = 0
+            y_mod = 0
+
+        if brushshape == cwdg.BrushShapes.TILE:
+            brushsize = int(brushsize/2)
+
+        draw.line([(int(x0+brushsize/2)+x_mod, int(y0+brushsize/2)+y_mod), (int(
+            x+brushsize/2)+x_mod, int(y+brushsize/2)+y_mod)], fill=fill, width=brushsize)
+
+
+class PaintStroke:
+    """Canvas sized RGBA buffer of a sprite during a stroke. Brush dabs only touch the pixels of their
+    dirty rectangle, the sprite is cropped from the buffer once when the stroke is finished."""
+
+    def __init__(self, sprite, x, y, width, height, protected, source=None, airbrush_strength=None):
+        self.width = width
+        self.height = height
+
+        self.canvas = self._paste(sprite, x, y)
+        self.protected = protected
+        # pixels that are painted by overdraw, e.g. a remapped copy of the sprite
+        self.source = self._paste(source, x, y) if source else None
+        # probability that a pixel under the brush is painted
+        self.airbrush_strength = airbrush_strength
+
+        # union of all dirty rectangles of the stroke
+        self.dirty = None
+
+    def _paste(self, sprite, x, y):
+        canvas = Image.new('RGBA', (self.width, self.height))
+        canvas.paste(sprite.image, (x, y), mask=sprite.image)
+
+        return np.array(canvas)
+
+    def dab(self, x, y, lastpos, brushsize, brushshape, color=None):
+        """Paints the brush at (x, y) and the line from lastpos with color, or with the source pixels if color
+        is None. Returns the dirty rectangle (left, top, right, bottom), None if nothing is in the canvas."""
+        x0, y0 = lastpos
+        left = max(min(x, x0) - brushsize - 2, 0)
+        top = max(min(y, y0) - brushsize - 2, 0)
+        right = min(max(x, x0) + 2*brushsize + 2, self.width)
+        bottom = min(max(y, y0) + 2*brushsize + 2, self.height)
+
+        if left >= right or top >= bottom:
+            return None
+
+        mask = Image.new('1', (right-left, bottom-top))
+        drawBrush(ImageDraw.Draw(mask), x-left, y-top, (x0-left, y0-top), brushsize, brushshape, 1)
+        painted = np.array(mask) & ~self.protected[top:bottom, left:right]
+        if self.airbrush_strength is not None:
+            painted &= np.random.random(painted.shape) < self.airbrush_strength
+
+        view = self.canvas[top:bottom, left:right]
+        if color is None:
+            view[painted] = self.source[top:bottom, left:right][painted]
+        else:
+            view[painted] = color
+
+        return self._addDirty((left, top, right, bottom))
+
+    def fill(self, x, y, color):
+        """Flood fills from (x, y). Returns the dirty rectangle, None if nothing changed."""
+        image = Image.fromarray(self.canvas).copy()
+        ImageDraw.floodfill(image, (x, y), color)
+
+        filled = np.array(image)
+        changed = (filled != self.canvas).any(axis=2) & ~self.protected
+        if self.airbrush_strength is not None:
+            changed &= np.random.random(changed.shape) < self.airbrush_strength
+        if not changed.any():
+            return None
+
+        self.canvas[changed] = filled[changed]
+
+        rows = np.flatnonzero(changed.any(axis=1))
+        columns = np.flatnonzero(changed.any(axis=0))
+
+        return self._addDirty((int(columns[0]), int(rows[0]), int(columns[-1])+1, int(rows[-1])+1))
+
+    def _addDirty(self, rect):
+        if self.dirty is None:
+            self.dirty = rect
+        else:
+            self.dirty = (min(self.dirty[0], rect[0]), min(self.dirty[1], rect[1]),
+                          max(self.dirty[2], rect[2]), max(self.dirty[3], rect[3]))
+
+        return rect
+
+    def image(self, rect=None):
+        if rect is None:
+            return Image.fromarray(self.canvas)
+
+        left, top, right, bottom = rect
+        return Image.fromarray(self.canvas[top:bottom, left:right])
+
+    def result(self):
+        """Returns the cropped image and its position in the canvas, None if the buffer is empty."""
+        image = Image.fromarray(self.canvas)
+        bbox = image.getbbox()
+        if not bbox:
+            return None
+
+        return image.crop(bbox), bbox[0], bbox[1]
+
+
 # Layers
 
 
@@ -1620,8 +1693,6 @@ class SpriteLayer(QtGui.QStandardItem):
         self.item.setVisible(visible)
 
         self.sprite = sprite
-        self.history = []
-        self.history_redo = []
 
         self.setFlags(self.flags() | QtCore.Qt.ItemIsUserCheckable |
                       QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsEditable)
@@ -1676,42 +1747,15 @@ class SpriteLayer(QtGui.QStandardItem):
         self.visible = val
         self.item.setVisible(val)
 
-    def addSpriteToHistory(self):
-        sprite = copy(self.sprite)
-
-        if len(self.history) == self.main_window.settings['history_maximum']:
-            self.history.pop(0)
-
-        self.history.append(sprite)
-        self.history_redo = []
-
-    def undo(self):
-        if len(self.history) == 0:
-            return
-
-        sprite_new = self.history.pop(-1)
-
-        self.history_redo.append(copy(self.sprite))
-
-        self.sprite.image = sprite_new.image
-        self.sprite.x = sprite_new.x
-        self.sprite.y = sprite_new.y
-
-        self.updateLayer()
-
-    def redo(self):
-        if len(self.history_redo) == 0:
-            return
-
-        sprite_new = self.history_redo.pop(-1)
-
-        self.history.append(copy(self.sprite))
-
-        self.sprite.image = sprite_new.image
-        self.sprite.x = sprite_new.x
-        self.sprite.y = sprite_new.y
+    def giveHistory(self):
+        """Undo history of the layer model, None for layers that are not in a SpriteLayerModel."""
+        model = self.model()
+        return model.giveHistory() if isinstance(model, SpriteLayerModel) else None
 
-        self.updateLayer()
+    def addSpriteToHistory(self):
+        history = self.giveHistory()
+        if history is not None:
+            history.record(self)
 
     def setSprite(self, sprite):
         if sprite:
@@ -1729,6 +1773,15 @@ class SpriteLayer(QtGui.QStandardItem):
 
         self.updateOffset()
         self.updateLayer()
+
+    def mergeAll(self, layers):
+        self.addSpriteToHistory()
+
+        self.sprite.mergeAll([layer.sprite for layer in layers],
+                             [(layer.base_x-self.base_x, layer.base_y-self.base_y) for layer in layers])
+
+        self.updateOffset()
+        self.updateLayer()
         
     def mask(self, layer):
         self.addSpriteToHistory()
@@ -1741,6 +1794,21 @@ class SpriteLayer(QtGui.QStandardItem):
         self.updateOffset()
         self.updateLayer()
 
+    def startStroke(self, stroke):
+        # while painting, the item shows the whole canvas buffer of the stroke
+        self.stroke_pixmap = QtGui.QPixmap.fromImage(ImageQt(stroke.image()))
+        self.item.setOffset(0, 0)
+        self.item.setPixmap(self.stroke_pixmap)
+
+    def updateStroke(self, stroke, rect):
+        painter = QtGui.QPainter(self.stroke_pixmap)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        painter.drawImage(rect[0], rect[1], ImageQt(stroke.image(rect)))
+        painter.end()
+
+        self.item.setOffset(0, 0)
+        self.item.setPixmap(self.stroke_pixmap)
+
     def setSpriteOffset(self, x, y):
         self.sprite.x = x
         self.sprite.y = y
@@ -1779,12 +1847,18 @@ class SpriteLayer(QtGui.QStandardItem):
 
         self.item.setPixmap(pixmap)
 
+        # the layer is redrawn when an operation on it has ended
+        history = self.giveHistory()
+        if history is not None:
+            history.finish(self)
+
 
 class SpriteLayerModel(QtGui.QStandardItemModel):
     activeRowChanged = QtCore.pyqtSignal(int)
     
     def __init__(self, rows, columns, orders=None, parent=None):
         super().__init__(rows, columns, parent)
+        self.sprite_history = SpriteHistory()
         self.active_column = 0  # Active column in the fixed model
         self.active_row = 0     # Active row in the fixed model
         # List of orders for the columns, Default: Reversed Identity. It maps the rows of the proxy model to the rows of the original model for each column. Rows in the proxy model are inversed, i.e. the last row in the proxy model is the first row in the original model (when there is the identity).
@@ -1893,6 +1967,9 @@ class SpriteLayerModel(QtGui.QStandardItemModel):
     def setActiveColumn(self, column):
         self.active_column = column
         
+    def giveHistory(self):
+        return self.sprite_history
+
     def giveActiveRow(self):
         return self.active_row
     
@@ -2360,8 +2437,8 @@ class ChangeSettingsUi(QDialog):
             settings.get('import_color', (0, 0, 0))[2])
 
         self.comboBox_palette.setCurrentIndex(settings.get('palette', 0))
-        self.spinBox_history_maximum.setValue(
-            settings.get('history_maximum', 5))
+        self.spinBox_history_memory.setValue(
+            settings.get('history_memory', HISTORY_MEMORY_MB))
 
         self.comboBox_background_color.setCurrentIndex(
             settings.get('background_color', 0))
@@ -2374,6 +2451,8 @@ class ChangeSettingsUi(QDialog):
 
         self.comboBox_import_offset_mode.setCurrentIndex(
             settings.get('import_offset_mode', 0))
+        self.comboBox_import_dither.setCurrentIndex(
+            settings.get('import_dither', 0))
 
     def loadSSSettings(self, settings):
         for flag in cts.Jsmall_flags:
@@ -2461,8 +2540,9 @@ class ChangeSettingsUi(QDialog):
         settings['background_color_custom'] = (self.spinBox_R_background.value(
         ), self.spinBox_G_background.value(), self.spinBox_B_background.value())
         settings['palette'] = self.comboBox_palette.currentIndex()
-        settings['history_maximum'] = self.spinBox_history_maximum.value()
+        settings['history_memory'] = self.spinBox_history_memory.value()
         settings['import_offset_mode'] = self.comboBox_import_offset_mode.currentIndex()
+        settings['import_dither'] = self.comboBox_import_dither.currentIndex()
 
         ss_defaults = {}
         for flag in cts.Jsmall_flags:
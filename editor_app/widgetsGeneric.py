@@ -106,18 +106,13 @@ class SettingsTabAll(QWidget):
 
     def save(self):
         if self.checkBox_remapCheck.isChecked():
-            for path, sprite in self.o.sprites.items():
-                if sprite.checkPrimaryColor():
-                    self.o['properties']['hasPrimaryColour'] = True
-                    break
-            for path, sprite in self.o.sprites.items():
-                if sprite.checkSecondaryColor():
-                    self.o['properties']['hasSecondaryColour'] = True
-                    break
-            for path, sprite in self.o.sprites.items():
-                if sprite.checkTertiaryColor():
-                    self.o['properties']['hasTertiaryColour'] = True
-                    break
+            usage = self.o.colorUsage()
+            if '1st Remap' in usage:
+                self.o['properties']['hasPrimaryColour'] = True
+            if '2nd Remap' in usage:
+                self.o['properties']['hasSecondaryColour'] = True
+            if '3rd Remap' in usage:
+                self.o['properties']['hasTertiaryColour'] = True
 
     def tabChanged(self, index):
         if index == 0:
@@ -305,6 +300,7 @@ class SpritesTabAll(QWidget):
                             transparent_color=self.main_window.current_import_color,
                             selected_colors=selected_colors,
                             alpha_threshold=0,
+                            dither=self.main_window.current_import_dither,
                             offset=(0, offset_y),
                             auto_offset_mode=self.main_window.current_import_offset_mode)
 
@@ -481,8 +477,12 @@ class SpritesTabAll(QWidget):
     
     def addSpriteToHistoryAllViews(self, row):        
         original_row = self.layers.originalRow(row)
-        for rot in range(4):
-            self.layers.item(original_row, rot).addSpriteToHistory()
+        layers = [self.layers.item(original_row, rot) for rot in range(4)]
+
+        # the four views are undone together
+        history = layers[0].giveHistory()
+        if history is not None:
+            history.record(*layers)
             
     def colorRemapToAll(self, row, color_remap, selected_colors):
         self.addSpriteToHistoryAllViews(row)
@@ -542,12 +542,11 @@ class SpritesTabAll(QWidget):
                 if layers_incoming.rowCount() == 0:
                     return
 
-                layer_top = wdg.SpriteLayer.fromLayer(layers_incoming.item(0))
-                for i in range(layers_incoming.rowCount()-1):
-                    layer_bottom = wdg.SpriteLayer.fromLayer(
-                        layers_incoming.item(i+1))
-                    layer_bottom.merge(layer_top)
-                    layer_top = layer_bottom
+                # the last layer is the bottom one, the others are pasted on it from bottom to top
+                layer_top = wdg.SpriteLayer.fromLayer(
+                    layers_incoming.item(layers_incoming.rowCount()-1))
+                layer_top.mergeAll([layers_incoming.item(i)
+                                    for i in reversed(range(layers_incoming.rowCount()-1))])
 
                 target_layer = self.layers.item(target_row)
                 target_layer.sprite.setFromSprite(layer_top.sprite)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Benchmark cases of the hot paths of rctobject. Each case is registered with benchmark.case under its name as a
+factory(folder), which returns the function to time or (function, setup).
+
+Run as: python -m rctobject benchmark run ...
+"""
+
+from functools import partial
+from os.path import join
+
+import rctobject.datloader as dat
+import rctobject.objects as obj
+import rctobject.palette as pal
+import rctobject.sprites as spr
+from rctobject.benchmark import case
+
+from fixtures import (RENDER_SIZE, FIXTURE_REMAPS, synthetic_indices, synthetic_sprite, synthetic_render,
+                      synthetic_lgx, synthetic_dat, small_scenery, large_scenery)
+
+
+def _invalidate(sprites):
+    for sprite in sprites:
+        sprite.invalidateCache()
+
+
+@case('datloader.rle_decode')
+def bench_rle_decode(folder):
+    chunk = synthetic_dat()[16:]
+    return partial(dat.rle_decode, chunk)
+
+
+@case('datloader.read_image_table')
+def bench_read_image_table(folder):
+    return partial(dat.read_image_table, synthetic_lgx(), 0)
+
+
+@case('datloader.read_image_table.lazy')
+def bench_read_image_table_lazy(folder):
+    return partial(dat.read_image_table, synthetic_lgx(), 0, True)
+
+
+@case('datloader.loadDatObject')
+def bench_load_dat(folder):
+    path = join(folder, 'BENCHMRK.DAT')
+    with open(path, 'wb') as file:
+        file.write(synthetic_dat())
+
+    return partial(dat.loadDatObject, path)
+
+
+def bench_add_palette(dither, folder):
+    image = synthetic_render().convert('RGBA')
+    return partial(pal.addPalette, image, dither=dither)
+
+
+for _dither in ('floyd-steinberg', 'ordered', 'none'):
+    case(f'palette.addPalette.{_dither}')(partial(bench_add_palette, _dither))
+
+
+# color operations of sprites.py on an RGBA image of RENDER_SIZE, as the editor applies them
+_COLOR_OPERATIONS = {
+    'remapColor': lambda image: spr.remapColor(image, '1st Remap', '2nd Remap'),
+    'colorRemaps': lambda image: spr.colorRemaps(image, *FIXTURE_REMAPS),
+    'colorFirstRemap': lambda image: spr.colorFirstRemap(image, FIXTURE_REMAPS[0]),
+    'colorSecondRemap': lambda image: spr.colorSecondRemap(image, FIXTURE_REMAPS[1]),
+    'colorThirdRemap': lambda image: spr.colorThirdRemap(image, FIXTURE_REMAPS[2]),
+    'colorAllInRemap': lambda image: spr.colorAllInRemap(image, FIXTURE_REMAPS[0]),
+    'changeBrightness': lambda image: spr.changeBrightness(image, 2),
+    'changeBrightnessColor': lambda image: spr.changeBrightnessColor(image, 2, ['Grey', '1st Remap']),
+    'invertShadingColor': lambda image: spr.invertShadingColor(image, ['Grey', '1st Remap']),
+    'removeColor': lambda image: spr.removeColor(image, ['Grey', '1st Remap']),
+    'protectColorMask': lambda image: spr.protectColorMask(image, ['Grey', '1st Remap']),
+    'checkColors': lambda image: (spr.checkPrimaryColor(image), spr.checkSecondaryColor(image),
+                                  spr.checkTertiaryColor(image)),
+}
+
+
+def bench_color_operation(operation, folder):
+    image = pal.orct.fromIndices(synthetic_indices(*RENDER_SIZE))
+    return partial(operation, image)
+
+
+for _name, _operation in _COLOR_OPERATIONS.items():
+    case(f'sprites.{_name}')(partial(bench_color_operation, _operation))
+
+
+def bench_sprite_show(indexed, folder):
+    sprite = synthetic_sprite(*RENDER_SIZE, indexed=indexed)
+    return partial(sprite.show, *FIXTURE_REMAPS), sprite.invalidateCache
+
+
+case('sprites.Sprite.show.indexed')(partial(bench_sprite_show, True))
+case('sprites.Sprite.show.rgba')(partial(bench_sprite_show, False))
+
+
+@case('sprites.Sprite.colorHistogram')
+def bench_color_histogram(folder):
+    sprite = synthetic_sprite(*RENDER_SIZE)
+
+    def setup():
+        sprite._histogram = None
+
+    return sprite.colorHistogram, setup
+
+
+def bench_small_show(subtype, folder):
+    o = small_scenery(subtype)
+    return o.show, partial(_invalidate, o.sprites.values())
+
+
+for _subtype in ('simple', 'glass', 'gardens', 'animated', 'fountain1', 'fountain4'):
+    case(f'objects.SmallScenery.show.{_subtype}')(partial(bench_small_show, _subtype))
+
+
+def bench_large_show(num_tiles, folder):
+    o = large_scenery(num_tiles)
+
+    def setup():
+        o._show_cache = {}
+        _invalidate(o.sprites.values())
+
+    return o.show, setup
+
+
+def bench_project_image(num_tiles, folder):
+    o = large_scenery(num_tiles)
+    image = pal.orct.fromIndices(synthetic_indices(*o.spriteBoundingBox()))
+    return partial(o.projectImageToTiles, image, 0, already_palettized=True)
+
+
+for _num_tiles in (1, 16, 64):
+    case(f'objects.LargeScenery.show.{_num_tiles}')(partial(bench_large_show, _num_tiles))
+    case(f'objects.LargeScenery.projectImageToTiles.{_num_tiles}')(partial(bench_project_image, _num_tiles))
+
+
+def bench_save(make, folder):
+    o = make()
+    return partial(o.save, folder)
+
+
+def bench_load(make, folder):
+    o = make()
+    o.save(folder)
+    return partial(obj.load, join(folder, f'{o.data["id"]}.parkobj'))
+
+
+for _name, _make in (('small', small_scenery), ('large', partial(large_scenery, 16))):
+    case(f'objects.save.{_name}')(partial(bench_save, _make))
+    case(f'objects.load.{_name}')(partial(bench_load, _make))
+
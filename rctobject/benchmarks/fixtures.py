@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Synthetic fixtures of the benchmarks, generated from a fixed seed: sprites drawn in the object palette, DAT files
+and LGX image tables built with the encoders below, and .parkobj files written by the objects themselves. So no
+game files are needed and every run measures the same inputs.
+"""
+
+from functools import lru_cache
+from os import makedirs
+from os.path import join
+from struct import pack
+import copy
+
+import numpy as np
+from PIL import Image
+
+import rctobject.constants as cts
+import rctobject.datloader as dat
+import rctobject.objects as obj
+import rctobject.palette as pal
+import rctobject.sprites as spr
+
+SEED = 0
+SPRITE_SIZE = (64, 96)
+RENDER_SIZE = (256, 256)
+FIXTURE_COLORS = ('Grey', '1st Remap', '2nd Remap', '3rd Remap', 'Grass Green', 'Brown')
+FIXTURE_IMAGES = 64
+FIXTURE_REMAPS = ('Bright Red', 'Light Blue', 'Yellow')
+
+
+def synthetic_indices(width: int, height: int, seed: int = SEED, colors: tuple = FIXTURE_COLORS):
+    """Palette indices of a sprite: a shaded ellipse with bands of the given colors on transparent ground."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    inside = ((x - width/2 + 0.5) / (width/2))**2 + ((y - height/2 + 0.5) / (height/2))**2 <= 1
+
+    rows = np.array([pal.allColors()[color] for color in colors])
+    band = rows[(y * len(colors) // height + (x > width // 2)) % len(colors)]
+    shade = np.clip(x * 12 // width + rng.integers(-1, 2, (height, width)), 0, 11)
+
+    indices = (1 + 12*band + shade).astype(np.uint8)
+    indices[~inside] = pal.TRANSPARENT_INDEX
+
+    return indices
+
+
+def synthetic_sprite(width: int = SPRITE_SIZE[0], height: int = SPRITE_SIZE[1], seed: int = SEED,
+                     indexed: bool = True):
+    """Sprite of synthetic_indices, stored as index array or as RGBA image."""
+    image = pal.orct.fromIndices(synthetic_indices(width, height, seed))
+    return spr.Sprite(image, (-width//2, -height), already_palettized=True, indexed=indexed)
+
+
+def synthetic_render(width: int = RENDER_SIZE[0], height: int = RENDER_SIZE[1], seed: int = SEED):
+    """RGB image like a rendered sprite: smooth gradients with noise on a black background."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    rgb = np.stack((np.sin(6*x + 2*y), np.cos(4*y - 3*x), np.sin(5*x*y + 1)), axis=-1)*100 + 128
+    rgb += rng.normal(0, 8, rgb.shape)
+
+    inside = (x - 0.5)**2 + (y - 0.5)**2 <= 0.2
+    rgb[~inside] = 0
+
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), 'RGB')
+
+
+def rle_encode(data: bytes):
+    """Encodes a DAT chunk with the run-length encoding that rle_decode reads: runs of 3 to 129 equal bytes and
+    literal blocks of up to 128 bytes."""
+    output = bytearray()
+    literal_start = 0
+    i = 0
+    length = len(data)
+
+    while i < length:
+        run_end = i + 1
+        while run_end < length and run_end - i < 129 and data[run_end] == data[i]:
+            run_end += 1
+
+        if run_end - i >= 3:
+            for start in range(literal_start, i, 128):
+                block = data[start:min(start+128, i)]
+                output.append(len(block) - 1)
+                output += block
+
+            output.append(~(run_end - i - 2) & 0xFF)
+            output.append(data[i])
+            i = literal_start = run_end
+        else:
+            i = run_end
+
+    for start in range(literal_start, length, 128):
+        block = data[start:min(start+128, length)]
+        output.append(len(block) - 1)
+        output += block
+
+    return bytes([1]) + pack('<L', len(output)) + bytes(output)
+
+
+def encode_rle_bitmap(pixels: np.ndarray):
+    """Encodes an array of game palette indices as a bitmap with run-length encoded rows. Rows are split into
+    segments of visible pixels, which is what decode_rle_bitmap reads. The width has to be below 256."""
+    height = pixels.shape[0]
+    rows = []
+
+    for row in pixels:
+        visible = np.flatnonzero(row)
+        segments = []
+        if len(visible):
+            starts = visible[np.r_[True, np.diff(visible) > 1]]
+            ends = visible[np.r_[np.diff(visible) > 1, True]] + 1
+            for start, end in zip(starts, ends):
+                for x in range(int(start), int(end), 127):
+                    segments.append((x, row[x:min(x+127, end)]))
+        else:
+            segments.append((0, row[:0]))
+
+        encoded = bytearray()
+        for i, (x, segment) in enumerate(segments):
+            last = 0x80 if i == len(segments) - 1 else 0
+            encoded += bytes((len(segment) | last, x)) + segment.tobytes()
+        rows.append(bytes(encoded))
+
+    offsets = np.cumsum([2*height] + [len(row) for row in rows[:-1]]).astype('<u2')
+
+    return offsets.tobytes() + b''.join(rows)
+
+
+@lru_cache(maxsize=None)
+def game_index_table():
+    """Game palette index of every index of the object palette, see datloader.import_palette_table."""
+    indices, found = pal.orct.lookupIndices(dat.import_palette_table[None])
+    table = np.zeros(256, dtype=np.uint8)
+    table[indices[found]] = np.flatnonzero(found[0])
+
+    return table
+
+
+def image_table(sprites: list):
+    """Image table in the format of DAT files and .lgx files with RLE bitmaps of the given sprites."""
+    bitmaps = []
+    entries = []
+    offset = 0
+
+    for sprite in sprites:
+        indices, _ = sprite.palette.toIndices(sprite.image)
+        bitmap = encode_rle_bitmap(game_index_table()[indices])
+        entries.append(pack('<L4hH2x', offset, indices.shape[1], indices.shape[0], sprite.x, sprite.y, 0x5))
+        bitmaps.append(bitmap)
+        offset += len(bitmap)
+
+    return pack('<LL', len(sprites), offset) + b''.join(entries) + b''.join(bitmaps)
+
+
+@lru_cache(maxsize=None)
+def synthetic_lgx(num_images: int = FIXTURE_IMAGES):
+    """Bytes of an .lgx file with num_images synthetic sprites."""
+    return image_table([synthetic_sprite(seed=SEED+i) for i in range(num_images)])
+
+
+@lru_cache(maxsize=None)
+def synthetic_dat(num_images: int = FIXTURE_IMAGES):
+    """Bytes of a small scenery DAT file with num_images synthetic sprites."""
+    header = bytearray(0x1C)
+    header[6] = 0x1
+    header[10] = 32
+    header[12:14] = pack('<h', 50)
+
+    chunk = bytes(header) + bytes([0]) + b'Benchmark\0' + b'\xff' + bytes(4) + b'        ' + bytes(4)
+    chunk += synthetic_lgx(num_images)
+
+    return pack('<L', 0x1) + b'BENCHMRK' + bytes(4) + rle_encode(chunk)
+
+
+def small_scenery(subtype: str = 'simple', seed: int = SEED):
+    """Small scenery object of the given subtype (simple, glass, gardens, animated, fountain1 or fountain4)
+    with synthetic sprites."""
+    data = copy.deepcopy(cts.data_template_small)
+    data['id'] = f'benchmark.scenery_small.{subtype}'
+    data['strings'] = {'name': {'en-GB': f'Benchmark {subtype}'}}
+    properties = data['properties']
+    properties.update(height=32, shape='4/4')
+
+    num_images = {'simple': 4, 'glass': 8, 'gardens': 12, 'animated': 16, 'fountain1': 16, 'fountain4': 32}[subtype]
+    if subtype == 'glass':
+        properties['hasGlass'] = True
+    elif subtype == 'gardens':
+        properties['canWither'] = True
+    elif subtype != 'simple':
+        properties.update(isAnimated=True, animationDelay=1, animationMask=3)
+        if subtype == 'fountain1':
+            properties['SMALL_SCENERY_FLAG_FOUNTAIN_SPRAY_1'] = True
+        elif subtype == 'fountain4':
+            properties['SMALL_SCENERY_FLAG_FOUNTAIN_SPRAY_4'] = True
+        else:
+            properties.update(frameOffsets=[0, 1, 2, 3], numFrames=4)
+
+    data['images'] = [{'path': f'images/{i}.png', 'x': 0, 'y': 0} for i in range(num_images)]
+    sprites = {im['path']: synthetic_sprite(seed=seed+i) for i, im in enumerate(data['images'])}
+
+    return _with_remaps(obj.new(data, sprites))
+
+
+def large_scenery(num_tiles: int = 16, seed: int = SEED):
+    """Large scenery object with a square of num_tiles tiles and synthetic tile sprites."""
+    side = int(round(num_tiles**0.5))
+    data = copy.deepcopy(cts.data_template_large)
+    data['id'] = f'benchmark.scenery_large.{num_tiles}'
+    data['strings'] = {'name': {'en-GB': f'Benchmark {num_tiles} tiles'}}
+    data['properties']['tiles'] = [{'x': 32*x, 'y': 32*y, 'z': 0, 'clearance': 32, 'walls': 0, 'corners': 15}
+                                   for x in range(side) for y in range(side)]
+
+    data['images'] = [{'path': f'images/{i}.png', 'x': 0, 'y': 0} for i in range(4*(num_tiles+1))]
+    sprites = {im['path']: synthetic_sprite(seed=seed+i) for i, im in enumerate(data['images'])}
+
+    return _with_remaps(obj.new(data, sprites))
+
+
+def _with_remaps(o):
+    for color, remap in zip(FIXTURE_REMAPS, ('1st Remap', '2nd Remap', '3rd Remap')):
+        o.changeRemap(color, remap)
+
+    return o
+
+
+def write_fixtures(folder: str):
+    """Writes the fixtures as files to folder. Returns the paths of the DAT, the .lgx and the .parkobj files."""
+    makedirs(folder, exist_ok=True)
+
+    paths = {'dat': join(folder, 'BENCHMRK.DAT'), 'lgx': join(folder, 'sprites.lgx')}
+    with open(paths['dat'], 'wb') as file:
+        file.write(synthetic_dat())
+    with open(paths['lgx'], 'wb') as file:
+        file.write(synthetic_lgx())
+
+    small_scenery().save(folder)
+    large_scenery(16).save(folder)
+    paths['small'] = join(folder, 'benchmark.scenery_small.simple.parkobj')
+    paths['large'] = join(folder, 'benchmark.scenery_large.16.parkobj')
+
+    return paths
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Command line entry point: python -m rctobject COMMAND ...
+"""
+
+import argparse
+import os
+import sys
+
+import rctobject.benchmark as benchmark
+import rctobject.convert as convert
+import rctobject.library as library
+import rctobject.palette as pal
+import rctobject.palettize as palettize
+import rctobject.thumbnails as thumbnails
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m rctobject', description='Tools for RCT objects without the editor.')
+    parser.add_argument('--no-palette-cache', action='store_true',
+                        help=f'Do not read or write the compiled palettes in {pal.COMPILED_PATH}.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    benchmark.add_parser(subparsers)
+    convert.add_parser(subparsers)
+    library.add_parser(subparsers)
+    palettize.add_parser(subparsers)
+    thumbnails.add_parser(subparsers)
+
+    args = parser.parse_args(argv)
+    if args.no_palette_cache:
+        # the environment variable reaches the worker processes as well
+        os.environ['RCTOBJECT_PALETTE_CACHE'] = ''
+        pal.COMPILED_PATH = None
+
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
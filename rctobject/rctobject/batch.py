@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Shared parts of the headless batch commands: finding the input files, naming the outputs after them and
+converting them in worker processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import walk, cpu_count
+from os.path import isfile, join, relpath, basename, abspath
+from time import perf_counter
+
+
+def find_files(input_path: str, accept, exclude: str = None):
+    """Returns the files below input_path for whose file name accept returns True. The folder exclude, e.g. an
+    output folder inside the input, is not searched."""
+    if isfile(input_path):
+        return [input_path]
+
+    exclude = abspath(exclude) if exclude else None
+    found = []
+    for root, dirs, files in walk(input_path):
+        dirs[:] = sorted(d for d in dirs if abspath(join(root, d)) != exclude)
+
+        for file in sorted(files):
+            if accept(file):
+                found.append(join(root, file))
+
+    return found
+
+
+def output_path(source: str, input_path: str, output_dir: str):
+    """Output path of source, an input file without extension or a folder. The relative folder structure of the
+    input is kept; a source that is the input itself is named after it."""
+    source = abspath(source)
+    if isfile(input_path) or source == abspath(input_path):
+        return join(output_dir, basename(source))
+
+    return join(output_dir, relpath(source, abspath(input_path)))
+
+
+def run_batch(function, tasks: list, jobs: int = None, force: bool = False, is_up_to_date=None, report=print):
+    """Calls function(filepath, target, *args) for each task (filepath, target, *args), in worker processes if
+    jobs > 1 (default: number of CPUs). function returns (filepath, status, message) with status 'converted' or
+    'failed'.
+
+    Tasks with the same target, compared case-insensitively, would overwrite each other and fail without being
+    run. Unless force is set, tasks for which is_up_to_date(filepath, target) is True are skipped. Returns a dict
+    with the counts of converted, skipped and failed files, the list of failures and the elapsed time."""
+    start = perf_counter()
+    summary = {'converted': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def collect(result):
+        filepath, status, message = result
+        summary[status] += 1
+        if status == 'failed':
+            summary['errors'].append((filepath, message))
+            report(f'FAILED {filepath}: {message}')
+        else:
+            report(f'{status} {filepath}')
+
+    by_target = {}
+    for task in tasks:
+        by_target.setdefault(task[1].lower(), []).append(task)
+
+    todo = []
+    for colliding in by_target.values():
+        if len(colliding) > 1:
+            filepaths = ', '.join(task[0] for task in colliding)
+            for filepath, target, *_ in colliding:
+                collect((filepath, 'failed', f'{target} would be written by each of {filepaths}'))
+            continue
+
+        task = colliding[0]
+        if not force and is_up_to_date and is_up_to_date(task[0], task[1]):
+            summary['skipped'] += 1
+            continue
+
+        todo.append(task)
+
+    jobs = jobs or cpu_count() or 1
+    if jobs == 1 or len(todo) < 2:
+        for task in todo:
+            collect(function(*task))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(function, *task) for task in todo]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    summary['seconds'] = perf_counter() - start
+
+    return summary
+
+
+def print_summary(summary: dict, unit: str = 'files'):
+    """Prints the totals of a run_batch summary. Returns the exit code of the command."""
+    seconds = summary['seconds']
+    done = summary['converted'] + summary['failed']
+    rate = done/seconds if seconds > 0 else 0.0
+    print(f"\n{summary['converted']} converted, {summary['skipped']} up to date, {summary['failed']} failed "
+          f"in {seconds:.1f} s ({rate:.1f} {unit}/s)")
+
+    return 1 if summary['failed'] else 0
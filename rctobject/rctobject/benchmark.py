@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Runner of the benchmarks of the hot paths of rctobject.
+
+The cases and their synthetic fixtures are not part of the package, they live in the benchmarks folder of the
+source tree (cases.py and fixtures.py) and are loaded from there, or from the folder given with --suite. The
+cases register themselves with case; the fixtures are generated from a fixed seed, so no game files are needed
+and every run measures the same inputs.
+
+Each case is timed like timeit: a warm-up call, then repeated samples of as many calls as needed to run for at
+least min_time. Cases with a setup (e.g. dropping render caches to time a cold show) run it before every call
+outside of the timing. Results are written as JSON together with the commit and the environment, so runs of
+different commits can be compared.
+
+A history of the results is kept in a SQLite file, one row of median and interquartile range per benchmark,
+run and machine. The gate compares new results to the recent clean runs of the same machine and fails when a
+benchmark got slower by more than a threshold and its interquartile range no longer overlaps the baseline's.
+
+Run as: python -m rctobject benchmark run|compare|fixtures|ingest|history|gate ...
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from hashlib import sha256
+from importlib import import_module
+from json import dump, dumps, load
+from os import makedirs, cpu_count
+from os.path import join, dirname, abspath, expanduser, isfile
+from platform import platform, python_version, machine, processor, node
+from statistics import mean, median, stdev, quantiles
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import sqlite3
+import sys
+
+import numpy as np
+import PIL
+
+RESULTS_PATH = join(expanduser('~'), '.rctobject', 'benchmarks')
+HISTORY_PATH = join(expanduser('~'), '.rctobject', 'benchmarks.sqlite')
+RESULTS_FORMAT = 1
+SUITE_PATH = join(dirname(dirname(abspath(__file__))), 'benchmarks')
+
+DEFAULT_REPEAT = 5
+DEFAULT_MIN_TIME = 0.05
+DEFAULT_THRESHOLD = 0.1
+BASELINE_RUNS = 5
+
+# name -> factory(folder), which returns the function to time or (function, setup)
+_cases = OrderedDict()
+
+
+def case(name: str):
+    """Registers a benchmark factory under name."""
+    def register(factory):
+        _cases[name] = factory
+        return factory
+
+    return register
+
+
+def case_names():
+    return list(_cases)
+
+
+def load_suite(folder: str = SUITE_PATH, module: str = 'cases'):
+    """Imports module of the benchmark suite in folder, by default the cases, which registers them. Returns
+    the module."""
+    folder = abspath(folder)
+    if not isfile(join(folder, f'{module}.py')):
+        raise RuntimeError(f'No benchmark suite in {folder}, the benchmarks folder of the source tree is '
+                           'not installed with the package.')
+
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+
+    return import_module(module)
+
+
+########## Timing and results ##########
+
+def _sample(function, setup, number: int):
+    if setup is None:
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        return perf_counter() - start
+
+    total = 0.0
+    for _ in range(number):
+        setup()
+        start = perf_counter()
+        function()
+        total += perf_counter() - start
+
+    return total
+
+
+def time_function(function, setup=None, repeat: int = DEFAULT_REPEAT, min_time: float = DEFAULT_MIN_TIME):
+    """Times function like timeit. Returns the statistics of the seconds per call over repeat samples."""
+    if setup is not None:
+        setup()
+    function()
+
+    # 1, 2, 5, 10, 20, 50, ... calls per sample until a sample takes min_time
+    number = 1
+    for factor in (2, 2.5, 2)*10:
+        if _sample(function, setup, number) >= min_time:
+            break
+        number = int(number*factor)
+
+    times = [_sample(function, setup, number)/number for _ in range(repeat)]
+    q1, _, q3 = quantiles(times, n=4) if len(times) > 1 else times*3
+
+    return {'min': min(times), 'median': median(times), 'mean': mean(times),
+            'stdev': stdev(times) if len(times) > 1 else 0.0, 'q1': q1, 'q3': q3, 'number': number,
+            'repeat': repeat, 'times': times}
+
+
+def select_cases(patterns: list = None, names: list = None):
+    """Names of the cases (or of names) that contain one of patterns or match it as glob pattern, all without
+    patterns."""
+    names = case_names() if names is None else list(names)
+    if not patterns:
+        return names
+
+    return [name for name in names if any(pattern in name or fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def git_revision(path: str = dirname(abspath(__file__))):
+    """Returns the commit of the repository at path and whether tracked files were changed, (None, False)
+    outside of a git repository."""
+    try:
+        result = run(['git', 'rev-parse', 'HEAD'], cwd=path, stdout=-1, stderr=-1, encoding='utf-8')
+        if result.returncode:
+            return None, False
+
+        status = run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=path, stdout=-1, stderr=-1,
+                     encoding='utf-8')
+    except OSError:
+        return None, False
+
+    return result.stdout.strip(), bool(status.stdout.strip())
+
+
+def environment():
+    return {'platform': platform(), 'python': python_version(), 'numpy': np.__version__,
+            'pillow': PIL.__version__, 'cpus': cpu_count(), 'machine': machine(), 'processor': processor(),
+            'node': node()}
+
+
+def machine_fingerprint(env: dict):
+    """Short hash of an environment. Timings are only comparable between runs with the same fingerprint."""
+    return sha256(dumps(env, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def run_benchmarks(patterns: list = None, repeat: int = DEFAULT_REPEAT, min_time: float = DEFAULT_MIN_TIME,
+                   report=print):
+    """Runs the selected cases, see load_suite for registering them. Returns the results with commit and
+    environment, ready to be written as JSON."""
+    commit, dirty = git_revision()
+    results = {'format': RESULTS_FORMAT, 'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+               'commit': commit, 'dirty': dirty, 'environment': environment(),
+               'machine': machine_fingerprint(environment()),
+               'settings': {'repeat': repeat, 'min_time': min_time}, 'benchmarks': {}}
+
+    with TemporaryDirectory() as folder:
+        for name in select_cases(patterns):
+            prepared = _cases[name](folder)
+            function, setup = prepared if isinstance(prepared, tuple) else (prepared, None)
+
+            stats = time_function(function, setup, repeat, min_time)
+            results['benchmarks'][name] = stats
+            report(f'{name:<52} {format_seconds(stats["median"]):>10}  (min {format_seconds(stats["min"])})')
+
+    return results
+
+
+def default_results_path(results: dict):
+    """Results file in RESULTS_PATH named after the commit, or the time for runs outside of git."""
+    if results['commit']:
+        name = results['commit'][:12] + ('-dirty' if results['dirty'] else '')
+    else:
+        name = results['created'].replace(':', '-')
+
+    return join(RESULTS_PATH, f'{name}.json')
+
+
+def save_results(results: dict, path: str):
+    makedirs(dirname(abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        dump(results, file, indent=2)
+
+
+def load_results(path: str):
+    with open(path) as file:
+        results = load(file)
+
+    if results.get('format') != RESULTS_FORMAT:
+        raise ValueError(f'{path} has results format {results.get("format")}, expected {RESULTS_FORMAT}.')
+
+    results.setdefault('machine', machine_fingerprint(results['environment']))
+
+    return results
+
+
+def compare_results(old: dict, new: dict, threshold: float = 0.1, statistic: str = 'median'):
+    """Compares the cases of two results. Returns rows (name, old seconds, new seconds, ratio, verdict) where
+    verdict is 'slower' or 'faster' if the ratio of new to old differs from 1 by more than threshold, else ''.
+    Cases of only one of the results are given with None for the missing time."""
+    rows = []
+    names = list(old['benchmarks']) + [name for name in new['benchmarks'] if name not in old['benchmarks']]
+
+    for name in names:
+        time_old = old['benchmarks'].get(name, {}).get(statistic)
+        time_new = new['benchmarks'].get(name, {}).get(statistic)
+        if time_old is None or time_new is None:
+            rows.append((name, time_old, time_new, None, ''))
+            continue
+
+        ratio = time_new/time_old if time_old > 0 else float('inf')
+        if ratio > 1 + threshold:
+            verdict = 'slower'
+        elif ratio < 1/(1 + threshold):
+            verdict = 'faster'
+        else:
+            verdict = ''
+        rows.append((name, time_old, time_new, ratio, verdict))
+
+    return rows
+
+
+def format_seconds(seconds: float):
+    if seconds is None:
+        return '-'
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds*factor >= 1:
+            return f'{seconds*factor:.3g} {unit}'
+
+    return f'{seconds*1e9:.3g} ns'
+
+
+########## History and regression gate ##########
+
+class BenchmarkHistory:
+    """Timings of benchmark runs by commit and machine, stored in a SQLite file. Results are added with ingest,
+    check compares new results against the recent runs of the same machine."""
+
+    def __init__(self, history_path: str = HISTORY_PATH):
+        if history_path != ':memory:':
+            makedirs(dirname(abspath(history_path)), exist_ok=True)
+
+        self.history_path = history_path
+        self.connection = sqlite3.connect(history_path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, commit_id TEXT, dirty INTEGER, '
+                'machine TEXT, created TEXT, environment TEXT, UNIQUE (commit_id, machine, created))')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS timings (run INTEGER REFERENCES runs (id), benchmark TEXT, '
+                'median REAL, q1 REAL, q3 REAL, min REAL, PRIMARY KEY (run, benchmark))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS timings_benchmark ON timings (benchmark)')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def ingest(self, results: dict):
+        """Adds the timings of results. Returns False if the run was already stored."""
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO runs (commit_id, dirty, machine, created, environment) VALUES (?, ?, ?, ?, ?)',
+                (results['commit'], int(results['dirty']), results['machine'], results['created'],
+                 dumps(results['environment'])))
+            if not cursor.rowcount:
+                return False
+
+            self.connection.executemany(
+                'INSERT INTO timings VALUES (?, ?, ?, ?, ?, ?)',
+                [(cursor.lastrowid, name, stats['median'], stats.get('q1'), stats.get('q3'), stats['min'])
+                 for name, stats in results['benchmarks'].items()])
+
+        return True
+
+    def history(self, name: str, machine: str = None, limit: int = None):
+        """Returns the timings of a benchmark, newest first, as dicts with commit, dirty, machine, created,
+        median, q1, q3, iqr and min."""
+        query = ('SELECT commit_id, dirty, machine, created, median, q1, q3, min FROM timings '
+                 'JOIN runs ON runs.id = timings.run WHERE benchmark = ?')
+        parameters = [name]
+        if machine:
+            query += ' AND machine = ?'
+            parameters.append(machine)
+
+        query += ' ORDER BY created DESC, runs.id DESC'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+
+        return [self._entry(row) for row in self.connection.execute(query, parameters)]
+
+    def baseline(self, name: str, machine: str, runs: int = BASELINE_RUNS, commit: str = None,
+                 exclude_commit: str = None):
+        """Returns the baseline of a benchmark on a machine as dict with median, q1 and q3, each the median over
+        the last runs clean runs, or only over the runs of commit if given. None if there are no such runs."""
+        query = ('SELECT median, q1, q3 FROM timings JOIN runs ON runs.id = timings.run '
+                 'WHERE benchmark = ? AND machine = ?')
+        parameters = [name, machine]
+        if commit:
+            query += ' AND commit_id LIKE ?'
+            parameters.append(f'{commit}%')
+        else:
+            query += ' AND dirty = 0'
+        if exclude_commit:
+            query += ' AND commit_id IS NOT ?'
+            parameters.append(exclude_commit)
+
+        query += f' ORDER BY created DESC, runs.id DESC LIMIT {int(runs)}'
+        rows = self.connection.execute(query, parameters).fetchall()
+        if not rows:
+            return None
+
+        baseline = {'median': median(row['median'] for row in rows), 'runs': len(rows)}
+        for quartile in ('q1', 'q3'):
+            values = [row[quartile] for row in rows if row[quartile] is not None]
+            baseline[quartile] = median(values) if values else None
+
+        return baseline
+
+    def check(self, results: dict, threshold: float = DEFAULT_THRESHOLD, patterns: list = None,
+              runs: int = BASELINE_RUNS, commit: str = None):
+        """Compares results with their baseline. Returns rows (name, baseline median, median, ratio, verdict)
+        where verdict is 'regressed' or 'improved' if the median changed by more than threshold and the
+        interquartile ranges do not overlap, 'new' without baseline and '' otherwise."""
+        rows = []
+        for name in select_cases(patterns, results['benchmarks']):
+            stats = results['benchmarks'][name]
+            baseline = self.baseline(name, results['machine'], runs, commit, exclude_commit=results['commit'])
+            if baseline is None:
+                rows.append((name, None, stats['median'], None, 'new'))
+                continue
+
+            ratio = stats['median']/baseline['median'] if baseline['median'] > 0 else float('inf')
+            quartiles = (stats.get('q1'), stats.get('q3'), baseline['q1'], baseline['q3'])
+            if None in quartiles:
+                separated = (True, True)
+            else:
+                separated = (quartiles[0] > quartiles[3], quartiles[1] < quartiles[2])
+
+            if ratio > 1 + threshold and separated[0]:
+                verdict = 'regressed'
+            elif ratio < 1/(1 + threshold) and separated[1]:
+                verdict = 'improved'
+            else:
+                verdict = ''
+            rows.append((name, baseline['median'], stats['median'], ratio, verdict))
+
+        return rows
+
+    @staticmethod
+    def _entry(row):
+        iqr = row['q3'] - row['q1'] if row['q1'] is not None and row['q3'] is not None else None
+        return {
+            'commit': row['commit_id'],
+            'dirty': bool(row['dirty']),
+            'machine': row['machine'],
+            'created': row['created'],
+            'median': row['median'],
+            'q1': row['q1'],
+            'q3': row['q3'],
+            'iqr': iqr,
+            'min': row['min'],
+        }
+
+
+def print_table(rows, headers=('old', 'new')):
+    print(f'{"benchmark":<52} {headers[0]:>10} {headers[1]:>10} {"ratio":>7}')
+    for name, time_old, time_new, ratio, verdict in rows:
+        ratio = f'{ratio:.2f}' if ratio is not None else '-'
+        print(f'{name:<52} {format_seconds(time_old):>10} {format_seconds(time_new):>10} {ratio:>7}  {verdict}')
+
+
+########## Command line ##########
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser('benchmark', help='Time the hot paths of rctobject on synthetic fixtures.')
+    parser.add_argument('--history', default=HISTORY_PATH,
+                        help=f'History file of ingest, history and gate (default: {HISTORY_PATH}).')
+    parser.add_argument('--suite', default=SUITE_PATH,
+                        help=f'Folder with the cases and fixtures of run and fixtures (default: {SUITE_PATH}).')
+    commands = parser.add_subparsers(dest='benchmark_command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks and write the results as JSON.')
+    run_parser.add_argument('-k', '--select', nargs='+', default=None, metavar='PATTERN',
+                            help="Only run cases whose name contains PATTERN or matches it, e.g. 'sprites.*'.")
+    run_parser.add_argument('-o', '--output', default=None,
+                            help=f'Results file (default: the commit as file name in {RESULTS_PATH}).')
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                            help=f'Number of samples per case (default: {DEFAULT_REPEAT}).')
+    run_parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                            help=f'Minimum seconds per sample (default: {DEFAULT_MIN_TIME}).')
+    run_parser.add_argument('--list', action='store_true', help='List the cases without running them.')
+    run_parser.set_defaults(func=main_run)
+
+    compare = commands.add_parser('compare', help='Compare two results files.')
+    compare.add_argument('old', help='Results file of the baseline.')
+    compare.add_argument('new', help='Results file to compare.')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                         help=f'Relative change that counts as slower or faster (default: {DEFAULT_THRESHOLD}).')
+    compare.add_argument('--statistic', default='median', choices=('min', 'median', 'mean'),
+                         help='Statistic that is compared (default: median).')
+    compare.set_defaults(func=main_compare)
+
+    fixtures = commands.add_parser('fixtures', help='Write the synthetic DAT, .lgx and .parkobj fixtures.')
+    fixtures.add_argument('output', help='Output folder.')
+    fixtures.set_defaults(func=main_fixtures)
+
+    ingest = commands.add_parser('ingest', help='Add results files to the history.')
+    ingest.add_argument('results', nargs='+', help='Results files written by run.')
+    ingest.set_defaults(func=main_ingest)
+
+    history = commands.add_parser('history', help='Show the history of a benchmark.')
+    history.add_argument('name', help='Benchmark name, e.g. objects.LargeScenery.show.16.')
+    history.add_argument('--machine', default=None, help='Only runs of this machine fingerprint.')
+    history.add_argument('--limit', type=int, default=20, help='Maximum number of runs (default: 20).')
+    history.set_defaults(func=main_history)
+
+    gate = commands.add_parser(
+        'gate', help='Compare results with the history, exit with 1 if a benchmark regressed.')
+    gate.add_argument('results', help='Results file written by run.')
+    gate.add_argument('-k', '--select', nargs='+', default=None, metavar='PATTERN',
+                      help="Only check benchmarks whose name contains PATTERN or matches it, e.g. "
+                           "'read_image_table' colorRemaps 'LargeScenery.show.*'.")
+    gate.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                      help=f'Relative slowdown of the median that fails the gate (default: {DEFAULT_THRESHOLD}).')
+    gate.add_argument('--runs', type=int, default=BASELINE_RUNS,
+                      help=f'Number of recent clean runs the baseline is taken from (default: {BASELINE_RUNS}).')
+    gate.add_argument('--against', default=None, metavar='COMMIT',
+                      help='Take the baseline from the runs of this commit (or commit prefix) instead.')
+    gate.add_argument('--record', action='store_true', help='Add the results to the history after checking.')
+    gate.set_defaults(func=main_gate)
+
+
+def main_run(args):
+    load_suite(args.suite)
+
+    if args.list:
+        for name in select_cases(args.select):
+            print(name)
+        return 0
+
+    results = run_benchmarks(args.select, repeat=args.repeat, min_time=args.min_time)
+    path = args.output or default_results_path(results)
+    save_results(results, path)
+    print(f'\n{len(results["benchmarks"])} benchmarks written to {path}')
+
+    return 0
+
+
+def main_compare(args):
+    old = load_results(args.old)
+    new = load_results(args.new)
+
+    print_table(compare_results(old, new, args.threshold, args.statistic))
+
+    return 0
+
+
+def main_fixtures(args):
+    fixtures = load_suite(args.suite, 'fixtures')
+    for kind, path in fixtures.write_fixtures(args.output).items():
+        print(f'{kind:<6} {path}')
+
+    return 0
+
+
+def main_ingest(args):
+    with BenchmarkHistory(args.history) as history:
+        for path in args.results:
+            added = history.ingest(load_results(path))
+            print(f'{"added" if added else "already stored"} {path}')
+
+    return 0
+
+
+def main_history(args):
+    with BenchmarkHistory(args.history) as history:
+        entries = history.history(args.name, machine=args.machine, limit=args.limit)
+
+    if not entries:
+        print(f'No runs of {args.name} in {args.history}.')
+        return 1
+
+    print(f'{"created":<26} {"commit":<19} {"machine":<12} {"median":>10} {"iqr":>10}')
+    for entry in entries:
+        commit = (entry['commit'] or '-')[:12] + (' dirty' if entry['dirty'] else '')
+        print(f'{entry["created"]:<26} {commit:<19} {entry["machine"]:<12} {format_seconds(entry["median"]):>10} '
+              f'{format_seconds(entry["iqr"]):>10}')
+
+    return 0
+
+
+def main_gate(args):
+    results = load_results(args.results)
+
+    with BenchmarkHistory(args.history) as history:
+        rows = history.check(results, args.threshold, args.select, args.runs, args.against)
+        print_table(rows, headers=('baseline', 'new'))
+
+        regressed = [row[0] for row in rows if row[4] == 'regressed']
+        if not any(row[1] is not None for row in rows):
+            print(f'\nNo baseline for machine {results["machine"]} in {args.history}.')
+        elif regressed:
+            print(f'\n{len(regressed)} of {len(rows)} benchmarks regressed by more than {args.threshold:.0%}.')
+        else:
+            print(f'\nNo regressions in {len(rows)} benchmarks.')
+
+        if args.record:
+            history.ingest(results)
+
+    return 1 if regressed else 0
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Headless batch conversion of .DAT, .parkobj and object.json files to .parkobj files.
+
+Run as: python -m rctobject convert INPUT OUTPUT [--jobs N] [--no-zip] [--force]
+"""
+
+from os import walk, makedirs
+from os.path import splitext, exists, getmtime, join, dirname, basename, abspath
+
+import rctobject.batch as batch
+import rctobject.objects as obj
+
+
+def find_objects(input_path: str, exclude: str = None):
+    """Returns the object files below input_path. A folder with an object.json is one object."""
+    def accept(file):
+        return splitext(file)[1].lower() in obj.OBJECT_EXTENSIONS or file == 'object.json'
+
+    return batch.find_files(input_path, accept, exclude)
+
+
+def output_path(filepath: str, input_path: str, output_dir: str):
+    """Output .parkobj path without extension. Files are named after the input file, or after its folder for
+    object.json files, so outputs are known before loading."""
+    if basename(filepath) == 'object.json':
+        return batch.output_path(dirname(abspath(filepath)), input_path, output_dir)
+
+    return batch.output_path(splitext(filepath)[0], input_path, output_dir)
+
+
+def source_mtime(filepath: str):
+    """Modification time of an object file. For object.json files it is the newest time of all files in the
+    object folder, so changed images count as changes of the object."""
+    if basename(filepath) != 'object.json':
+        return getmtime(filepath)
+
+    return max(getmtime(join(root, file)) for root, _, files in walk(dirname(abspath(filepath))) for file in files)
+
+
+def is_up_to_date(filepath: str, target: str, no_zip: bool = False):
+    targets = [f'{target}.parkobj']
+    if no_zip:
+        targets.append(join(target, 'object.json'))
+
+    mtime = source_mtime(filepath)
+    return all(exists(t) and getmtime(t) >= mtime for t in targets)
+
+
+def convert_file(filepath: str, target: str, no_zip: bool = False, author_id: str = None,
+                 include_originalId: bool = False, openpath: str = obj.OPENRCTPATH, compression_level: int = None):
+    """Converts a single object file. Returns (filepath, status, message) with status 'converted' or 'failed'."""
+    try:
+        o = obj.load(filepath, openpath=openpath)
+
+        if not o.data.get('id', False):
+            # DAT objects have no id, we build one like the editor does
+            prefix = author_id or o.data.get('SourceGame', 'custom')
+            o['id'] = f'{prefix}.{o.object_type.value}.{o.old_id}'
+
+        path, name = dirname(target), basename(target)
+        makedirs(path, exist_ok=True)
+        o.save(path, name=name, no_zip=no_zip, include_originalId=include_originalId, openpath=openpath,
+               compression_level=compression_level)
+    except Exception as e:
+        return filepath, 'failed', f'{type(e).__name__}: {e}'
+
+    return filepath, 'converted', ''
+
+
+def convert_tree(input_path: str, output_dir: str, jobs: int = None, no_zip: bool = False, force: bool = False,
+                 author_id: str = None, include_originalId: bool = False, openpath: str = obj.OPENRCTPATH,
+                 compression_level: int = None, report=print):
+    """Converts all objects below input_path into output_dir, see batch.run_batch. Files with the same output,
+    e.g. foo.DAT and foo.parkobj, fail instead of overwriting each other."""
+    tasks = [(filepath, output_path(filepath, input_path, output_dir), no_zip, author_id, include_originalId,
+              openpath, compression_level)
+             for filepath in find_objects(input_path, exclude=output_dir)]
+
+    return batch.run_batch(convert_file, tasks, jobs=jobs, force=force,
+                           is_up_to_date=lambda filepath, target: is_up_to_date(filepath, target, no_zip),
+                           report=report)
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser(
+        'convert', help='Convert .DAT, .parkobj and object.json files to .parkobj files.')
+    parser.add_argument('input', help='Object file or folder that is searched recursively.')
+    parser.add_argument('output', help='Output folder, the input folder structure is kept.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs).')
+    parser.add_argument('--no-zip', action='store_true',
+                        help='Additionally write each object as unzipped folder.')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert files even if their output is newer than the input.')
+    parser.add_argument('--author-id', default=None,
+                        help='Id prefix for objects without id (default: source game of the DAT).')
+    parser.add_argument('--keep-original-id', action='store_true',
+                        help='Keep the originalId of DAT objects in the saved json.')
+    parser.add_argument('--compression-level', type=int, default=None, choices=range(10), metavar='0-9',
+                        help='Zip compression level of the .parkobj files (default: zlib default).')
+    parser.add_argument('--openrct2', default=obj.OPENRCTPATH,
+                        help='OpenRCT2 folder, needed for json files referring to sprites of original DATs.')
+    parser.set_defaults(func=main)
+
+
+def main(args):
+    summary = convert_tree(args.input, args.output, jobs=args.jobs, no_zip=args.no_zip, force=args.force,
+                           author_id=args.author_id, include_originalId=args.keep_original_id,
+                           openpath=args.openrct2, compression_level=args.compression_level)
+
+    return batch.print_summary(summary, 'objects')
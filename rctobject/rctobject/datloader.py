@@ -10,41 +10,46 @@
  This part of the code is adapted from a file 'objload.php' by X7123M3-256.
 """
 
-from struct import unpack
+from struct import unpack, unpack_from
+from functools import partial
 from json import dump, loads
 from os.path import splitext, exists
 from shutil import unpack_archive, make_archive, move, rmtree
 from tempfile import TemporaryDirectory
 from subprocess import run
 from PIL import Image
+import numpy as np
 
 import rctobject.constants as const
 import rctobject.sprites as spr
 import rctobject.palette as pal
 
 
-def rle_decode(string: bytes):
+def rle_decode(string: bytes, as_memoryview: bool = False):
+    """Decodes a DAT chunk. Runs are appended to a bytearray as whole slices, which grows amortized and
+    was measured faster than writing into a buffer preallocated from the header size.
+    With as_memoryview the result is returned without a final copy."""
     srcLength = len(string)
-    output = []
     i = 5
     if i >= srcLength:
         return False
 
     if string[0] == 0:
-        return string[5:]
+        return memoryview(string)[5:] if as_memoryview else string[5:]
     if string[0] != 1:
         return False
 
+    output = bytearray()
+
     while i < srcLength:
         byte = string[i]
         i += 1
-        if (byte & 0x80) == 0:
+        if byte < 0x80:
             copy = byte + 1
             if copy + i > srcLength:
                 raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE', copy, byte, i)
 
-            for c in string[i:i + copy]:
-                output.append(c)
+            output += string[i:i + copy]
             i += copy
 
         else:
@@ -52,13 +57,10 @@ def rle_decode(string: bytes):
             if i + 1 > srcLength:
                 raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE')
 
-            repeated_byte = string[i]
+            output += string[i:i + 1] * repeat
             i += 1
 
-            for j in range(repeat):
-                output.append(repeated_byte)
-
-    return bytes(output)
+    return memoryview(output) if as_memoryview else bytes(output)
 
 
 def array_push(arr, flag):
@@ -257,7 +259,16 @@ def read_string_table(data, pos):
     return string_table, pos
 
 
-def loadDatObject(filename: str):
+# Size of the header before the string table of the object types whose images are not decoded
+DAT_HEADER_SIZES = {'scenery_wall': 0xE, 'footpath_banner': 0xC, 'footpath': 0xE, 'footpath_item': 0xE,
+                    'scenery_group': 0x10E, 'park_entrance': 0x8}
+# Object types with a scenery group after the string table
+DAT_GROUPED_TYPES = ('scenery_wall', 'footpath_banner', 'footpath_item')
+
+
+def loadDatObject(filename: str, lazy: bool = False):
+    """Reads a DAT object. Returns the json data and the sprites. Only small and large scenery are read
+    completely, other object types give their metadata without images."""
     result = {}
     tags = {}
 
@@ -276,7 +287,7 @@ def loadDatObject(filename: str):
         object_type = get_object_type(object_flag)
         result['objectType'] = object_type
         string = f.read()
-        chunk = rle_decode(string)
+        chunk = rle_decode(string, as_memoryview=True)
 
         pos = 0
 
@@ -288,13 +299,13 @@ def loadDatObject(filename: str):
             if result['strings'].get('en-US', False):
                 result['strings'].pop('en-US')
 
-            scenery_group = chunk[pos+4:pos+12].decode('utf-8')
+            scenery_group = bytes(chunk[pos+4:pos+12]).decode('utf-8')
             if scenery_group != '        ':
                 result['sceneryGroup'] = scenery_group
             pos += 16
             pos = tag_small_scenery_scan_optional(chunk, tags, pos)
 
-            result['images'], sprites = read_image_table(chunk, pos)
+            result['images'], sprites = read_image_table(chunk, pos, lazy)
             # if(result["image"] == =FALSE)return FALSE
 
         elif object_type == 'scenery_large':
@@ -307,16 +318,31 @@ def loadDatObject(filename: str):
                 result['strings'].pop('en-US')
 
             # skip group info
-            scenery_group = chunk[pos+4:pos+12].decode('utf-8')
+            scenery_group = bytes(chunk[pos+4:pos+12]).decode('utf-8')
             if scenery_group != '        ':
                 result['sceneryGroup'] = scenery_group
             pos += 16
             tags['tiles'], pos = large_scenery_scan_optional(chunk, pos)
 
-            result['images'], sprites = read_image_table(chunk, pos)
+            result['images'], sprites = read_image_table(chunk, pos, lazy)
         else:
-            raise NotImplementedError(
-                f'dat-Import of {object_type} not supported.')
+            # Images of other object types are not decoded, only the names and scenery group where the size of
+            # the header is known (see the commented code below), so that their metadata can be read
+            result['images'], sprites = [], {}
+            header_size = DAT_HEADER_SIZES.get(object_type)
+            try:
+                string_table = read_string_table(chunk, header_size) if header_size else False
+            except IndexError:
+                string_table = False
+
+            if string_table:
+                result['strings'], pos = string_table
+                result['strings'].pop('en-US', None)
+
+                if object_type in DAT_GROUPED_TYPES and len(chunk) >= pos+12:
+                    scenery_group = bytes(chunk[pos+4:pos+12]).decode('utf-8')
+                    if scenery_group != '        ':
+                        result['sceneryGroup'] = scenery_group
 
         result['properties'] = tags
 
@@ -391,7 +417,8 @@ def loadDatObject(filename: str):
     # 		if(result["image"] == =FALSE)return FALSE
 
 
-def read_image_table(data, graphic_base):
+def read_image_table(data, graphic_base, lazy: bool = False):
+    """Reads an image table. With lazy, the bitmaps are only decoded when a sprite is first accessed."""
 
     length = len(data)
     if graphic_base >= length-3:
@@ -415,66 +442,76 @@ def read_image_table(data, graphic_base):
         im['path'] = f'images/{index}.png'
 
         base_pos = 8+graphic_base+16*index
-        offset = unpack('L', data[base_pos:base_pos+4])[0]
-        width, height, im['x'], im['y'] = unpack(
-            '4h', data[base_pos+4:base_pos+12])
+        offset, width, height, im['x'], im['y'], flag = unpack_from(
+            '<L4hH', data, base_pos)
 
-        flag = unpack('H', data[base_pos+12:base_pos+14])[0]
+        images.append(im)
+
+        if lazy:
+            sprites[im['path']] = spr.Sprite.fromLoader(
+                partial(decode_image, data, bitmap_base+offset, width, height, flag), (im['x'], im['y']))
+        else:
+            sprites[im['path']] = spr.Sprite(
+                decode_image(data, bitmap_base+offset, width, height, flag), (im['x'], im['y']), already_palettized=True)
 
-        image = Image.new('RGBA', (width, height))
+    return images, sprites
 
-        if flag & 0x4:
-            image_base = bitmap_base+offset
-            if image_base+2*height > length:
+
+def decode_image(data, pos, width, height, flag):
+    """Decodes one bitmap of an image table into an RGBA image."""
+    if flag & 0x4:
+        pixels = decode_rle_bitmap(data, pos, width, height)
+    else:
+        pixels = decode_raw_bitmap(data, pos, width, height)
+
+    # Index 0 is transparent in the lookup table, so no extra pass to remove the background is needed
+    return Image.fromarray(np.take(import_palette_table, pixels, axis=0), 'RGBA')
+
+
+def decode_raw_bitmap(data, pixel, width, height):
+    length = len(data)
+    if pixel+width*height > length:
+        raise RuntimeError(
+            f'Length of pixel image data {pixel+width*height} larger than length of image data {length}.')
+
+    return np.frombuffer(data, dtype=np.uint8, count=width*height, offset=pixel).reshape(height, width)
+
+
+def decode_rle_bitmap(data, image_base, width, height):
+    """Decodes a bitmap with run-length encoded rows into an array of game palette indices."""
+    length = len(data)
+    if image_base+2*height > length:
+        raise RuntimeError(
+            f'Length of image data {image_base+2*height} larger than length of image data {length}.')
+
+    pixels = np.zeros((height, width), dtype=np.uint8)
+    row_offsets = np.frombuffer(
+        data, dtype='<u2', count=height, offset=image_base)
+
+    for row in range(height):
+        row_data = image_base + int(row_offsets[row])
+
+        while True:
+            if row_data+2 > length:
                 raise RuntimeError(
-                    f'Length of image data {image_base+2*height} larger than length of image data {length}.')
-            for row in range(height):
-                row_data = image_base + \
-                    unpack('H', data[image_base+row*2:image_base+row*2+2])[0]
-
-                last = 0
-                while True:
-                    if row_data > length:
-                        raise RuntimeError(
-                            f'Length of row data {row_data} larger than length of image data {length}.')
-
-                    seg_length = data[row_data] & 0x7F
-                    last = data[row_data] & 0x80
-                    row_data += 1
-                    if row_data > length:
-                        raise RuntimeError(
-                            f'Length of row data {row_data} larger than length of image data {length}.')
-
-                    x_offset = data[row_data]
-                    row_data += 1
-                    for x in range(seg_length):
-                        if row_data > length:
-                            raise RuntimeError(
-                                f'Length of row data {row_data} larger than length of image data {length}.')
-                        image.putpixel(
-                            (x+x_offset, row), tuple(pal.complete_palette_array[data[row_data]]))
-                        row_data += 1
-
-                    if last == 0x80:
-                        break
-        else:
-            pixel = bitmap_base + offset
-            if pixel+width*height > length:
+                    f'Length of row data {row_data+2} larger than length of image data {length}.')
+
+            seg_length = data[row_data] & 0x7F
+            last = data[row_data] & 0x80
+            x_offset = data[row_data+1]
+            row_data += 2
+
+            if row_data+seg_length > length:
                 raise RuntimeError(
-                    f'Length of pixel image data {pixel+width*height} larger than length of image data {length}.')
-            for y in range(height):
-                for x in range(width):
-                    image.putpixel(
-                        (x, y), tuple(pal.complete_palette_array[data[pixel]]))
-                    pixel += 1
+                    f'Length of row data {row_data+seg_length} larger than length of image data {length}.')
+            pixels[row, x_offset:x_offset+seg_length] = memoryview(
+                data)[row_data:row_data+seg_length]
+            row_data += seg_length
 
-        images.append(im)
-        
-        image = pal.removeColorWhenImport(image)
-        sprites[im['path']] = spr.Sprite(
-            image, (im['x'], im['y']), already_palettized=True)
+            if last == 0x80:
+                break
 
-    return images, sprites
+    return pixels
 
 
 def import_sprites_with_open(dat_id, openpath):
@@ -552,3 +589,8 @@ known_author_ids = {
     'SV': 'Splitvision',
     'TT': 'ToonTowner',
     'XX': 'ToonTowner'}
+
+# RGBA lookup of the game palette indices used in DAT and LGX image tables, index 0 is transparent
+import_palette_table = np.zeros((256, 4), dtype=np.uint8)
+import_palette_table[:, :3] = pal.complete_palette_array
+import_palette_table[1:, 3] = 255
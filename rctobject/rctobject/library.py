@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Index of the objects in an OpenRCT2 object folder, kept in a SQLite file.
+
+The index records id, originalId, type, authors, name, scenery group and size of every .DAT and .parkobj
+file together with its modification time, so rescans only load new or changed files. Only the json data of
+the objects is read for this, their sprites are never loaded, so objects whose sprites are in the original
+DATs are indexed without running OpenRCT2.
+
+Run as: python -m rctobject library scan|search ...
+"""
+
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from json import dumps, loads
+from os import stat, makedirs
+from os.path import join, splitext, dirname, expanduser, abspath
+
+import rctobject.batch as batch
+import rctobject.objects as obj
+import rctobject.datloader as dat
+
+LIBRARY_PATH = join(expanduser('~'), '.rctobject', 'library.sqlite')
+
+_COLUMNS = ('path', 'mtime', 'file_size', 'id', 'original_id', 'dat_name', 'object_type', 'authors', 'name',
+            'scenery_group', 'size', 'error')
+
+
+def readEntry(path: str):
+    """Returns the index row of an object file. Files that cannot be read get a row with the error. Objects of
+    all types are indexed, the size is only known for the types the editor supports."""
+    info = stat(path)
+    entry = dict.fromkeys(_COLUMNS)
+    entry.update(path=path, mtime=info.st_mtime, file_size=info.st_size)
+
+    try:
+        data = obj.loadData(path)
+        size = obj.sizeFromData(data)
+    except Exception as e:
+        entry['error'] = f'{type(e).__name__}: {e}'
+        return entry
+
+    original_id = data.get('originalId', '')
+    authors = data.get('authors', [])
+    if isinstance(authors, str):
+        authors = [authors] if authors else []
+
+    group = data.get('sceneryGroup') or data.get('properties', {}).get('sceneryGroup', '')
+
+    entry.update(
+        id=data.get('id', ''),
+        original_id=original_id,
+        dat_name=original_id.split('|')[1].strip() if original_id.count('|') == 2 else '',
+        object_type=data.get('objectType', ''),
+        authors=dumps(authors),
+        name=data.get('strings', {}).get('name', {}).get('en-GB', ''),
+        scenery_group=group.strip() if isinstance(group, str) else '',
+        size=dumps(size) if size is not None else None)
+
+    return entry
+
+
+class ObjectLibrary:
+    """Object index stored in a SQLite file, use scan to fill and update it."""
+
+    def __init__(self, index_path: str = LIBRARY_PATH):
+        if index_path != ':memory:':
+            makedirs(dirname(abspath(index_path)), exist_ok=True)
+
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS objects (path TEXT PRIMARY KEY, mtime REAL, file_size INTEGER, '
+                'id TEXT, original_id TEXT, dat_name TEXT, object_type TEXT, authors TEXT, name TEXT, '
+                'scenery_group TEXT, size TEXT, error TEXT)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS objects_id ON objects (id COLLATE NOCASE)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS objects_dat_name ON objects (dat_name COLLATE NOCASE)')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def scan(self, folder: str, jobs: int = 1):
+        """Updates the index with all .DAT and .parkobj files below folder. Only files that are new or whose
+        mtime or size changed are loaded, entries of removed files are dropped. Returns a dict with counts."""
+        folder = abspath(folder)
+        files = batch.find_files(folder, lambda filename: splitext(filename)[1].lower() in obj.OBJECT_EXTENSIONS)
+
+        known = {row['path']: (row['mtime'], row['file_size']) for row in self.connection.execute(
+            'SELECT path, mtime, file_size FROM objects WHERE substr(path, 1, ?) = ?',
+            (len(join(folder, '')), join(folder, '')))}
+
+        changed = []
+        for path in files:
+            info = stat(path)
+            if known.get(path) != (info.st_mtime, info.st_size):
+                changed.append(path)
+
+        if jobs > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                entries = list(executor.map(readEntry, changed, chunksize=16))
+        else:
+            entries = [readEntry(path) for path in changed]
+
+        removed = set(known).difference(files)
+
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT OR REPLACE INTO objects VALUES ({", ".join("?"*len(_COLUMNS))})',
+                [tuple(entry[column] for column in _COLUMNS) for entry in entries])
+            self.connection.executemany(
+                'DELETE FROM objects WHERE path = ?', [(path,) for path in removed])
+
+        return {'added': sum(path not in known for path in changed),
+                'updated': sum(path in known for path in changed),
+                'removed': len(removed),
+                'unchanged': len(files) - len(changed),
+                'failed': sum(bool(entry['error']) for entry in entries)}
+
+    def search(self, name: str = None, author: str = None, group: str = None, object_type: str = None,
+               limit: int = None):
+        """Returns the entries matching all given criteria. name matches parts of the name, id or DAT name,
+        author matches parts of the author names or a DAT name prefix; known author names (see
+        datloader.known_author_ids) also match the DAT name prefixes of that author."""
+        conditions = ['error IS NULL']
+        parameters = []
+
+        if name:
+            conditions.append('(name LIKE ? OR id LIKE ? OR dat_name LIKE ?)')
+            parameters += [f'%{name}%']*3
+
+        if author:
+            author_conditions = ['authors LIKE ?', 'dat_name LIKE ?']
+            parameters += [f'%{author}%', f'{author}%']
+            for prefix, known_author in dat.known_author_ids.items():
+                if known_author.lower() == author.lower():
+                    author_conditions.append('dat_name LIKE ?')
+                    parameters.append(f'{prefix}%')
+            conditions.append(f'({" OR ".join(author_conditions)})')
+
+        if group:
+            conditions.append('scenery_group = ? COLLATE NOCASE')
+            parameters.append(group.strip())
+
+        if object_type:
+            conditions.append('object_type = ?')
+            parameters.append(object_type)
+
+        query = f'SELECT * FROM objects WHERE {" AND ".join(conditions)} ORDER BY name COLLATE NOCASE, path'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+
+        return [self._entry(row) for row in self.connection.execute(query, parameters)]
+
+    def find(self, identifier: str):
+        """Returns the entry with the given id or DAT name, None if there is none."""
+        row = self.connection.execute(
+            'SELECT * FROM objects WHERE error IS NULL AND (id = ? COLLATE NOCASE OR dat_name = ? COLLATE NOCASE) '
+            'ORDER BY path LIMIT 1', (identifier, identifier)).fetchone()
+
+        return self._entry(row) if row else None
+
+    def load(self, identifier: str, openpath: str = obj.OPENRCTPATH, lazy: bool = False):
+        """Loads the object with the given id or DAT name."""
+        entry = self.find(identifier)
+        if not entry:
+            raise RuntimeError(f'Could not find object "{identifier}" in the object library.')
+
+        return obj.load(entry['path'], openpath=openpath, lazy=lazy)
+
+    def failures(self):
+        """Returns (path, error) of all files that could not be indexed."""
+        return [(row['path'], row['error']) for row in self.connection.execute(
+            'SELECT path, error FROM objects WHERE error IS NOT NULL ORDER BY path')]
+
+    @staticmethod
+    def _entry(row):
+        return {
+            'path': row['path'],
+            'mtime': row['mtime'],
+            'id': row['id'],
+            'originalId': row['original_id'],
+            'datName': row['dat_name'],
+            'objectType': row['object_type'],
+            'authors': loads(row['authors']),
+            'name': row['name'],
+            'sceneryGroup': row['scenery_group'],
+            'size': tuple(loads(row['size'])) if row['size'] and row['size'] != 'null' else None,
+        }
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser('library', help='Index and search the objects of an OpenRCT2 object folder.')
+    parser.add_argument('--index', default=LIBRARY_PATH, help=f'Index file (default: {LIBRARY_PATH}).')
+    commands = parser.add_subparsers(dest='library_command', required=True)
+
+    scan = commands.add_parser('scan', help='Add new and changed objects to the index.')
+    scan.add_argument('folder', nargs='?', default=None,
+                      help='Folder to scan (default: the object folder of --openrct2).')
+    scan.add_argument('--openrct2', default=obj.OPENRCTPATH, help='OpenRCT2 folder.')
+    scan.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes.')
+    scan.set_defaults(func=main_scan)
+
+    search = commands.add_parser('search', help='Search the index.')
+    search.add_argument('name', nargs='?', default=None, help='Part of the name, id or DAT name.')
+    search.add_argument('--author', default=None, help='Author name or DAT name prefix.')
+    search.add_argument('--group', default=None, help='Scenery group.')
+    search.add_argument('--type', dest='object_type', default=None, help='Object type, e.g. scenery_small.')
+    search.add_argument('--limit', type=int, default=None, help='Maximum number of results.')
+    search.set_defaults(func=main_search)
+
+
+def main_scan(args):
+    folder = args.folder or f'{args.openrct2}/object'
+    with ObjectLibrary(args.index) as library:
+        summary = library.scan(folder, jobs=args.jobs)
+        for path, error in library.failures():
+            print(f'FAILED {path}: {error}')
+
+    print(f"{summary['added']} added, {summary['updated']} updated, {summary['removed']} removed, "
+          f"{summary['unchanged']} unchanged, {summary['failed']} failed")
+
+    return 0
+
+
+def main_search(args):
+    with ObjectLibrary(args.index) as library:
+        entries = library.search(args.name, author=args.author, group=args.group,
+                                 object_type=args.object_type, limit=args.limit)
+
+    for entry in entries:
+        identifier = entry['id'] or entry['datName']
+        print(f"{identifier}\t{entry['objectType']}\t{entry['name']}\t{', '.join(entry['authors'])}\t{entry['path']}")
+
+    return 0
@@ -17,13 +17,16 @@ Created 09/26/2021; 16:58:33
 
 """
 
-from json import dump, loads
+from json import dump, dumps, loads
 from json import load as jload
 from os import mkdir, makedirs, replace, getcwd, remove, walk
-from os.path import splitext, exists
+from os.path import splitext, exists, dirname
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED
 import copy
-from PIL import Image, ImageDraw
-from shutil import unpack_archive, make_archive, move, rmtree
+from functools import partial, lru_cache
+from PIL import Image
+from shutil import rmtree
 from tempfile import TemporaryDirectory
 from subprocess import run
 import numpy as np
@@ -36,6 +39,27 @@ import rctobject.constants as cts
 
 OPENRCTPATH = '%USERPROFILE%\\Documents\\OpenRCT2'
 
+# extensions of single file objects, see load
+OBJECT_EXTENSIONS = ('.dat', '.parkobj')
+
+
+# Rotation matrices R^0..R^3 (a, b, c, d) of large scenery tiles, rotated coordinates are (a*x + b*y, c*x + d*y)
+TILE_ROTATIONS = ((1, 0, 0, 1), (0, 1, -1, 0), (-1, 0, 0, -1), (0, -1, 1, 0))
+
+
+@lru_cache(maxsize=None)
+def tileColumnMask(height: int):
+    """Boolean mask (rows, 64 columns) of the isometric column of a large scenery tile with the given height in
+    height units: the ground diamond extended upwards by 8 pixels per unit."""
+    rows = np.arange(31 + height*8)[:, np.newaxis]
+    columns = np.arange(64)
+    half = np.where(columns < 32, columns//2, (63-columns)//2)
+
+    mask = (rows >= 15 - half) & (rows <= 15 + height*8 + half)
+    mask.flags.writeable = False
+
+    return mask
+
 
 def is_power_of_two(n):
     return (n != 0) and (n & (n-1) == 0)
@@ -81,17 +105,21 @@ class RCTObject:
         self.data[item] = value
 
     @classmethod
-    def fromParkobj(cls, filepath: str, openpath: str = OPENRCTPATH):
-        """Instantiates a new object from a .parkobj file."""
-        with TemporaryDirectory() as temp:
-            unpack_archive(filename=filepath, extract_dir=temp, format='zip')
+    def fromParkobj(cls, filepath: str, openpath: str = OPENRCTPATH, lazy: bool = False):
+        """Instantiates a new object from a .parkobj file. The json and images are read directly from the archive.
+           With lazy, sprites are only decoded on first access (see RCTObject.loadSprites)."""
+        with ZipFile(filepath) as archive:
             # Raises error on incorrect object structure or missing json:
-            o = cls.fromJson(f'{temp}/object.json', openpath)
+            data = loads(archive.read('object.json').decode('utf-8-sig'))
+            lgx_files = [name for name in archive.namelist()
+                         if '/' not in name and name.endswith('.lgx')]
+
+            o = cls.fromData(data, archive.read, lgx_files, openpath, lazy)
 
         return o
 
     @classmethod
-    def fromJson(cls, filepath: str, openpath: str = OPENRCTPATH):
+    def fromJson(cls, filepath: str, openpath: str = OPENRCTPATH, lazy: bool = False):
         """Instantiates a new object from a .json file. openpath has to be according to the system's 
            openrct2 folder location if sprite refers to a dat-file."""
 
@@ -99,16 +127,30 @@ class RCTObject:
         # trailing '/' included
         folder_path = filepath[:-filename_len]
 
-        data = jload(fp=open(filepath, encoding='utf8'))
+        with open(filepath, encoding='utf8') as file:
+            data = jload(fp=file)
+
+        def read_file(name):
+            with open(f'{folder_path}{name}', 'rb') as file:
+                return file.read()
+
+        # check if any LGX sprites are in the object folder
+        lgx_files = [file for file in next(walk(folder_path or './'))[2] if file.endswith('.lgx')]
+
+        return cls.fromData(data, read_file, lgx_files, openpath, lazy)
+
+    @classmethod
+    def fromData(cls, data: dict, read_file, lgx_files: list, openpath: str = OPENRCTPATH, lazy: bool = False):
+        """Instantiates a new object from json data. read_file(name) has to return the content of a file
+           relative to the object folder (or archive), lgx_files lists the .lgx files therein.
+           With lazy, the file contents are read but images are only decoded on first access."""
         dat_id = data.get('originalId', None)
         # If an original Id was given we load the sprites from original DATs (aka "official" openRCT objects).
 
-        # check if any LGX sprites are in the object folder and pre-load them
+        # pre-load LGX sprites
         lgx_buffer = {}
-        for file in next(walk(folder_path))[2]:
-            if file.endswith('.lgx'):
-                lgx_buffer[splitext(file)[0]] = dat.import_lgx(
-                    f'{folder_path}{file}')
+        for file in lgx_files:
+            lgx_buffer[splitext(file)[0]] = dat.read_image_table(read_file(file), 0, lazy)
 
         # REWORK
         if isinstance(data['images'][0], str) and dat_id:
@@ -124,8 +166,12 @@ class RCTObject:
             i = 0
             for im in data['images']:
                 if isinstance(im, dict):
-                    sprites[f'images/{i}.png'] = spr.Sprite.fromFile(
-                        f'{folder_path}{im["path"]}', coords=(im['x'], im['y']), already_palettized=True)
+                    if lazy:
+                        sprites[f'images/{i}.png'] = spr.Sprite.fromLoader(
+                            partial(spr.openImage, read_file(im['path'])), coords=(im['x'], im['y']))
+                    else:
+                        sprites[f'images/{i}.png'] = spr.Sprite.fromFile(
+                            BytesIO(read_file(im['path'])), coords=(im['x'], im['y']), already_palettized=True)
                     im['path'] = f'images/{i}.png'
                     images.append(im)
                     i += 1
@@ -182,16 +228,22 @@ class RCTObject:
         return cls(data=data, sprites=sprites, old_id=dat_id)
 
     @classmethod
-    def fromDat(cls, filepath: str):
-        """Instantiates a new object from a .DAT file."""
+    def fromDat(cls, filepath: str, lazy: bool = False):
+        """Instantiates a new object from a .DAT file. With lazy, sprites are only decoded on first access."""
 
-        data, sprites = dat.loadDatObject(filepath)
+        data, sprites = dat.loadDatObject(filepath, lazy)
         dat_id = data['originalId'].split('|')[1].replace(' ', '')
 
         return cls(data=data, sprites=sprites, old_id=dat_id)
 
-    def save(self, path: str = None, name: str = None, no_zip: bool = False, include_originalId: bool = False, compress_sprites: bool = False, openpath: str = OPENRCTPATH):
-        """Saves an object as .parkobj file to specified path."""
+    def loadSprites(self):
+        """Decodes all sprites that were loaded lazily."""
+        for sprite in self.sprites.values():
+            sprite.load()
+
+    def save(self, path: str = None, name: str = None, no_zip: bool = False, include_originalId: bool = False, compress_sprites: bool = False, openpath: str = OPENRCTPATH, compression_level: int = None):
+        """Saves an object as .parkobj file to specified path. The archive is built in memory and written
+        atomically; compression_level is the zlib level (0-9) of the archive, None for the default."""
 
         if not self.data.get('id', False):
             raise RuntimeError('Forbidden to save object without id!')
@@ -234,10 +286,13 @@ class RCTObject:
 
         data_save = copy.deepcopy(self.data)
 
-        with TemporaryDirectory() as temp:
-            mkdir(f'{temp}/images')
-            if compress_sprites:
-                im_list = self.data['images']
+        # Files of the object are kept in memory as {archive name: bytes} and written to disk only once
+        members = {}
+        if compress_sprites:
+            im_list = self.data['images']
+            # The OpenRCT2 sprite builder needs the images on disk
+            with TemporaryDirectory() as temp:
+                mkdir(f'{temp}/images')
                 for i, im in enumerate(self['images']):
                     sprite = self.sprites[im['path']]
 
@@ -252,37 +307,33 @@ class RCTObject:
                 if result.returncode:
                     raise RuntimeError(
                         f'OpenRCT2 export error: {result.stderr}.')
-                data_save['images'] = f"$LGX:sprites.lgx[0..{len(im_list)-1}]"
 
-                remove(f'{temp}/sprites.json')
-                rmtree(f'{temp}/images', ignore_errors=True)
-            else:
-                for i, im in enumerate(self['images']):
-                    sprite = self.sprites[im['path']]
+                with open(f'{temp}/sprites.lgx', mode='rb') as file:
+                    members['sprites.lgx'] = file.read()
 
-                    # we don't save empty sprites and replace their list entry with an empty string
-                    if sprite.isEmpty():
-                        data_save['images'][i] = ""
-                    else:
-                        sprite.save(f"{temp}/{im['path']}")
+            data_save['images'] = f"$LGX:sprites.lgx[0..{len(im_list)-1}]"
+        else:
+            for i, im in enumerate(self['images']):
+                sprite = self.sprites[im['path']]
 
-            with open(f'{temp}/object.json', mode='w') as file:
-                dump(obj=data_save, fp=file, indent=2)
+                # we don't save empty sprites and replace their list entry with an empty string
+                if sprite.isEmpty():
+                    data_save['images'][i] = ""
+                else:
+                    buffer = BytesIO()
+                    sprite.save(buffer, format='PNG')
+                    members[im['path']] = buffer.getvalue()
 
-            make_archive(base_name=f'{filename}',
-                         root_dir=temp, format='zip')
+        members['object.json'] = dumps(data_save, indent=2).encode('utf-8')
 
-            replace(f'{filename}.zip', f'{filename}.parkobj')
-            if no_zip:
-                rmtree(filename, ignore_errors=True)
-                makedirs(filename, exist_ok=True)
+        writeParkobj(f'{filename}.parkobj', members, compression_level)
 
-                if compress_sprites:
-                    move(f'{temp}/sprites.lgx', filename)
-                else:
-                    move(f'{temp}/images', filename)
-
-                move(f'{temp}/object.json', filename)
+        if no_zip:
+            rmtree(filename, ignore_errors=True)
+            for member, content in members.items():
+                makedirs(dirname(f'{filename}/{member}'), exist_ok=True)
+                with open(f'{filename}/{member}', mode='wb') as file:
+                    file.write(content)
 
     def size(self):
         'gives size in game coordinates; to be defined in subclass'
@@ -299,6 +350,16 @@ class RCTObject:
 
         return (width, height)
 
+    def colorUsage(self):
+        """Returns a dict from the palette colors used in the sprites of the object, including remaps and
+        sparkles, to their number of visible pixels over all sprites."""
+        usage = {}
+        for sprite in self.sprites.values():
+            for color, count in sprite.colorHistogram().items():
+                usage[color] = usage.get(color, 0) + count
+
+        return usage
+
     def switchPalette(self, palette):
         self.palette = palette
         for _, sprite in self.sprites.items():
@@ -415,30 +476,24 @@ class SmallScenery(RCTObject):
                         'prohibitWalls', False) else 0
 
                     for _, sprite in self.sprites.items():
-                        sprite.overwriteOffsets(
-                            int(sprite.x), int(sprite.y) - offset)
+                        sprite.shiftOffsets(0, -offset)
 
             elif self.shape == SmallScenery.Shape.HALF:
                 offset = 12
 
                 for _, sprite in self.sprites.items():
-                    sprite.overwriteOffsets(
-                        int(sprite.x), int(sprite.y) - offset)
+                    sprite.shiftOffsets(0, -offset)
 
     def size(self):
-        if self.shape == self.Shape.HALF:
-            size = (1, 1, int(self.data['properties']['height']/8))
-        elif self.shape == self.Shape.THREEQ:
-            size = (1, 1, int(self.data['properties']['height']/8))
-        elif self.shape == self.Shape.FULL:
-            size = (1, 1, int(self.data['properties']['height']/8))
-        elif self.shape == self.Shape.FULLD:
-            size = (1, 1, int(self.data['properties']['height']/8))
-        elif self.shape == self.Shape.QUARTERD:
-            size = (0.5, 0.5, int(
-                self.data['properties']['height']/8))
+        return self.shapeSize(self.shape, self.data['properties']['height'])
+
+    @classmethod
+    def shapeSize(cls, shape, height: int):
+        """Size in game coordinates of a small scenery with the given Shape and height in json units."""
+        if shape in (cls.Shape.HALF, cls.Shape.THREEQ, cls.Shape.FULL, cls.Shape.FULLD):
+            size = (1, 1, int(height/8))
         else:
-            size = (0.5, 0.5, int(self.data['properties']['height']/8))
+            size = (0.5, 0.5, int(height/8))
 
         return size
 
@@ -937,6 +992,10 @@ class SmallScenery(RCTObject):
 class LargeScenery(RCTObject):
     def __init__(self, data: dict, sprites: dict, old_id=None):
         super().__init__(data, sprites, old_id)
+        # composited canvas and tile positions per view, see show
+        self._show_cache = {}
+        # tile index by unrotated coordinates, see getTile
+        self._tile_index = {}
         if data:
             if data['objectType'] != 'scenery_large':
                 raise TypeError("Object is not large scenery.")
@@ -954,8 +1013,7 @@ class LargeScenery(RCTObject):
                 self.num_glyph_sprites = 0
 
             for _, sprite in self.sprites.items():
-                sprite.overwriteOffsets(
-                    int(sprite.x), int(sprite.y) - 15)
+                sprite.shiftOffsets(0, -15)
 
             self.tiles = []
             for i, tile_dict in enumerate(self['properties']['tiles']):
@@ -965,9 +1023,10 @@ class LargeScenery(RCTObject):
                                  rotation=self.rotation)
                 self.tiles.append(tile)
 
+            self._reindexTiles()
             self.updateImageList()
 
-    def save(self, path: str = None, name: str = None, no_zip: bool = False,   include_originalId: bool = False, compress_sprites: bool = False, openpath: str = OPENRCTPATH):
+    def save(self, path: str = None, name: str = None, no_zip: bool = False,   include_originalId: bool = False, compress_sprites: bool = False, openpath: str = OPENRCTPATH, compression_level: int = None):
         self.setRotation(0)
         tile_list = []
         for tile in self.tiles:
@@ -975,9 +1034,14 @@ class LargeScenery(RCTObject):
 
         self['properties']['tiles'] = tile_list
 
-        super().save(path, name, no_zip, include_originalId, compress_sprites, openpath)
+        super().save(path, name, no_zip, include_originalId, compress_sprites, openpath, compression_level)
 
-    def size(self):
+    def size(self, rotation=None):
+        return self.tilesSize(self.tiles, rotation)
+
+    @staticmethod
+    def tilesSize(tiles: list, rotation=None):
+        """Size in game coordinates of the footprint of tiles."""
         max_x = 0
         max_y = 0
         max_z = 0
@@ -985,13 +1049,14 @@ class LargeScenery(RCTObject):
         min_y = 0
         min_z = 0
 
-        for tile in self.tiles:
-            max_x = max(tile.x, max_x)
-            max_y = max(tile.y, max_y)
+        for tile in tiles:
+            tile_x, tile_y = tile.coordinates(rotation)
+            max_x = max(tile_x, max_x)
+            max_y = max(tile_y, max_y)
             max_z = max(tile.z + tile.h, max_z)
 
-            min_x = min(tile.x, min_x)
-            min_y = min(tile.y, min_y)
+            min_x = min(tile_x, min_x)
+            min_y = min(tile_y, min_y)
             min_z = min(tile.z, min_z)
 
         x = max_x - min_x + 1
@@ -1002,21 +1067,16 @@ class LargeScenery(RCTObject):
     
     def baseCoordinates(self):
         # Coordinates of the base (0,0) tile in (unrotated) object space in tile grid coordinates from the object footprint
-        rotation_save = int(self.rotation)
-        self.setRotation(0)        
         min_x = 0
         min_y = 0
-        
 
         for tile in self.tiles:
-            min_x = min(tile.x, min_x)
-            min_y = min(tile.y, min_y)
-            
-        self.setRotation(rotation_save)
-        
+            min_x = min(tile.x_orig, min_x)
+            min_y = min(tile.y_orig, min_y)
+
         return int(min_x), int(min_y)
 
-    def baseOffset(self):
+    def baseOffset(self, rotation=None):
         # Coordinates  of center of (0,0) tile in screen space of the sprite bounding box according to rotation
         max_x = 0
         max_y = 0
@@ -1026,12 +1086,13 @@ class LargeScenery(RCTObject):
         min_z = 0
 
         for tile in self.tiles:
-            max_x = max(tile.x, max_x)
-            max_y = max(tile.y, max_y)
+            tile_x, tile_y = tile.coordinates(rotation)
+            max_x = max(tile_x, max_x)
+            max_y = max(tile_y, max_y)
             max_z = max(tile.z + tile.h, max_z)
 
-            min_x = min(tile.x, min_x)
-            min_y = min(tile.y, min_y)
+            min_x = min(tile_x, min_x)
+            min_y = min(tile_y, min_y)
             min_z = min(tile.z, min_z)
 
         x = (max_x-min_y)*32+32
@@ -1039,10 +1100,10 @@ class LargeScenery(RCTObject):
 
         return x, y
 
-    def centerOffset(self):
+    def centerOffset(self, rotation=None):
         '''Coordinates of the center of ground base in screen space of the sprite bounding box according to rotation.'''
 
-        x_obj, y_obj, z_obj = self.size()
+        x_obj, y_obj, z_obj = self.size(rotation)
 
         x = int(x_obj*16 + y_obj*16)
         y = int(-1 + x_obj*8 + y_obj*8 + z_obj*8)
@@ -1050,30 +1111,67 @@ class LargeScenery(RCTObject):
         return x, y
 
     def show(self, rotation=None, no_remaps=False):
+        """Composites the tile sprites of the object. Tile positions and the canvas are cached per view; when only
+        some tile sprites changed since the last call, just the region they cover is drawn again."""
         if no_remaps:
-            first_remap = 'NoColor'
-            second_remap = 'NoColor'
-            third_remap = 'NoColor'
+            remaps = ('NoColor', 'NoColor', 'NoColor')
         else:
-            first_remap = self.current_first_remap
-            second_remap = self.current_second_remap
-            third_remap = self.current_third_remap
+            remaps = (self.current_first_remap, self.current_second_remap, self.current_third_remap)
 
-        tiles_list = self.getOrderedTileSprites(rotation)
-        width, height, left, right, top, bottom = self.computeCanvasOverlap(
-            tiles_list, rotation)
-        canvas = Image.new('RGBA', (width, height))
-
-        for tile_entry in tiles_list:
-            sprite = tile_entry[0]
-            canvas.paste(sprite.show(first_remap,
-                                     second_remap,
-                                     third_remap),
-                         (tile_entry[1]+sprite.x+left, tile_entry[2]+sprite.y+top), sprite.image)
+        view = rotation % 4 if isinstance(rotation, int) else self.rotation
 
-        x, y = self.centerOffset()
+        geometry = tuple((tile.x_orig, tile.y_orig, tile.z, tile.h) for tile in self.tiles)
+        cached = self._show_cache.get(view)
+        if cached is None or cached['geometry'] != geometry:
+            tiles_list = self.getOrderedTileSprites(view)
+            cached = {'geometry': geometry, 'positions': [(entry[3], entry[1], entry[2]) for entry in tiles_list],
+                      'canvas': None}
+            self._show_cache[view] = cached
+        else:
+            tiles_list = [[self.tiles[tile_index].giveSprite(view), x, y, tile_index]
+                          for tile_index, x, y in cached['positions']]
+
+        # x, y and the image are read first, as they decode lazy sprites which changes their version
+        states = [(s.x, s.y, s.image.size, id(s), s.version) for s, _, _, _ in tiles_list]
+        overlap = self.computeCanvasOverlap(tiles_list, view)
+        width, height, left, _, top, _ = overlap
+
+        canvas = cached['canvas']
+        if canvas is None or cached['remaps'] != remaps or cached['overlap'] != overlap:
+            canvas = Image.new('RGBA', (width, height))
+            self._pasteTiles(canvas, tiles_list, remaps, left, top)
+        else:
+            # region covered by the old and new images of the changed tile sprites
+            region = None
+            for (_, x, y, _), old, new in zip(tiles_list, cached['states'], states):
+                if old == new:
+                    continue
+                for sx, sy, (w, h), _, _ in (old, new):
+                    rect = (x+sx+left, y+sy+top, x+sx+left+w, y+sy+top+h)
+                    region = rect if region is None else (min(region[0], rect[0]), min(region[1], rect[1]),
+                                                          max(region[2], rect[2]), max(region[3], rect[3]))
+            if region:
+                region = (max(region[0], 0), max(region[1], 0), min(region[2], width), min(region[3], height))
+                if region[0] < region[2] and region[1] < region[3]:
+                    patch = Image.new('RGBA', (region[2]-region[0], region[3]-region[1]))
+                    self._pasteTiles(patch, tiles_list, remaps, left-region[0], top-region[1])
+                    canvas.paste(patch, region[:2])
+
+        cached.update(canvas=canvas, remaps=remaps, overlap=overlap, states=states)
+
+        x, y = self.centerOffset(view)
+
+        return canvas.copy(), -x-left, -y-top
+
+    def _pasteTiles(self, canvas, tiles_list, remaps, left, top):
+        # Pastes the tile sprites in drawing order, skipping those outside of the canvas
+        for sprite, x, y, _ in tiles_list:
+            pos_x, pos_y = x+sprite.x+left, y+sprite.y+top
+            if pos_x >= canvas.width or pos_y >= canvas.height or \
+                    pos_x+sprite.image.width <= 0 or pos_y+sprite.image.height <= 0:
+                continue
 
-        return canvas, -x-left, -y-top
+            canvas.paste(sprite.show(*remaps), (pos_x, pos_y), sprite.image)
 
     def computeCanvasOverlap(self, tiles_list, rotation=None):
         'Computes the overlap of the object sprite to the sprite bounding box'
@@ -1103,50 +1201,33 @@ class LargeScenery(RCTObject):
         self.rotateObject(rot-self.rotation)
 
     def getDrawingOrder(self, rotation=None):
-        if rotation is not None:
-            rotation_save = int(self.rotation)
-            self.setRotation(rotation)
-        else:
-            rotation_save = None    
-            
         order = {}
 
         for tile_index, tile in enumerate(self.tiles):
-            score = tile.x + tile.y
+            score = sum(tile.coordinates(rotation))
             order[tile_index] = score
-            
-        if rotation_save is not None:
-            self.setRotation(rotation_save)
 
         return sorted(order, key=order.get)
 
     def getOrderedTileSprites(self, rotation=None):
-        if rotation is not None:
-            rotation_save = int(self.rotation)
-            self.setRotation(rotation)
-        else:
-            rotation_save = None
-
-        x_baseline, y_baseline = self.baseOffset()
+        x_baseline, y_baseline = self.baseOffset(rotation)
 
         tile_index = 0
-        drawing_order = self.getDrawingOrder()
+        drawing_order = self.getDrawingOrder(rotation)
 
         ret = []
 
         for tile_index in drawing_order:
             tile = self.tiles[tile_index]
+            tile_x, tile_y = tile.coordinates(rotation)
             y = y_baseline + \
-                tile.x*16 + tile.y*16 - tile.z*8
-            x = x_baseline - tile.x*32 + tile.y*32
+                tile_x*16 + tile_y*16 - tile.z*8
+            x = x_baseline - tile_x*32 + tile_y*32
 
             sprite = tile.giveSprite(rotation)
 
             ret.append([sprite, x, y, tile_index])
 
-        if rotation_save is not None:
-            self.setRotation(rotation_save)
-
         return ret
 
     def createThumbnails(self):
@@ -1188,7 +1269,9 @@ class LargeScenery(RCTObject):
         for i, tile in enumerate(self.tiles):
             for view in range(4):
                 im = tile.images[view]
-                sprite = self.sprites.pop(im['path'], spr.Sprite(None, (0, 0), self.palette))
+                sprite = self.sprites.pop(im['path'], None)
+                if sprite is None:
+                    sprite = spr.Sprite(None, (0, 0), self.palette)
                 im['path'] = f'images/tile_{i}_im_{view}.png'
                 new_dict[im['path']] = sprite
                 new_list.append(im)
@@ -1209,45 +1292,55 @@ class LargeScenery(RCTObject):
         self.projectImageToTiles(im_paste, rotation, already_palettized=True)
 
     def projectImageToTiles(self, im_paste, rotation=None, already_palettized=False):
-        rotation_save = int(self.rotation)
+        """Splits an image of the size of the sprite bounding box into the tile sprites of the given view. Every
+        tile gets the pixels inside its column (see giveMask); overlapping columns share their pixels."""
+        if rotation is None:
+            rotation = self.rotation
 
-        if rotation is not None:
-            self.setRotation(rotation)
+        canvas = Image.new('RGBA', self.spriteBoundingBox())
+        canvas.paste(im_paste)
+        source = np.asarray(canvas)
 
-        for i, tile in enumerate(self.tiles):
-            im = Image.new('RGBA', self.spriteBoundingBox())
-            mask = self.giveMask(tile)
+        for tile in self.tiles:
+            (x0, y0), mask = self._tileMaskWindow(tile, rotation, source.shape)
+
+            window = source[y0:y0+mask.shape[0], x0:x0+mask.shape[1]].copy()
+            window[~mask] = 0
 
-            im.paste(im_paste, mask=mask)
-            bbox = mask.getbbox()
+            # the mask bounding box gives the tile sprite offsets as before, the sprite crops its image itself
+            rows = np.flatnonzero(mask.any(axis=1))
+            cols = np.flatnonzero(mask.any(axis=0))
+            bbox_x, bbox_y = x0 + int(cols[0]), y0 + int(rows[0])
 
             sprite_tile = spr.Sprite(
-                im, coords=(-bbox[0]-32, -bbox[1]-tile.h*8-15), palette=self.palette, already_palettized=already_palettized)
-            tile.setSprite(sprite_tile)
+                Image.fromarray(window, 'RGBA'), coords=(x0-bbox_x-32, y0-bbox_y-tile.h*8-15), palette=self.palette,
+                already_palettized=already_palettized)
+            tile.setSprite(sprite_tile, rotation)
 
-        self.setRotation(rotation_save)
+    def _tileMaskWindow(self, tile, rotation, shape):
+        # Top left corner in the sprite bounding box and column mask of a tile, both clipped to shape (rows, columns)
+        x_baseline, y_baseline = self.baseOffset(rotation)
 
-    def giveMask(self, tile):
-        x_baseline, y_baseline = self.baseOffset()
+        tile_x, tile_y = tile.coordinates(rotation)
+        x = x_baseline - tile_x*32+tile_y*32-32
+        y = y_baseline + tile_x*16+tile_y*16-tile.z*8 - 15 - tile.h*8
 
-        mask = Image.new('1', self.spriteBoundingBox())
-        draw = ImageDraw.Draw(mask)
+        mask = tileColumnMask(tile.h)
+        top, left = max(-y, 0), max(-x, 0)
+        bottom = min(mask.shape[0], shape[0]-y)
+        right = min(mask.shape[1], shape[1]-x)
 
-        x = x_baseline - tile.x*32+tile.y*32-32
-        y = y_baseline + tile.x*16+tile.y*16-tile.z*8
+        return (x+left, y+top), mask[top:max(bottom, top), left:max(right, left)]
 
-        for i in range(64):
-            if i < 32:
-                draw.line([(x+i, y-i//2-tile.h*8),
-                           (x+i, y+i//2)],
-                          fill=1, width=1)
-            else:
-                draw.line([(x+i, y-(63-i)//2-tile.h*8),
-                           (x+i, y+(63-i)//2)],
-                          fill=1, width=1)
+    def giveMask(self, tile, rotation=None):
+        width, height = self.spriteBoundingBox()
+        mask = np.zeros((height, width), dtype=bool)
+
+        (x, y), column = self._tileMaskWindow(tile, rotation, mask.shape)
+        mask[y:y+column.shape[0], x:x+column.shape[1]] = column
+
+        return Image.fromarray(mask)
 
-        return mask
-    
     def numTiles(self):
         return len(self.tiles)
 
@@ -1288,24 +1381,38 @@ class LargeScenery(RCTObject):
             dict_entry['clearance'] = clearance*8
 
         tile = self.Tile(self, dict_entry, images, self.rotation)
+        self._tile_index[(tile.x_orig, tile.y_orig)] = len(self.tiles)
         self.tiles.append(tile)
-        
+
 
     def removeTile(self, index):
         if index < 1:
             raise RuntimeError('Cannot remove anchor tile.')
 
         self.tiles.pop(index)
+        self._reindexTiles()
 
         self.updateImageList()
 
+    def _reindexTiles(self):
+        self._tile_index = {(tile.x_orig, tile.y_orig): i for i, tile in enumerate(self.tiles)}
+
     def getTile(self, coords):
         #corresponding in the original unrotated object space
-        for i, tile in enumerate(self.tiles):
-            if (tile.x_orig, tile.y_orig) == coords:
-                return tile, i
+        coords = tuple(coords)
+        if len(self._tile_index) != len(self.tiles):
+            # the tile list was changed directly
+            self._reindexTiles()
+
+        i = self._tile_index.get(coords)
+        if i is not None and (i >= len(self.tiles) or (self.tiles[i].x_orig, self.tiles[i].y_orig) != coords):
+            self._reindexTiles()
+            i = self._tile_index.get(coords)
+
+        if i is None:
+            return None, None
 
-        return None, None
+        return self.tiles[i], i
 
     def fillShape(self, x_length, y_length, base_x = 0, base_y = 0, dict_entry=None, clearance=0):
         # fill a rectangular shape with tiles, where base_x and base_y are the coordinates of the base (0,0) tile in tile grid coordinates from the desired footprint
@@ -1336,8 +1443,9 @@ class LargeScenery(RCTObject):
     def changeShape(self, width, length, height):
         # erase all tiles and set a rectangular shape
 
-        for i in range(1, len(self.tiles)):
-            self.removeTile(i)
+        self.tiles = self.tiles[:1]
+        self._reindexTiles()
+        self.updateImageList()
 
         self.tiles[0].h = height
 
@@ -1356,6 +1464,7 @@ class LargeScenery(RCTObject):
             tiles_copy.append(self.Tile(self, tile.giveDictEntry(), tile.images, rotation=self.rotation))
 
         self.tiles = tiles_copy
+        self._reindexTiles()
         self.updateImageList()
             
 
@@ -1373,13 +1482,15 @@ class LargeScenery(RCTObject):
             return self.value
 
     class Tile:
+        __slots__ = ('o', 'dict_entry', 'x_orig', 'y_orig', 'z', 'h', 'has_supports', 'allow_supports_above',
+                     'walls', 'corners', 'images', 'rotation')
+
         def __init__(self, o, dict_entry, images, rotation=0):
             self.o = o
 
             self.dict_entry = dict_entry
-            self.x = dict_entry['x']//32
+            # coordinates in unrotated object space, the rotated ones are given by x, y and coordinates()
             self.x_orig = dict_entry['x']//32
-            self.y = dict_entry['y']//32
             self.y_orig = dict_entry['y']//32
             self.z = dict_entry.get('z', 0)//8
             self.h = dict_entry['clearance']//8
@@ -1397,25 +1508,27 @@ class LargeScenery(RCTObject):
 
             self.images = images
 
-            self.rotation = 0
-            self.rotation_matrices = [
-                np.array([[1, 0], [0, 1]]),   # R^0
-                np.array([[0, 1], [-1, 0]]),  # R
-                np.array([[-1, 0], [0, -1]]),  # R^2
-                np.array([[0, -1], [1, 0]])   # R^3
-            ]
-
-            self.rotate(rotation)
+            self.rotation = rotation % 4
 
         def rotate(self, rot):
             self.rotation = (self.rotation + rot) % 4
 
-            rot_mat = self.rotation_matrices[rot % 4]
+        def coordinates(self, rotation=None):
+            """Tile coordinates in the given rotation (default: current rotation) of the object."""
+            if rotation is None:
+                rotation = self.rotation
+
+            a, b, c, d = TILE_ROTATIONS[rotation % 4]
+
+            return a*self.x_orig + b*self.y_orig, c*self.x_orig + d*self.y_orig
 
-            pos = np.array([self.x, self.y])
+        @property
+        def x(self):
+            return self.coordinates()[0]
 
-            pos = rot_mat.dot(pos)
-            self.x, self.y = int(pos[0]), int(pos[1])
+        @property
+        def y(self):
+            return self.coordinates()[1]
 
         def giveSprite(self, rotation=None):
             if isinstance(rotation, int):
@@ -1461,18 +1574,36 @@ class LargeScenery(RCTObject):
             return int(self.corners[0])+int(self.corners[1])*2 + int(self.corners[2])*4 + int(self.corners[3])*8
 
 
+def writeParkobj(filepath: str, members: dict, compression_level: int = None):
+    """Writes {archive name: bytes} as zip archive to filepath. The archive is written to a temporary file
+    next to it first and then renamed, so an existing file is never left half written."""
+    temp = f'{filepath}.tmp'
+    try:
+        with ZipFile(temp, mode='w', compression=ZIP_DEFLATED, compresslevel=compression_level) as archive:
+            for member, content in members.items():
+                archive.writestr(member, content)
+
+        replace(temp, filepath)
+    except BaseException:
+        if exists(temp):
+            remove(temp)
+        raise
+
+
 # Wrapper to load any object type and instantiate it as the correct subclass
 
-def load(filepath: str, openpath=OPENRCTPATH):
-    """Instantiates a new object from a .parkobj  or .dat file."""
+
+def load(filepath: str, openpath=OPENRCTPATH, lazy: bool = False):
+    """Instantiates a new object from a .parkobj  or .dat file. With lazy, sprites are only decoded on first
+    access, which is much faster if only the json data is needed."""
     extension = splitext(filepath)[1].lower()
 
     if extension == '.parkobj':
-        obj = RCTObject.fromParkobj(filepath, openpath)
+        obj = RCTObject.fromParkobj(filepath, openpath, lazy)
     elif extension == '.dat':
-        obj = RCTObject.fromDat(filepath)
+        obj = RCTObject.fromDat(filepath, lazy)
     elif extension == '.json':
-        obj = RCTObject.fromJson(filepath, openpath)
+        obj = RCTObject.fromJson(filepath, openpath, lazy)
     else:
         raise RuntimeError("Unsupported object file type.")
 
@@ -1486,9 +1617,40 @@ def load(filepath: str, openpath=OPENRCTPATH):
             f"Object type {obj_type} unsupported by now.")
 
 
-def loadFromId(identifier: str, openpath=OPENRCTPATH):
+def loadData(filepath: str):
+    """Returns the json data of a .parkobj or .DAT file without loading sprites, so objects of all types and
+    objects whose sprites are in the original DATs of OpenRCT2 can be read without OpenRCT2."""
+    if splitext(filepath)[1].lower() == '.dat':
+        return dat.loadDatObject(filepath, lazy=True)[0]
+
+    with ZipFile(filepath) as archive:
+        return loads(archive.read('object.json').decode('utf-8-sig'))
+
+
+def sizeFromData(data: dict):
+    """Size in game coordinates of a small or large scenery given by its json data, None for other types."""
+    object_type = data.get('objectType')
+    if object_type == Type.SMALL.value:
+        shape = data['properties'].get('shape', False)
+        shape = next((member for member in SmallScenery.Shape if member.fullname == shape),
+                     SmallScenery.Shape.QUARTER)
+        return SmallScenery.shapeSize(shape, data['properties']['height'])
+
+    if object_type == Type.LARGE.value:
+        tiles = [LargeScenery.Tile(o=None, dict_entry=tile, images=[]) for tile in data['properties']['tiles']]
+        return LargeScenery.tilesSize(tiles)
+
+    return None
+
+
+def loadFromId(identifier: str, openpath=OPENRCTPATH, library=None):
+    """Loads the DAT object with the given name from the OpenRCT2 object folder. If a library.ObjectLibrary
+    is given, objects that are not found there are looked up in its index by DAT name or id."""
     filepath = f'{openpath}/object/{identifier}.DAT'
 
+    if not exists(filepath) and library:
+        return library.load(identifier, openpath=openpath)
+
     if not exists(filepath):
         raise RuntimeError(f'Could not find DAT-object in specified OpenRCT2 path: \n \
                            "{filepath}"')
@@ -6,13 +6,25 @@
  * The program "Object Creator" and all subsequent modules are licensed
  * under the GNU General Public License version 3.
  *****************************************************************************
+
+Palettes and their compiled lookup tables.
+
+The compiled tables of each palette are cached as .npz files in COMPILED_PATH, by default
+~/.rctobject/palettes. Any process that uses a palette, including the worker processes of the command line
+tools, writes there when a file is missing or outdated. The environment variable RCTOBJECT_PALETTE_CACHE sets
+another folder, or turns the cache off if it is empty; the command line tools have the flag --no-palette-cache
+for this.
 """
 import numpy as np
 from PIL import Image
 from io import BytesIO
+from hashlib import sha256
+from os import makedirs, replace, remove, getpid, environ
+from os.path import join, expanduser
 from pkgutil import get_data
 
 import rctobject.palette_data as palette_data
+import rctobject.quantizer as qu
 
 
 class Palette(np.ndarray):
@@ -50,33 +62,27 @@ class Palette(np.ndarray):
     # def __repr__(self):
     #     return str(self.name)
 
-    def getColor(self, color: str):
-        if color == 'Pink':
-            color = '2nd Remap'
-        elif color == 'Yellow':
-            color = '3rd Remap'
+    def compiled(self):
+        """Returns the compiled lookup tables of this palette. On first use they are read from the cache folder
+        COMPILED_PATH, or compiled and written there if they are missing or belong to a different palette."""
+        compiled = _compiled.get(self.name)
+        if compiled is None:
+            compiled = _loadCompiled(self)
+            _compiled[self.name] = compiled
 
-        if color != 'Sparkles':
-            i = self.color_dict.get(color, -1)
-            if i > -1:
-                return self.__getitem__(i)
-        elif self.has_sparkles:
-            return self.sparkles
+        return compiled
 
-        return None
+    def getColor(self, color: str):
+        """Returns the (12,3) shades of a color, the sparkles for 'Sparkles' or None if the color is not in this
+        palette. The array is shared and read-only."""
+        return self.compiled().colors.get(canonicalColor(color))
 
     def getRemapColor(self, color_name: str):
+        """Returns the (12,3) shades shown for a remap color. The array is shared and read-only."""
         if color_name == '1st Remap':
             return self.getColor(color_name)
 
-        color = np.zeros((12, 3), dtype='uint8')
-
-        lookup = remap_lookup[remapColors()[color_name]]
-
-        for i in range(12):
-            color[i] = self[int(lookup[i][0]), int(lookup[i][1])]
-
-        return color
+        return self.compiled().remap_colors[remapColors()[color_name]]
 
     def getReducedArray(self, colors: list):
         ret = []
@@ -89,27 +95,312 @@ class Palette(np.ndarray):
     def arr(self):
         return np.array(self)
     
-    def giveShade(self, r,g,b,a):
-        if a == 0 or (r,g,b) == (0,0,0):
+    def giveShade(self, r, g, b, a):
+        """Returns (color, shade) of an RGBA color, None if it is transparent, black or not in this palette."""
+        if a == 0 or (r, g, b) == (0, 0, 0):
             return None
-        
+
+        return self.compiled().shade_index.get((r, g, b))
+
+    def shadeIndex(self):
+        """Returns the dict from RGB tuples to (color, shade) of this palette. A color that appears more than once
+        is given its first shade in the order of the palette rows, followed by the sparkles. Rows without a color
+        name are left out."""
+        return self.compiled().shade_index
+
+    def colorIndices(self, color: str):
+        """Returns the palette indices of all shades of a color, or None if the color is not in this palette.
+        Indices follow the layout of allColors(sparkles=True), so they are shared between all palettes."""
+        return self.compiled().color_indices.get(canonicalColor(color))
+
+    def remapIndices(self, color_name: str):
+        """Palette indices of the shades shown for a remap color, see getRemapColor."""
+        if color_name == '1st Remap':
+            return self.colorIndices(color_name)
+
+        return self.compiled().remap_table[remapColors()[color_name]]
+
+    def indexTable(self):
+        """Returns the (256,4) RGBA table of this palette. Index 0 and unused indices are transparent."""
+        return self.compiled().index_table
+
+    def keyTable(self):
+        """Returns the sorted 24-bit RGB keys of this palette, the slot of each palette index in these keys
+        (-1 for unused indices) and the last palette index of each key. Several indices share a slot if a
+        color appears more than once in the palette."""
+        compiled = self.compiled()
+        return compiled.keys, compiled.slot_of_index, compiled.last_index
+
+    def colorSlots(self):
+        """Returns a dict from the colors of this palette, including the sparkles, to the key slots of their
+        shades (see keyTable). A slot belongs to several colors if they share an RGB color."""
+        return self.compiled().color_slots
+
+    def histogram(self, data: np.ndarray):
+        """Counts the visible pixels of each color of this palette in an (h,w,4) RGBA array in one pass.
+        Returns a dict from the colors that appear to their pixel count; pixels with an RGB color that several
+        palette colors share count for each of them."""
+        slots, found = self.lookupSlots(data)
+        return self._slotHistogram(np.bincount(slots[found], minlength=len(self.keyTable()[0])))
+
+    def indexHistogram(self, indices: np.ndarray):
+        """Same as histogram for an array of palette indices."""
+        counts = np.bincount(indices.ravel(), minlength=256)
+        slot_of_index = self.keyTable()[1]
+        present = (slot_of_index >= 0) & (counts > 0)
+
+        return self._slotHistogram(
+            np.bincount(slot_of_index[present], weights=counts[present], minlength=len(self.keyTable()[0])))
+
+    def _slotHistogram(self, slot_counts: np.ndarray):
+        histogram = {}
+        for color, slots in self.colorSlots().items():
+            count = int(slot_counts[slots].sum())
+            if count:
+                histogram[color] = count
+
+        return histogram
+
+    def hashTable(self):
+        """Returns a multiplier and bucket table that hash the keys of this palette (see keyTable) without
+        collisions: the slot of a key is buckets[(key*multiplier mod 2^32) >> (32-HASH_BITS)]. Buckets without
+        a key point to slot 0, so the key of the slot has to be compared."""
+        compiled = self.compiled()
+        return compiled.multiplier, compiled.buckets
+
+    def lookupSlots(self, data: np.ndarray):
+        """Looks up the key slots of an (h,w,4) RGBA array by packing each pixel into a 24-bit key.
+        Returns the slot array and the mask of visible pixels that have a palette color."""
+        keys = self.keyTable()[0]
+        multiplier, table = self.hashTable()
+        pixel_keys = packRGB(data)
+
+        slots = table[(pixel_keys * multiplier) >> np.uint32(32 - HASH_BITS)]
+        found = (keys[slots] == pixel_keys) & (data[:, :, 3] != 0)
+
+        return slots, found
+
+    def lookupIndices(self, data: np.ndarray):
+        """Looks up the palette indices of an (h,w,4) RGBA array. Colors that appear more than once in the
+        palette are given their last index. Returns the index array and the mask of found pixels."""
+        slots, found = self.lookupSlots(data)
+        indices = np.where(found, self.keyTable()[2][slots], TRANSPARENT_INDEX).astype(np.uint8)
+
+        return indices, found
+
+    def toIndices(self, image: Image.Image):
+        """Converts an RGBA image to an array of palette indices.
+        Returns the index array and whether the conversion was lossless, i.e. every visible pixel is an opaque
+        palette color."""
+        data = np.asarray(image.convert('RGBA'))
+        indices, found = self.lookupIndices(data)
+        alpha = data[:, :, 3]
+
+        exact = bool(np.all((found & (alpha == 255)) | (alpha == 0)))
+
+        return indices, exact
+
+    def fromIndices(self, indices: np.ndarray):
+        """Materializes an array of palette indices as RGBA image."""
+        return Image.fromarray(np.take(self.indexTable(), indices, axis=0), 'RGBA')
+
+
+class CompiledPalette:
+    """Lookup tables of a palette, computed once when the palette is first used.
+
+    The tables are read-only numpy arrays. Besides the index, key and hash tables used to convert images to
+    palette indices, they hold the shades of all remap colors, tables that shift the shades of all colors by a
+    brightness step or invert them, and the tables that switch images to other palettes. The arrays can be
+    written to a small binary file with save and loaded back with load, which checks that the palette did not
+    change; Palette.compiled keeps them in such files in COMPILED_PATH."""
+
+    # arrays that are stored by save, all other attributes are derived from them and the palette
+    ARRAYS = ('color_of_index', 'index_table', 'keys', 'slot_of_index', 'last_index', 'multiplier', 'buckets',
+              'remap_colors', 'remap_table', 'brightness', 'inverted')
+
+    def __init__(self, palette: Palette, arrays: dict = None):
+        self.name = palette.name
+        self.digest = paletteDigest(palette)
+
+        # colors by name; aliases and rows outside of the palette data are left out
+        data = np.array(palette)
+        rows = {row: name for name, row in palette.color_dict.items()
+                if canonicalColor(name) == name and 0 <= row < len(data)}
+        self.colors = {name: data[row] for row, name in sorted(rows.items())}
+        if palette.has_sparkles:
+            self.colors['Sparkles'] = np.array(palette.sparkles, dtype=np.uint8)
+
+        # index layout of allColors(sparkles=True), colors outside of it get no indices
+        layout = {name: 1 + 12*allColors()[name] for name in self.colors if name in allColors()}
+        if palette.has_sparkles:
+            layout['Sparkles'] = SPARKLES_INDEX
+        self.names = list(layout)
+
+        if arrays is None:
+            arrays = self._compile(palette, rows, data, layout)
+        for name in self.ARRAYS:
+            array = np.array(arrays[name])
+            array.setflags(write=False)
+            setattr(self, name, array)
+
+        # views derived from the arrays
+        self.color_indices = {}
+        for number, name in enumerate(self.names):
+            indices = np.flatnonzero(self.color_of_index == number).astype(np.uint8)
+            indices.setflags(write=False)
+            self.color_indices[name] = indices
+
+        for colors in self.colors.values():
+            colors.setflags(write=False)
+
+        self.color_slots = {name: np.unique(self.slot_of_index[indices])
+                            for name, indices in self.color_indices.items()}
+
+        self.shade_index = {}
+        for name, colors in self.colors.items():
+            for shade, rgb in enumerate(colors):
+                self.shade_index.setdefault(tuple(int(c) for c in rgb), (name, shade))
+
+        self._switch_tables = {}
+
+    def _compile(self, palette: Palette, rows: dict, data: np.ndarray, layout: dict):
+        arrays = {}
+
+        color_of_index = np.full(256, -1, dtype=np.int16)
+        index_table = np.zeros((256, 4), dtype=np.uint8)
+        for number, (name, base) in enumerate(layout.items()):
+            shades = len(self.colors[name])
+            color_of_index[base:base+shades] = number
+            index_table[base:base+shades, :3] = self.colors[name]
+            index_table[base:base+shades, 3] = 255
+        arrays['color_of_index'] = color_of_index
+        arrays['index_table'] = index_table
+
+        present = np.flatnonzero(index_table[:, 3])
+        keys, slots = np.unique(packRGB(index_table[present]), return_inverse=True)
+        slot_of_index = np.full(256, -1, dtype=np.int16)
+        slot_of_index[present] = slots.reshape(-1)
+        last_index = np.zeros(len(keys), dtype=np.uint8)
+        last_index[slot_of_index[present]] = present
+        arrays.update(keys=keys.astype(np.uint32), slot_of_index=slot_of_index, last_index=last_index)
+
+        rng = np.random.default_rng(0)
+        while True:
+            multiplier = np.uint32(rng.integers(1, 1 << 32) | 1)
+            buckets = (arrays['keys'] * multiplier) >> np.uint32(32 - HASH_BITS)
+            if len(np.unique(buckets)) == len(keys):
+                break
+        table = np.zeros(1 << HASH_BITS, dtype=np.int16)
+        table[buckets] = np.arange(len(keys))
+        arrays.update(multiplier=multiplier, buckets=table)
+
+        # remap shades by remap number; indices are 0 where a shade lies in a row without color
+        remap_colors = np.zeros((len(remap_lookup), 12, 3), dtype=np.uint8)
+        remap_table = np.zeros((len(remap_lookup), 12), dtype=np.uint8)
+        for number, lookup in enumerate(remap_lookup):
+            for i, (row, shade) in enumerate(lookup):
+                if row < len(data):
+                    remap_colors[number, i] = data[row, shade]
+            if all(rows.get(int(row)) in layout for row, _ in lookup):
+                remap_table[number] = [layout[rows[int(row)]] + shade for row, shade in lookup]
+        arrays.update(remap_colors=remap_colors, remap_table=remap_table)
+
+        # brightness[MAX_SHADES-1+step] shifts every color by step shades, clipped to the ends of its ramp
+        max_shades = max((len(self.colors[name]) for name in layout), default=1)
+        brightness = np.tile(np.arange(256, dtype=np.uint8), (2*max_shades-1, 1))
+        inverted = np.arange(256, dtype=np.uint8)
+        for name, base in layout.items():
+            ind = np.arange(base, base+len(self.colors[name]), dtype=np.uint8)
+            for step in range(-max_shades+1, max_shades):
+                brightness[max_shades-1+step, ind] = ind[np.clip(np.arange(len(ind))+step, 0, len(ind)-1)]
+            inverted[ind] = ind[::-1]
+        arrays.update(brightness=brightness, inverted=inverted)
+
+        return arrays
+
+    def colorMask(self, color: str or list):
+        """Boolean table over the 256 palette indices, True for the shades of the given colors."""
+        if isinstance(color, str):
+            color = [color]
+
+        mask = np.zeros(256, dtype=bool)
+        for color_name in color:
+            indices = self.color_indices.get(canonicalColor(color_name))
+            if indices is not None:
+                mask[indices] = True
+
+        return mask
+
+    def brightnessLut(self, step: int):
+        """Table that shifts all colors by step shades."""
+        max_step = (len(self.brightness) - 1) // 2
+        return self.brightness[max_step + int(np.clip(step, -max_step, max_step))]
+
+    def switchTable(self, palette_out: Palette):
+        """Returns the palette index in palette_out for each key slot of this palette, 0 where the color does not
+        switch: colors that are missing in palette_out and sparkles unless both palettes have them."""
+        table = self._switch_tables.get(palette_out.name)
+        if table is None:
+            out = palette_out.compiled()
+            table = self.last_index.copy()
+            table[out.index_table[table, 3] == 0] = TRANSPARENT_INDEX
+            if 'Sparkles' not in self.color_indices or 'Sparkles' not in out.color_indices:
+                table[table >= SPARKLES_INDEX] = TRANSPARENT_INDEX
+            table.setflags(write=False)
+            self._switch_tables[palette_out.name] = table
+
+        return table
+
+    def save(self, file):
+        """Writes the tables to a path or file object."""
+        np.savez(file, digest=np.array(self.digest), **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, file, palette: Palette):
+        """Reads tables written by save. Raises ValueError if they were compiled from a different palette."""
+        with np.load(file) as stored:
+            if str(stored['digest']) != paletteDigest(palette):
+                raise ValueError(f'Compiled tables do not belong to palette {palette.name}.')
+            return cls(palette, {name: stored[name] for name in cls.ARRAYS})
+
+
+def _loadCompiled(palette: Palette):
+    if not COMPILED_PATH:
+        return CompiledPalette(palette)
+
+    path = join(COMPILED_PATH, f'{palette.name}.npz')
+    try:
+        return CompiledPalette.load(path, palette)
+    except Exception:
+        # missing, outdated or broken cache files are compiled again
+        pass
+
+    compiled = CompiledPalette(palette)
+    # worker processes may write at the same time, each one replaces the file as a whole
+    tmp_path = f'{path}.{getpid()}.tmp'
+    try:
+        makedirs(COMPILED_PATH, exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            compiled.save(file)
+        replace(tmp_path, path)
+    except OSError:
         try:
-            arr = self.arr()
-            red, green, blue = arr[:, :, 0], arr[:, :, 1], arr[:, :, 2]
-            truth_arr = (red == r) & (green == g) & (blue == b)
-            index = list(truth_arr.flatten()).index(True)
-            color = list(self.color_dict.keys())[index//12]
-            index = index % 12
-        except ValueError:
-            if not self.has_sparkles:
-                return None
-            arr = self.sparkles
-            red, green, blue = arr[:, 0], arr[:, 1], arr[:, 2]
-            truth_arr = (red == r) & (green == g) & (blue == b)
-            index = list(truth_arr.flatten()).index(True)
-            color = 'Sparkles'
-
-        return (color, index)
+            remove(tmp_path)
+        except OSError:
+            pass
+
+    return compiled
+
+
+def paletteDigest(palette: Palette):
+    """Hash of everything the compiled tables of a palette depend on."""
+    digest = sha256(f'{COMPILED_VERSION}|{palette.name}|{sorted(palette.color_dict.items())}'.encode())
+    digest.update(np.ascontiguousarray(palette, dtype=np.uint8).tobytes())
+    if palette.has_sparkles:
+        digest.update(np.ascontiguousarray(palette.sparkles, dtype=np.uint8).tobytes())
+    digest.update(remap_lookup.tobytes())
+
+    return digest.hexdigest()
 
 
 def allColors(sparkles=False):
@@ -200,9 +491,41 @@ def remapColors():
             'Bright Pink': 31}
 
 
+def canonicalColor(color: str):
+    """Returns the palette color of the names Pink and Yellow of the 2nd and 3rd remap."""
+    if color == 'Pink':
+        return '2nd Remap'
+    if color == 'Yellow':
+        return '3rd Remap'
+
+    return color
+
+
+def packRGB(data: np.ndarray):
+    """Packs the RGB channels of an (..., 3 or 4) array into 24-bit integer keys."""
+    data = data.astype(np.uint32)
+    return (data[..., 0] << 16) | (data[..., 1] << 8) | data[..., 2]
+
+
 remap_lookup = np.load(
     BytesIO(get_data("rctobject", "data/remap_mapping.npy"))).astype('uint8')
 
+# Index layout of palette index arrays: 0 is transparent, then 12 shades per color in the
+# order of allColors() and the sparkles at the end.
+TRANSPARENT_INDEX = 0
+SPARKLES_INDEX = 1 + 12*len(allColors())
+
+# Size of the hash table of palette keys, see Palette.hashTable
+HASH_BITS = 14
+
+# Part of the digest of compiled palettes, to be increased when the compiled tables change
+COMPILED_VERSION = 1
+
+# Cache folder of compiled palettes, None to always compile them; see the module description
+COMPILED_PATH = environ.get('RCTOBJECT_PALETTE_CACHE', join(expanduser('~'), '.rctobject', 'palettes')) or None
+
+_compiled = {}
+
 complete_palette_array = palette_data.complete_palette_array
 
 green_remap = Palette(palette_data.rct_data, allColors(), 'green_remap',
@@ -239,69 +562,41 @@ def switchPalette(image: Image.Image, pal_in: Palette, pal_out: Palette):
            pal_out;  palette in (20,12,3) shape to which you want to convert
     """
 
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
-    include_sparkles = pal_in.has_sparkles and pal_out.has_sparkles
-
-    colors = allColors(include_sparkles).keys()
-
-    for colorname in colors:
-        color_old = pal_in.getColor(colorname)
-        color_new = pal_out.getColor(colorname)
+    data = np.array(image.convert('RGBA'))
 
-        for i in range(len(color_old)):
+    # Both palettes share the index layout, so the switch is a single lookup in and out
+    slots, found = pal_in.lookupSlots(data)
+    targets = pal_in.compiled().switchTable(pal_out)[slots]
+    found &= targets != TRANSPARENT_INDEX
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
+    data[found, :3] = pal_out.indexTable()[targets[found], :3]
 
-    return Image.fromarray(data_out)
+    return Image.fromarray(data)
 
 # def generatePalette(image):
 
 
 def addPalette(image, palette: Palette = orct, dither=True, transparent_color=(0, 0, 0),
                selected_colors=None, alpha_threshold=0):
+    """Converts image to the colors of the palette. dither is 'floyd-steinberg', 'ordered' (Bayer) or 'none';
+    True and False stand for 'floyd-steinberg' and 'none'."""
     # If no transparent_color is given we choose the color from (0,0) pixel
     if not transparent_color:
         transparent_color = image.getpixel((0, 0))[:3]
 
     mask = alphaMask(image, transparent_color, alpha_threshold)
-    image = image.convert('RGB')
 
     # If no selected_colors is given we use the entire palette
     if not selected_colors:
         selected_colors = list(palette.color_dict.keys())
         if palette.has_sparkles:
             selected_colors.append('Sparkles')
-    
-    pal_in = palette.getReducedArray(selected_colors)
-
-    if pal_in.size > 0:
-        pal_in = pal_in.reshape(-1, pal_in.shape[-1])
-    else:
-        pal_in = np.array([[]])
-
-    if 'Sparkles' in selected_colors and palette.has_sparkles:
-        pal_in = np.concatenate((pal_in, palette.sparkles))
-    elif 'Sparkles' in selected_colors:
-        raise RuntimeError(
-            'Asked to include sparkles but given palette has no sparkles.')
-
-    pal_in = np.append(np.zeros((256-len(pal_in), 3)), pal_in, axis=0)
-    pal_in = np.uint8(pal_in.flatten()).tolist()
-    p = Image.new("P", (1, 1))
-    p.putpalette(pal_in)
 
-    dither_type = Image.FLOYDSTEINBERG if dither else Image.NONE
-    image = image.quantize(method=3, palette=p,
-                           dither=dither_type).convert('RGBA')
+    quantizer = qu.getQuantizer(palette, selected_colors)
+    data = quantizer.toRGBA(quantizer.indices(np.asarray(image.convert('RGB')), dither))
+    data[mask] = 0
 
-    return removeColorOnMask(image, mask)
+    return Image.fromarray(data, 'RGBA')
 
 
 def alphaToColor(image: Image.Image, color=(0, 0, 0)):
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Headless batch conversion of rendered images to palette images, as the editor does when importing sprites.
+
+Run as: python -m rctobject palettize INPUT OUTPUT [--dither MODE] [--jobs N] [--force]
+"""
+
+from os import makedirs
+from os.path import splitext, exists, getmtime, dirname
+
+import rctobject.batch as batch
+import rctobject.palette as pal
+import rctobject.quantizer as qu
+import rctobject.sprites as spr
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.gif', '.jpg', '.jpeg', '.tga', '.tif', '.tiff')
+
+PALETTES = {'orct': pal.orct, 'old_objm': pal.old_objm}
+
+
+def find_images(input_path: str, exclude: str = None):
+    """Returns the image files below input_path."""
+    return batch.find_files(input_path, lambda file: splitext(file)[1].lower() in IMAGE_EXTENSIONS, exclude)
+
+
+def output_path(filepath: str, input_path: str, output_dir: str):
+    """Output png path, the relative folder structure of the input is kept."""
+    return f'{batch.output_path(splitext(filepath)[0], input_path, output_dir)}.png'
+
+
+def is_up_to_date(filepath: str, target: str):
+    return exists(target) and getmtime(target) >= getmtime(filepath)
+
+
+def palettize_file(filepath: str, target: str, palette: str = 'orct', dither='floyd-steinberg',
+                   transparent_color: tuple = (0, 0, 0), selected_colors: list = None, alpha_threshold: int = 0):
+    """Palettizes a single image. The output has the size of the input, so the position of a render on its
+    canvas is kept. Returns (filepath, status, message) with status 'converted' or 'failed'."""
+    try:
+        image = pal.addPalette(spr.openImage(filepath), PALETTES[palette], dither=dither,
+                               transparent_color=transparent_color, selected_colors=selected_colors,
+                               alpha_threshold=alpha_threshold)
+
+        makedirs(dirname(target) or '.', exist_ok=True)
+        image.save(target)
+    except Exception as e:
+        return filepath, 'failed', f'{type(e).__name__}: {e}'
+
+    return filepath, 'converted', ''
+
+
+def palettize_tree(input_path: str, output_dir: str, jobs: int = None, force: bool = False, palette: str = 'orct',
+                   dither='floyd-steinberg', transparent_color: tuple = (0, 0, 0), selected_colors: list = None,
+                   alpha_threshold: int = 0, report=print):
+    """Palettizes all images below input_path into output_dir, see batch.run_batch. Images with the same output,
+    e.g. foo.png and foo.bmp, fail instead of overwriting each other."""
+    # fail early on unknown modes instead of once per file
+    dither = qu.ditherMode(dither)
+
+    tasks = [(filepath, output_path(filepath, input_path, output_dir), palette, dither, transparent_color,
+              selected_colors, alpha_threshold)
+             for filepath in find_images(input_path, exclude=output_dir)]
+
+    return batch.run_batch(palettize_file, tasks, jobs=jobs, force=force, is_up_to_date=is_up_to_date,
+                           report=report)
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser(
+        'palettize', help='Convert rendered images to the object palette, as the editor does on import.')
+    parser.add_argument('input', help='Image file or folder that is searched recursively.')
+    parser.add_argument('output', help='Output folder, the input folder structure is kept.')
+    parser.add_argument('--dither', default='floyd-steinberg', choices=qu.DITHER_MODES,
+                        help="Dither mode (default: floyd-steinberg). 'ordered' gives reproducible results where "
+                             "changes of the source only change the output locally.")
+    parser.add_argument('--palette', default='orct', choices=sorted(PALETTES),
+                        help='Palette the images are converted to (default: orct).')
+    parser.add_argument('--colors', nargs='+', default=None, metavar='COLOR',
+                        help="Palette colors to use, e.g. '1st Remap' Sparkles (default: all colors).")
+    parser.add_argument('--transparent-color', type=int, nargs=3, default=(0, 0, 0), metavar=('R', 'G', 'B'),
+                        help='Color that is made transparent (default: 0 0 0).')
+    parser.add_argument('--alpha-threshold', type=int, default=0,
+                        help='Pixels with an alpha value up to this are made transparent (default: 0).')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs).')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert files even if their output is newer than the input.')
+    parser.set_defaults(func=main)
+
+
+def main(args):
+    summary = palettize_tree(args.input, args.output, jobs=args.jobs, force=args.force, palette=args.palette,
+                             dither=args.dither, transparent_color=tuple(args.transparent_color),
+                             selected_colors=args.colors, alpha_threshold=args.alpha_threshold)
+
+    return batch.print_summary(summary, 'images')
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Quantization of images to a palette with compiled, cached lookup tables.
+
+A Quantizer holds everything addPalette needs for one palette and color selection: the 256 entry table and
+palette image that PIL's Floyd-Steinberg dithering works with, and a cube of the nearest entry of each color
+cell. The cube has 64 cells per channel and is filled lazily for the cells that appear in images. Like PIL's
+palette cache, the nearest entry of a cell is the one nearest to its lower corner (lowest entry on ties), so
+undithered and Floyd-Steinberg results are the same as with Image.quantize.
+
+Ordered dithering is Knoll's pattern dithering: every color cell gets a mix of 16 entries whose average is its
+color, found by repeatedly taking the nearest entry of the color plus the error so far, and sorted by luminance.
+A pixel takes the entry of its cell's mix that the 8x8 Bayer matrix picks at its position. The mixes are filled
+lazily like the cube, so a pixel costs one lookup. Each pixel only depends on its own color and position, so a
+local change of the source only changes the sprite there.
+"""
+
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+CUBE_BITS = 6
+_SHIFT = 8 - CUBE_BITS
+
+# Number of compiled quantizers that are kept
+CACHE_SIZE = 8
+
+DITHER_MODES = ('floyd-steinberg', 'ordered', 'none')
+BAYER_SIZE = 8
+MIX_SIZE = 16
+
+_LUMINANCE = np.array([299, 587, 114], dtype=np.int32)
+
+_quantizers = OrderedDict()
+
+
+def bayerMatrix(size: int = BAYER_SIZE):
+    """Returns the (size,size) Bayer matrix, which holds each of 0 to size*size-1 once. size has to be a power
+    of two."""
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4*matrix, 4*matrix + 2], [4*matrix + 3, 4*matrix + 1]])
+
+    return matrix
+
+
+# entry of a mix that is taken at each position of the Bayer matrix
+_RANKS = bayerMatrix() * MIX_SIZE // BAYER_SIZE**2
+
+
+def ditherMode(dither):
+    """Returns the name of a dither mode. For backwards compatibility True stands for Floyd-Steinberg and False
+    or None for no dithering."""
+    if dither is True:
+        return 'floyd-steinberg'
+    if dither is False or dither is None:
+        return 'none'
+    if dither not in DITHER_MODES:
+        raise ValueError(f'Unknown dither mode {dither!r}, expected one of {", ".join(DITHER_MODES)}.')
+
+    return dither
+
+
+class Quantizer:
+    def __init__(self, palette, selected_colors: list):
+        """Compiles the palette entries of the selected colors. The entries are put at the end of the table
+        after black padding entries, as addPalette always did."""
+        colors = [palette.getColor(color) for color in selected_colors if color != 'Sparkles']
+        rows = np.array([color for color in colors if color is not None], dtype=np.uint8).reshape(-1, 3)
+
+        if 'Sparkles' in selected_colors:
+            if not palette.has_sparkles:
+                raise RuntimeError(
+                    'Asked to include sparkles but given palette has no sparkles.')
+            rows = np.concatenate((rows, palette.sparkles.astype(np.uint8)))
+
+        self.table = np.zeros((256, 3), dtype=np.uint8)
+        self.table[256-len(rows):] = rows
+
+        rgba = np.full((256, 4), 255, dtype=np.uint8)
+        rgba[:, :3] = self.table
+        # one 32 bit word per entry, so that materializing is a single lookup
+        self._rgba_words = rgba.view(np.uint32).reshape(256)
+
+        self.palette_image = Image.new('P', (1, 1))
+        self.palette_image.putpalette(self.table.flatten().tolist())
+
+        # only the first entry of every distinct color can be nearest, ties go to the lowest entry
+        _, first = np.unique(self.table, axis=0, return_index=True)
+        self.candidates = np.sort(first)
+
+        self.cube = np.full(1 << 3*CUBE_BITS, -1, dtype=np.int16)
+
+        # mixes of the cells for ordered dithering, allocated on first use
+        self.mixes = None
+        self._mixed = None
+
+    def _cells(self, data: np.ndarray):
+        cells = (data[..., 0] >> _SHIFT).astype(np.int32) << 2*CUBE_BITS
+        cells |= (data[..., 1] >> _SHIFT).astype(np.int32) << CUBE_BITS
+        cells |= data[..., 2] >> _SHIFT
+        return cells
+
+    def _fill(self, missing: np.ndarray):
+        mask = (1 << CUBE_BITS) - 1
+        corners = (np.stack((missing >> 2*CUBE_BITS, (missing >> CUBE_BITS) & mask, missing & mask),
+                            axis=-1) << _SHIFT).astype(np.float32)
+        colors = self.table[self.candidates].astype(np.float32)
+        norms = (colors**2).sum(axis=1)
+
+        # squared distances without the constant |corner|^2, all terms are integers below 2^24 and thus exact
+        for start in range(0, len(missing), 16384):
+            distances = norms - 2*(corners[start:start+16384] @ colors.T)
+            self.cube[missing[start:start+16384]] = self.candidates[distances.argmin(axis=1)]
+
+    def _lookup(self, data: np.ndarray):
+        cells = self._cells(data)
+        indices = self.cube[cells]
+
+        unset = indices < 0
+        if unset.any():
+            self._fill(np.unique(cells[unset]))
+            indices = self.cube[cells]
+
+        return indices.astype(np.uint8)
+
+    def _fillMixes(self, missing: np.ndarray):
+        mask = (1 << CUBE_BITS) - 1
+        goals = (np.stack((missing >> 2*CUBE_BITS, (missing >> CUBE_BITS) & mask, missing & mask),
+                          axis=-1) << _SHIFT) + (1 << _SHIFT) // 2
+        error = np.zeros(goals.shape, dtype=np.int32)
+        mixes = np.empty((len(missing), MIX_SIZE), dtype=np.uint8)
+
+        for i in range(MIX_SIZE):
+            attempts = np.clip(goals + error, 0, 255).astype(np.uint8)
+            mixes[:, i] = self._lookup(attempts)
+            error += goals - self.table[mixes[:, i]]
+
+        luminance = self.table[mixes].astype(np.int32) @ _LUMINANCE
+        self.mixes[missing] = np.take_along_axis(mixes, np.argsort(luminance, axis=1, kind='stable'), axis=1)
+        self._mixed[missing] = True
+
+    def _ordered(self, data: np.ndarray):
+        if self.mixes is None:
+            self.mixes = np.zeros((1 << 3*CUBE_BITS, MIX_SIZE), dtype=np.uint8)
+            self._mixed = np.zeros(1 << 3*CUBE_BITS, dtype=bool)
+
+        cells = self._cells(data)
+        unmixed = ~self._mixed[cells]
+        if unmixed.any():
+            self._fillMixes(np.unique(cells[unmixed]))
+
+        height, width = data.shape[:2]
+        ranks = np.tile(_RANKS, (-(-height // BAYER_SIZE), -(-width // BAYER_SIZE)))[:height, :width]
+
+        cells *= MIX_SIZE
+        cells += ranks
+        return self.mixes.ravel()[cells]
+
+    def indices(self, data: np.ndarray, dither=True):
+        """Returns the table entry of every pixel of an (h,w,3) RGB array. dither is one of DITHER_MODES, True
+        for 'floyd-steinberg' or False for 'none'."""
+        mode = ditherMode(dither)
+        if mode == 'floyd-steinberg':
+            image = Image.fromarray(np.ascontiguousarray(data), 'RGB')
+            return np.asarray(image.quantize(palette=self.palette_image, dither=Image.FLOYDSTEINBERG))
+        if mode == 'ordered':
+            return self._ordered(data)
+
+        return self._lookup(data)
+
+    def toRGBA(self, indices: np.ndarray):
+        """Returns the opaque (h,w,4) RGBA array of table entries."""
+        return self._rgba_words[indices].view(np.uint8).reshape(indices.shape + (4,))
+
+
+def getQuantizer(palette, selected_colors: list):
+    """Returns the compiled quantizer of a palette and color selection, compiling it on first use."""
+    key = (palette.name, tuple(selected_colors))
+    quantizer = _quantizers.get(key)
+    if quantizer is None:
+        quantizer = Quantizer(palette, selected_colors)
+        _quantizers[key] = quantizer
+        if len(_quantizers) > CACHE_SIZE:
+            _quantizers.popitem(last=False)
+    else:
+        _quantizers.move_to_end(key)
+
+    return quantizer
@@ -10,13 +10,34 @@
 import numpy as np
 from PIL import Image
 from copy import copy
+from io import BytesIO
+from collections import OrderedDict
+from itertools import count
 import rctobject.palette as pal
 
+_versions = count(1)
+
+# Number of remap combinations kept per sprite by Sprite.show
+SHOW_CACHE_SIZE = 8
+
+# Attributes of a lazy sprite (see Sprite.fromLoader) that are only known once its image is decoded
+_LAZY_ATTRIBUTES = frozenset(('_image', '_indices', '_base', 'x', 'y', 'x_base', 'y_base'))
+
 
 class Sprite:
-    def __init__(self, image: Image.Image, coords: tuple = None, palette: pal.Palette = pal.orct, dither: bool = True,
+    def __init__(self, image: Image.Image, coords: tuple = None, palette: pal.Palette = pal.orct, dither=True,
                  transparent_color: tuple = (0, 0, 0), selected_colors: list = None, alpha_threshold: int = 0,
-                 auto_offset_mode: str = 'bottom', offset: tuple = None, already_palettized: bool = False):
+                 auto_offset_mode: str = 'bottom', offset: tuple = None, already_palettized: bool = False,
+                 indexed: bool = False):
+        """A sprite is an image with offset. If indexed is set, the image is stored as array of palette indices
+        whenever it consists of palette colors only and the RGBA image is only materialized on access.
+        dither is the dither mode used to palettize the image, see palette.addPalette."""
+
+        self.palette = palette
+        self.indexed = indexed
+        self.version = 0
+        self._show_cache = OrderedDict()
+        self._histogram = None
 
         if image:
             if not already_palettized:
@@ -26,7 +47,7 @@ class Sprite:
             image = Image.new('RGBA', (1, 1))
 
         self.image = image
-        self.image_base = image
+        self._base = (self._image, self._indices)
         if coords:
             self.x, self.y = coords
             self.x_base, self.y_base = coords
@@ -50,19 +71,96 @@ class Sprite:
 
         self.crop()
 
-        self.palette = palette
+    @classmethod
+    def fromLoader(cls, load, coords: tuple = None, palette: pal.Palette = pal.orct, indexed: bool = False):
+        """Instantiates a lazy sprite. load() has to return an already palettized RGBA image and is only called
+        when the image or offsets are first accessed; the sprite then equals Sprite(load(), coords)."""
+        sprite = _LazySprite.__new__(_LazySprite)
+        sprite.palette = palette
+        sprite.indexed = indexed
+        sprite.version = 0
+        sprite._show_cache = OrderedDict()
+        sprite._histogram = None
+        sprite._loader = (cls, load, coords, (0, 0))
+        return sprite
+
+    def isLoaded(self):
+        return '_loader' not in self.__dict__
+
+    def load(self):
+        """Decodes the image of a lazy sprite, does nothing if it is loaded already."""
+        if '_loader' not in self.__dict__:
+            return
+
+        # the sprite turns into a regular sprite, so the attribute hooks of _LazySprite are gone after loading
+        cls, load, coords, shift = self.__dict__.pop('_loader')
+        self.__class__ = cls
+        self.__init__(load(), coords, self.palette, already_palettized=True, indexed=self.indexed)
+        if shift != (0, 0):
+            self.shiftOffsets(*shift)
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = self.palette.fromIndices(self._indices)
+        return self._image
+
+    @image.setter
+    def image(self, image: Image.Image):
+        self._imageChanged()
+        self._image = image
+        self._indices = None
+
+        if self.indexed:
+            indices, exact = self.palette.toIndices(image)
+            if exact:
+                self._image = None
+                self._indices = indices
+
+    @property
+    def image_base(self):
+        image, indices = self._base
+        return image if image is not None else self.palette.fromIndices(indices)
+
+    @property
+    def indices(self):
+        """Palette index array of the sprite, None if the sprite is not stored indexed."""
+        return self._indices
+
+    def isIndexed(self):
+        return self._indices is not None
+
+    def setIndices(self, indices: np.ndarray):
+        self._imageChanged()
+        self._image = None
+        self._indices = indices
+
+    def _imageChanged(self):
+        # versions are unique over all sprites, so shallow copies never share a valid cache entry
+        self.version = next(_versions)
+        self.invalidateCache()
+
+    def invalidateCache(self):
+        """Drops all rendered remap images of Sprite.show."""
+        self._show_cache = OrderedDict()
+
+    def compact(self):
+        """Drops the materialized RGBA image of an indexed sprite."""
+        if self._indices is not None:
+            self._image = None
 
     @classmethod
-    def fromFile(cls, path: str, coords: tuple = None, palette: pal.Palette = pal.orct, dither: bool = True,
+    def fromFile(cls, path: str, coords: tuple = None, palette: pal.Palette = pal.orct, dither=True,
                  transparent_color: tuple = (0, 0, 0), selected_colors: list = None, alpha_threshold: int = 0,
                  auto_offset_mode: str = 'bottom', offset: tuple = None, already_palettized: bool = False):
         """Instantiates a new Sprite from an image file."""
-        image = Image.open(path).convert('RGBA')
+        image = openImage(path)
         return cls(
             image=image, coords=coords, palette=palette, dither=dither, transparent_color=transparent_color,
             selected_colors=selected_colors, alpha_threshold=alpha_threshold, auto_offset_mode=auto_offset_mode, offset=offset, already_palettized=already_palettized)
 
-    def save(self, path: str, keep_palette: bool = False, index_color=False):
+    def save(self, path, keep_palette: bool = False, index_color=False, format: str = None):
+        """Saves the sprite image to a path or file object. For file objects the format (e.g. 'PNG') has to be given."""
         # Sprites should always be saved in the orct palette so that they can be read properly by the game
         if not keep_palette:
             if self.palette != pal.orct:
@@ -75,23 +173,46 @@ class Sprite:
 
                 image = self.image.convert('RGB').quantize(
                     palette=p)
-                image.save(path, transparency=0)
+                image.save(path, format=format, transparency=0)
             else:
-                self.image.save(path)
+                self.image.save(path, format=format)
         else:
-            self.image.save(path)
+            self.image.save(path, format=format)
 
     def isEmpty(self):
         return spriteIsEmpty(self)
 
     def show(self, first_remap: str = 'NoColor', second_remap: str = 'NoColor', third_remap: str = 'NoColor'):
-        return colorRemaps(self.image, first_remap, second_remap, third_remap)
+        """Returns the sprite image with the given remap colors. Results are cached until the image changes,
+        so the returned image must not be changed in place."""
+        key = (self.version, self.palette.name, first_remap, second_remap, third_remap)
+        image = self._show_cache.get(key)
+        if image is not None:
+            self._show_cache.move_to_end(key)
+            return image
+
+        transform = ColorTransform(self.palette).colorRemaps(first_remap, second_remap, third_remap)
+
+        if self.isIndexed():
+            image = self.palette.fromIndices(transform.applyIndices(self._indices))
+        else:
+            image = transform.apply(self.image)
+
+        self._show_cache[key] = image
+        if len(self._show_cache) > SHOW_CACHE_SIZE:
+            self._show_cache.popitem(last=False)
+
+        return image
 
     def giveProtectedPixelMask(self, color: str or list):
+        if self.isIndexed():
+            return Image.fromarray(protectedIndexLut(color, self.palette)[self._indices])
+
         return protectColorMask(self.image, color, self.palette)
 
     def resetSprite(self):
-        self.image = self.image_base
+        self._imageChanged()
+        self._image, self._indices = self._base
         self.resetOffsets()
 
     def clearSprite(self):
@@ -99,7 +220,11 @@ class Sprite:
         self.x, self.y, self.x_base, self.y_base = 0, 0, 0, 0
 
     def setFromSprite(self, sprite_in):
-        self.image = copy(sprite_in.image)
+        # index arrays are never changed in place, so they can be shared
+        if self.indexed and sprite_in.isIndexed() and sprite_in.palette == self.palette:
+            self.setIndices(sprite_in.indices)
+        else:
+            self.image = copy(sprite_in.image)
         self.x = int(sprite_in.x)
         self.y = int(sprite_in.y)
         self.x_base = int(self.x)
@@ -115,50 +240,99 @@ class Sprite:
         self.x_base = x
         self.y_base = y
 
+    def shiftOffsets(self, dx, dy):
+        """Moves the offsets and takes them as new base offsets. A lazy sprite is not decoded for this."""
+        if '_loader' in self.__dict__:
+            cls, load, coords, shift = self._loader
+            self._loader = (cls, load, coords, (shift[0] + dx, shift[1] + dy))
+        else:
+            self.overwriteOffsets(int(self.x) + dx, int(self.y) + dy)
+
     def checkPrimaryColor(self):
-        return checkPrimaryColor(self.image, self.palette)
+        return self.checkColor('1st Remap')
 
     def checkSecondaryColor(self):
-        return checkSecondaryColor(self.image, self.palette)
+        return self.checkColor('2nd Remap')
 
     def checkTertiaryColor(self):
-        return checkTertiaryColor(self.image, self.palette)
+        return self.checkColor('3rd Remap')
 
     def checkColor(self, color_name: str):
-        return checkColor(self.image, color_name, self.palette)
+        return pal.canonicalColor(color_name) in self.colorHistogram()
+
+    def colorHistogram(self):
+        """Returns a dict from the palette colors in the sprite, including remaps and sparkles, to their number of
+        visible pixels. Computed in one pass and cached until the image changes."""
+        self.load()
+        key = (self.version, self.palette.name)
+        if self._histogram is None or self._histogram[0] != key:
+            if self.isIndexed():
+                histogram = self.palette.indexHistogram(self._indices)
+            else:
+                histogram = self.palette.histogram(np.asarray(self.image.convert('RGBA')))
+            self._histogram = (key, histogram)
+
+        return dict(self._histogram[1])
 
     def switchPalette(self, palette_new: pal.Palette):
-        self.image = pal.switchPalette(
+        # Palettes share the index layout, so an indexed sprite only needs all its indices to exist in the new palette
+        if self.isIndexed() and palette_new.indexTable()[np.unique(self._indices[self._indices != pal.TRANSPARENT_INDEX]), 3].all():
+            self.palette = palette_new
+            self._image = None
+            self._imageChanged()
+            return
+
+        image = pal.switchPalette(
             self.image, self.palette, palette_new)
         self.palette = palette_new
+        self.image = image
 
     def changeBrightness(self, step: int):
-        self.image = changeBrightness(
-            self.image, step, self.palette)
+        colors = list(self.palette.color_dict) + ['Sparkles']
+        self.applyTransform(ColorTransform(
+            self.palette).changeBrightnessColor(step, colors))
 
     def changeBrightnessColor(self, step: int, color):
-        self.image = changeBrightnessColor(
-            self.image, step, color, self.palette)
+        self.applyTransform(ColorTransform(
+            self.palette).changeBrightnessColor(step, color))
 
     def invertShadingColor(self, color: str or list):
-        self.image = invertShadingColor(self.image, color, self.palette)
+        self.applyTransform(ColorTransform(
+            self.palette).invertShadingColor(color))
 
     def removeColor(self, color: str or list):
-        self.image = removeColor(self.image, color, self.palette)
+        self.applyTransform(ColorTransform(self.palette).removeColor(color))
         self.crop()
 
     def remapColor(self, color_name_old: str, color_name_new: str):
-        self.image = remapColor(
-            self.image, color_name_old, color_name_new,  self.palette)
+        self.applyTransform(ColorTransform(
+            self.palette).remapColor(color_name_old, color_name_new))
 
     def colorAllInRemap(self, color_name: str):
-        self.image = colorAllInRemap(self.image, color_name,  self.palette)
+        self.applyTransform(ColorTransform(
+            self.palette).colorAllInRemap(color_name))
+
+    def applyTransform(self, transform):
+        """Applies a ColorTransform (or a chain of them) in a single pass."""
+        if transform.isIdentity():
+            return
+
+        if self.isIndexed():
+            self.setIndices(transform.applyIndices(self._indices))
+        else:
+            self.image = transform.apply(self.image)
 
     def crop(self):
-        bbox = self.image.getbbox()
+        if self.isIndexed():
+            bbox = indicesBbox(self._indices)
+            if bbox and bbox != (0, 0, self._indices.shape[1], self._indices.shape[0]):
+                self.setIndices(self._indices[bbox[1]:bbox[3], bbox[0]:bbox[2]].copy())
+        else:
+            bbox = self.image.getbbox()
+            if bbox:
+                self.image = self.image.crop(bbox)
 
         if bbox:
-            self.image = self.image.crop(bbox)
             self.x = self.x + bbox[0]
             self.y = self.y + bbox[1]
         else:
@@ -166,64 +340,69 @@ class Sprite:
             self.y = 0
 
     def merge(self, sprite, offset_x, offset_y):
-        s1 = self
-        s2 = sprite
-        s2.x += offset_x
-        s2.y += offset_y
+        sprite.x += offset_x
+        sprite.y += offset_y
+
+        self.mergeAll([sprite])
 
-        canvas_size_x = max(abs(s1.x), abs(s1.image.width+s1.x),
-                            abs(s2.x), abs(s2.image.width+s2.x))
-        canvas_size_y = max(abs(s1.y), abs(s1.image.height+s1.y),
-                            abs(s2.y), abs(s2.image.height+s2.y))
-        canvas = Image.new('RGBA', (canvas_size_x*2, canvas_size_y*2))
+    def mergeAll(self, sprites: list, offsets: list = None):
+        """Pastes the sprites in the given order on top of this sprite, shifted by offsets (default no shift).
+        Only the bounding box of all sprites is allocated."""
+        if offsets is None:
+            offsets = [(0, 0)]*len(sprites)
 
-        canvas.paste(s1.image, (s1.x+canvas_size_x, s1.y+canvas_size_y))
-        canvas.paste(s2.image, (s2.x+canvas_size_x,
-                     s2.y+canvas_size_y), mask=s2.image)
+        rects = [(self.x, self.y, self.image)]
+        rects += [(s.x+dx, s.y+dy, s.image) for s, (dx, dy) in zip(sprites, offsets)]
+
+        x0 = min(x for x, _, _ in rects)
+        y0 = min(y for _, y, _ in rects)
+        x1 = max(x+image.width for x, _, image in rects)
+        y1 = max(y+image.height for _, y, image in rects)
+        canvas = Image.new('RGBA', (x1-x0, y1-y0))
+
+        canvas.paste(self.image, (self.x-x0, self.y-y0))
+        for x, y, image in rects[1:]:
+            canvas.paste(image, (x-x0, y-y0), mask=image)
 
         bbox = canvas.getbbox()
 
         if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -canvas_size_x + bbox[0]
-            y_offset = -canvas_size_y + bbox[1]
-
-            self.image = canvas
-            self.x = x_offset
-            self.y = y_offset
+            self.image = canvas.crop(bbox)
+            self.x = x0 + bbox[0]
+            self.y = y0 + bbox[1]
 
         self.crop()
-        
+
     def mask(self, sprite_mask, offset_x, offset_y):
-        s1 = self
-        s2 = sprite_mask
-        s2.x += offset_x
-        s2.y += offset_y
-
-        canvas_size_x = max(abs(s1.x), abs(s1.image.width+s1.x),
-                            abs(s2.x), abs(s2.image.width+s2.x))
-        canvas_size_y = max(abs(s1.y), abs(s1.image.height+s1.y),
-                            abs(s2.y), abs(s2.image.height+s2.y))
-        canvas = Image.new('RGBA', (canvas_size_x*2, canvas_size_y*2))
-        mask = Image.new('RGBA', (canvas_size_x*2, canvas_size_y*2))
-        canvas.paste(s1.image, (s1.x+canvas_size_x, s1.y+canvas_size_y))
-        mask.paste(s2.image, (s2.x+canvas_size_x, s2.y+canvas_size_y))
-        
-        canvas  = pasteOnMask(mask, canvas)
-        
+        sprite_mask.x += offset_x
+        sprite_mask.y += offset_y
+
+        # everything outside of this sprite stays transparent, so only its own area is needed
+        canvas = np.array(self.image)
+        alpha = np.zeros(canvas.shape[:2], dtype=np.uint8)
+
+        left = max(sprite_mask.x - self.x, 0)
+        top = max(sprite_mask.y - self.y, 0)
+        right = min(sprite_mask.x + sprite_mask.image.width - self.x, canvas.shape[1])
+        bottom = min(sprite_mask.y + sprite_mask.image.height - self.y, canvas.shape[0])
+
+        if left < right and top < bottom:
+            mask_alpha = np.asarray(sprite_mask.image.getchannel('A'))
+            alpha[top:bottom, left:right] = mask_alpha[
+                top+self.y-sprite_mask.y:bottom+self.y-sprite_mask.y,
+                left+self.x-sprite_mask.x:right+self.x-sprite_mask.x]
+
+        canvas[:, :, 3] = np.where(canvas[:, :, 3] == 0, 0, alpha)
+        canvas = Image.fromarray(canvas)
+
         bbox = canvas.getbbox()
 
         if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -canvas_size_x + bbox[0]
-            y_offset = -canvas_size_y + bbox[1]
-
-            self.image = canvas
-            self.x = x_offset
-            self.y = y_offset
+            self.image = canvas.crop(bbox)
+            self.x = self.x + bbox[0]
+            self.y = self.y + bbox[1]
 
         self.crop()
-        
 
     def giveShade(self, coords):
         if coords[0] < 0 or coords[1] < 0:
@@ -237,6 +416,43 @@ class Sprite:
         return self.palette.giveShade(r, g, b, a)
 
 
+class _LazySprite(Sprite):
+    """A sprite from Sprite.fromLoader whose image is not decoded yet. Loading turns it into a regular Sprite."""
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, i.e. the image data that is not decoded yet
+        if name in _LAZY_ATTRIBUTES and '_loader' in self.__dict__:
+            self.load()
+            return getattr(self, name)
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        # Written image data or offsets must not be overwritten by the decoding later on
+        if name in _LAZY_ATTRIBUTES and '_loader' in self.__dict__:
+            self.load()
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        # a shallow copy stays lazy
+        sprite = _LazySprite.__new__(_LazySprite)
+        sprite.__dict__.update(self.__dict__)
+        return sprite
+
+    def __reduce_ex__(self, protocol):
+        # the source may be a buffer that cannot be deep copied or pickled, so we decode first
+        self.load()
+        return self.__reduce_ex__(protocol)
+
+
+def openImage(source):
+    """Opens an image from a path, file object or the bytes of an image file as RGBA image."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+
+    return Image.open(source).convert('RGBA')
+
+
 def pasteOnMask(mask: Image.Image, pic_in: Image.Image):
     mask_ar = np.array(mask)
     pic_ar = np.array(pic_in)
@@ -255,314 +471,243 @@ def mergeSprites(image1: Image.Image, image2: Image.Image, palette: pal.Palette
 
 
 def checkPrimaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor('1st Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
-
-    return False
+    return checkColor(image, '1st Remap', palette)
 
 
 def checkSecondaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor('2nd Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
-
-    return False
+    return checkColor(image, '2nd Remap', palette)
 
 
 def checkTertiaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor('3rd Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
-
-    return False
+    return checkColor(image, '3rd Remap', palette)
 
 
 def checkColor(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor(color_name)
-    for shade in colors:
-        if np.equal(shade, data[:, :, :3]).all(axis=2).any():
-            return True
-
-    return False
+    return pal.canonicalColor(color_name) in palette.histogram(np.asarray(image.convert('RGBA')))
 
 
 def remapColor(image: Image.Image, color_name_old: str, color_name_new: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
-    color_old = palette.getColor(color_name_old)
-    color_new = palette.getColor(color_name_new)
+    return ColorTransform(palette).remapColor(color_name_old, color_name_new).apply(image)
 
-    if color_name_old == 'Sparkles':
-        color_old = np.append(
-            color_old, [color_old[-1], color_old[-1]], axis=0)
-    if color_name_new == 'Sparkles':
-        color_new = np.append(
-            color_new, [color_new[-1], color_new[-1]], axis=0)
-    # if color_new == 'NoColor':
-    #     return image
 
-    for i in range(12):
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :][mask] = [r2, g2, b2, 255]
+def colorRemaps(image: Image.Image, first_remap: str, second_remap: str, third_remap: str, palette: pal.Palette = pal.orct):
+    return ColorTransform(palette).colorRemaps(first_remap, second_remap, third_remap).apply(image)
 
-    return Image.fromarray(data_out)
 
+def colorFirstRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    if color_name == 'NoColor':
+        return image
 
-def colorRemaps(image: Image.Image, first_remap: str, second_remap: str, third_remap: str, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    return colorRemaps(image, color_name, 'NoColor', 'NoColor', palette)
 
-    for color_names in [['1st Remap', first_remap], ['2nd Remap', second_remap], ['3rd Remap', third_remap]]:
-        if color_names[1] == 'NoColor':
-            continue
 
-        color_old = palette.getColor(color_names[0])
-        color_new = palette.getRemapColor(color_names[1])
+def colorSecondRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    if color_name == 'NoColor':
+        return image
 
-        for i in range(12):
+    return colorRemaps(image, 'NoColor', color_name, 'NoColor', palette)
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return Image.fromarray(data_out)
+def colorThirdRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    if color_name == 'NoColor':
+        return image
 
+    return colorRemaps(image, 'NoColor', 'NoColor', color_name, palette)
 
-def colorFirstRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
 
+def colorAllInRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
     if color_name == 'NoColor':
         return image
 
-    color_old = palette.getColor('1st Remap')
-    color_new = palette.getRemapColor(color_name)
+    return ColorTransform(palette).colorAllInRemap(color_name).apply(image)
 
-    for i in range(12):
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
+def changeBrightnessColor(image: Image.Image, value: int, color: str or list, palette: pal.Palette = pal.orct):
+    return ColorTransform(palette).changeBrightnessColor(value, color).apply(image)
 
-    return Image.fromarray(data_out)
 
+def changeBrightness(image: Image.Image, step: int, palette: pal.Palette = pal.orct):
+    colors = list(palette.color_dict)
+    if palette.has_sparkles:
+        colors.append('Sparkles')
 
-def colorSecondRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    return changeBrightnessColor(image, step, colors, palette)
 
-    if color_name == 'NoColor':
-        return image
 
-    color_old = palette.getColor('2nd Remap')
-    color_new = palette.getRemapColor(color_name)
+def invertShadingColor(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
+    return ColorTransform(palette).invertShadingColor(color).apply(image)
 
-    for i in range(12):
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
+def removeColor(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
+    return ColorTransform(palette).removeColor(color).apply(image)
 
-    return Image.fromarray(data_out)
 
+def protectColorMask(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
+    slots, found = palette.lookupSlots(np.asarray(image.convert('RGBA')))
+    _, slot_of_index, _ = palette.keyTable()
 
-def colorThirdRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    protected = np.zeros(len(palette.keyTable()[0]), dtype=bool)
+    slot_indices = slot_of_index[colorListIndices(color, palette)]
+    protected[slot_indices[slot_indices >= 0]] = True
 
-    if color_name == 'NoColor':
-        return image
+    return Image.fromarray(found & protected[slots])
 
-    color_old = palette.getColor('3rd Remap')
-    color_new = palette.getRemapColor(color_name)
 
-    for i in range(12):
+def spriteIsEmpty(sprite):
+    if sprite.isIndexed():
+        return not sprite.indices.any()
+    if sprite.image.getbbox() is None:
+        return True
+    return False
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return Image.fromarray(data_out)
+def indicesBbox(indices: np.ndarray):
+    """Bounding box of the non-transparent pixels of an index array, same format as Image.getbbox."""
+    rows = np.flatnonzero(indices.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(indices.any(axis=0))
 
+    return (int(cols[0]), int(rows[0]), int(cols[-1])+1, int(rows[-1])+1)
 
-def colorAllInRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
 
-    if color_name == 'NoColor':
-        return image
+# Lookup tables on palette indices. Applying a table to an index array with np.take performs the
+# color operation in a single pass.
 
-    for color_old in pal.allColors():
+def identityLut():
+    return np.arange(256, dtype=np.uint8)
 
-        color_old = palette.getColor(color_old)
-        color_new = palette.getRemapColor(color_name)
 
-        for i in range(12):
+def colorListIndices(color: str or list, palette: pal.Palette = pal.orct):
+    if isinstance(color, str):
+        color = [color]
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
+    indices = [palette.colorIndices(color_name) for color_name in color]
+    indices = [ind for ind in indices if ind is not None]
 
-    return Image.fromarray(data_out)
+    return np.concatenate(indices) if indices else np.array([], dtype=np.uint8)
 
 
-def changeBrightnessColor(image: Image.Image, value: int, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+def protectedIndexLut(color: str or list, palette: pal.Palette = pal.orct):
+    """Boolean table over the 256 palette indices, True for the shades of the given colors."""
+    return palette.compiled().colorMask(color)
 
-    if isinstance(color, str):
-        color = [color]
 
-    for color_name in color:
+def remapColorLut(color_name_old: str, color_name_new: str, palette: pal.Palette = pal.orct):
+    lut = identityLut()
+    ind_old = palette.colorIndices(color_name_old)
+    ind_new = palette.colorIndices(color_name_new)
 
-        color_arr = palette.getColor(color_name)
+    if ind_old is None or ind_new is None:
+        return lut
 
-        if not isinstance(color_arr, np.ndarray):
-            continue
+    # Sparkles have less shades, their last shade is repeated like in remapColor
+    shades = np.arange(12)
+    lut[ind_old[np.minimum(shades, len(ind_old)-1)]] = ind_new[np.minimum(shades, len(ind_new)-1)]
 
-        if (value < 0):
-            for step in range(-value):
-                for i in range(len(color_arr)):
-                    j = i
-                    if (i > 0):
-                        j -= 1
-                    r1, g1, b1 = color_arr[i]  # Original value
-                    # Value that we want to replace it with
-                    r2, g2, b2 = color_arr[j]
-                    red, green, blue = data_in[:, :,
-                                               0], data_in[:, :, 1], data_in[:, :, 2]
-                    mask = (red == r1) & (green == g1) & (blue == b1)
-                    data_out[:, :, :3][mask] = [r2, g2, b2]
-        else:
-            for step in range(value):
-                for i in range(len(color_arr)):
-                    j = i
-                    if (i < len(color_arr) - 1):
-                        j += 1
-                    r1, g1, b1 = color_arr[i]  # Original value
-                    # Value that we want to replace it with
-                    r2, g2, b2 = color_arr[j]
-                    red, green, blue = data_in[:, :,
-                                               0], data_in[:, :, 1], data_in[:, :, 2]
-                    mask = (red == r1) & (green == g1) & (blue == b1)
-                    data_out[:, :, :3][mask] = [r2, g2, b2]
-
-    return Image.fromarray(data_out)
+    return lut
 
 
-def changeBrightness(image: Image.Image, step: int, palette: pal.Palette = pal.orct):
+def colorRemapsLut(first_remap: str, second_remap: str, third_remap: str, palette: pal.Palette = pal.orct):
+    lut = identityLut()
 
-    if palette.has_sparkles:
-        image = changeBrightnessColor(image, step, 'Sparkles', palette)
+    for color_names in [['1st Remap', first_remap], ['2nd Remap', second_remap], ['3rd Remap', third_remap]]:
+        if color_names[1] == 'NoColor':
+            continue
 
-    image = changeBrightnessColor(
-        image, step, list(palette.color_dict), palette)
+        lut[palette.colorIndices(color_names[0])] = palette.remapIndices(color_names[1])
 
-    return image
+    return lut
 
 
-def invertShadingColor(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+def colorAllInRemapLut(color_name: str, palette: pal.Palette = pal.orct):
+    lut = identityLut()
 
-    if isinstance(color, str):
-        color = [color]
+    if color_name == 'NoColor':
+        return lut
 
-    for color_name in color:
+    compiled = palette.compiled()
+    mask = compiled.colorMask(list(pal.allColors()))
+    shades = np.flatnonzero(mask) - 1 - 12*compiled.color_of_index[mask]
 
-        color_arr = palette.getColor(color_name)
+    lut[mask] = palette.remapIndices(color_name)[shades]
 
-        if not isinstance(color_arr, np.ndarray):
-            continue
+    return lut
 
-        for i in range(len(color_arr)):
 
-            r1, g1, b1 = color_arr[i]  # Original value
-            # Value that we want to replace it with
-            r2, g2, b2 = color_arr[len(color_arr)-1-i]
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :][mask] = [r2, g2, b2, 255]
+def changeBrightnessColorLut(step: int, color: str or list, palette: pal.Palette = pal.orct):
+    compiled = palette.compiled()
+    return np.where(compiled.colorMask(color), compiled.brightnessLut(step), identityLut())
 
-    return Image.fromarray(data_out)
 
+def invertShadingColorLut(color: str or list, palette: pal.Palette = pal.orct):
+    compiled = palette.compiled()
+    return np.where(compiled.colorMask(color), compiled.inverted, identityLut())
 
-def removeColor(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
 
-    mask = np.full(image.size, False).T
+def removeColorLut(color: str or list, palette: pal.Palette = pal.orct):
+    lut = identityLut()
+    lut[colorListIndices(color, palette)] = pal.TRANSPARENT_INDEX
 
-    if isinstance(color, str):
-        color = [color]
+    return lut
 
-    for color_name in color:
 
-        if color_name not in palette.color_dict:
-            continue
-        color_arr = palette.getColor(color_name)
+class ColorTransform:
+    """Color operation on palette indices, stored as 256-entry lookup table.
 
-        for shade in color_arr:
-            r1, g1, b1 = shade  # Original value
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = mask | ((red == r1) & (green == g1) & (blue == b1))
+    Operations are chained into a single table, e.g.
+    ColorTransform(palette).changeBrightnessColor(2, colors).remapColor('Grey', 'Red').apply(image)
+    so that any sequence of operations costs one pass over the image."""
 
-    data_out[:, :, :][mask] = [0, 0, 0, 0]
+    def __init__(self, palette: pal.Palette = pal.orct, lut: np.ndarray = None):
+        self.palette = palette
+        self.lut = identityLut() if lut is None else lut
 
-    return Image.fromarray(data_out)
+    def then(self, lut: np.ndarray):
+        """Returns the transform that first applies this transform and then the given table."""
+        return ColorTransform(self.palette, np.take(lut, self.lut))
 
+    def remapColor(self, color_name_old: str, color_name_new: str):
+        return self.then(remapColorLut(color_name_old, color_name_new, self.palette))
 
-def protectColorMask(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
+    def colorRemaps(self, first_remap: str, second_remap: str, third_remap: str):
+        return self.then(colorRemapsLut(first_remap, second_remap, third_remap, self.palette))
 
-    mask = np.full(image.size, True).T
+    def colorAllInRemap(self, color_name: str):
+        return self.then(colorAllInRemapLut(color_name, self.palette))
 
-    if isinstance(color, str):
-        color = [color]
+    def changeBrightnessColor(self, step: int, color: str or list):
+        return self.then(changeBrightnessColorLut(step, color, self.palette))
 
-    for color_name in color:
+    def invertShadingColor(self, color: str or list):
+        return self.then(invertShadingColorLut(color, self.palette))
 
-        if color_name not in palette.color_dict:
-            continue
-        color_arr = palette.getColor(color_name)
+    def removeColor(self, color: str or list):
+        return self.then(removeColorLut(color, self.palette))
 
-        for shade in color_arr:
-            r1, g1, b1 = shade  # Original value
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = mask & ~((red == r1) & (green == g1) & (blue == b1))
+    def isIdentity(self):
+        return bool(np.all(self.lut == identityLut()))
 
-    return Image.fromarray(~mask)
+    def applyIndices(self, indices: np.ndarray):
+        return np.take(self.lut, indices)
 
+    def apply(self, image: Image.Image):
+        """Applies the transform to an RGBA image. Pixels without palette color are left untouched."""
+        data = np.array(image.convert('RGBA'))
+        slots, found = self.palette.lookupSlots(data)
+        _, slot_of_index, _ = self.palette.keyTable()
 
-def spriteIsEmpty(sprite):
-    if sprite.image.getbbox() is None:
-        return True
-    return False
+        # A color that appears several times in the palette takes the result of its last changed index
+        slot_target = np.full(len(self.palette.keyTable()[0]), -1, dtype=np.int16)
+        for index in np.flatnonzero(self.lut != identityLut()):
+            if slot_of_index[index] >= 0:
+                slot_target[slot_of_index[index]] = self.lut[index]
+
+        new = slot_target[slots]
+        changed = found & (new >= 0)
+        new = new[changed]
+
+        data[changed, :3] = self.palette.indexTable()[new, :3]
+        data[changed, 3] = np.where(new == pal.TRANSPARENT_INDEX, 0, data[changed, 3])
 
+        return Image.fromarray(data)
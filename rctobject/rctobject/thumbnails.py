@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+On-disk cache of the four rotation previews of objects.
+
+Previews are keyed by the hash of the object file content and the thumbnail size, so they are rendered
+once per object version. The cache folder is bounded in size; the least recently used previews are removed
+first (the file mtime is used as access time).
+
+Run as: python -m rctobject thumbnails INPUT [--cache FOLDER] [--jobs N]
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from os import makedirs, replace, remove, scandir, stat, utime, getpid
+from os.path import join, exists, expanduser, splitext
+from PIL import Image
+
+import rctobject.batch as batch
+import rctobject.objects as obj
+
+THUMBNAIL_PATH = join(expanduser('~'), '.rctobject', 'thumbnails')
+THUMBNAIL_SIZE = (128, 128)
+MAX_CACHE_BYTES = 256*1024*1024
+
+# Part of the cache key, to be increased when the rendering changes
+RENDER_VERSION = 1
+
+
+def fileHash(filepath: str):
+    digest = sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def renderThumbnails(filepath: str, size: tuple = THUMBNAIL_SIZE, openpath: str = obj.OPENRCTPATH):
+    """Renders the four rotation previews of an object, cropped and scaled down to fit into size."""
+    o = obj.load(filepath, openpath=openpath)
+
+    images = []
+    for rot in range(4):
+        image = o.show(rotation=rot)[0]
+        bbox = image.getbbox()
+        if bbox:
+            image = image.crop(bbox)
+        else:
+            image = Image.new('RGBA', (1, 1))
+
+        image.thumbnail(size, Image.NEAREST)
+        images.append(image)
+
+    return images
+
+
+def _renderToFiles(filepath: str, targets: list, size: tuple, openpath: str):
+    # the temporary names are unique per process, so other processes never see or move half-written files
+    tmp_path = None
+    try:
+        images = renderThumbnails(filepath, size, openpath)
+        for image, target in zip(images, targets):
+            tmp_path = f'{target}.{getpid()}.tmp'
+            image.save(tmp_path, format='PNG')
+            replace(tmp_path, target)
+            tmp_path = None
+    except Exception as e:
+        if tmp_path and exists(tmp_path):
+            remove(tmp_path)
+        return filepath, f'{type(e).__name__}: {e}'
+
+    return filepath, ''
+
+
+class ThumbnailCache:
+    """Size-bounded on-disk cache of rotation previews, see the module description."""
+
+    def __init__(self, folder: str = THUMBNAIL_PATH, size: tuple = THUMBNAIL_SIZE,
+                 max_bytes: int = MAX_CACHE_BYTES, openpath: str = obj.OPENRCTPATH):
+        makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.size = tuple(size)
+        self.max_bytes = max_bytes
+        self.openpath = openpath
+
+        # (mtime, file size, hash) by path, so unchanged files are only read once; a changed file replaces
+        # the entry of its path, so there is at most one entry per object file
+        self._hashes = {}
+        self._bytes = sum(entry.stat().st_size for entry in scandir(folder)
+                          if entry.name.endswith('.png'))
+
+    def key(self, filepath: str):
+        info = stat(filepath)
+        cached = self._hashes.get(filepath)
+        if cached is None or cached[:2] != (info.st_mtime, info.st_size):
+            cached = (info.st_mtime, info.st_size, fileHash(filepath))
+            self._hashes[filepath] = cached
+
+        return f'{cached[2]}_{self.size[0]}x{self.size[1]}_v{RENDER_VERSION}'
+
+    def _targets(self, filepath: str):
+        key = self.key(filepath)
+        return [join(self.folder, f'{key}_{rot}.png') for rot in range(4)]
+
+    def contains(self, filepath: str):
+        return all(exists(target) for target in self._targets(filepath))
+
+    def paths(self, filepath: str):
+        """Returns the png paths of the four previews, rendering them if they are not cached."""
+        targets = self._targets(filepath)
+        if all(exists(target) for target in targets):
+            for target in targets:
+                utime(target)
+        else:
+            _, error = _renderToFiles(filepath, targets, self.size, self.openpath)
+            if error:
+                raise RuntimeError(f'Could not render previews of {filepath}: {error}')
+            # the new previews are the most recently used ones, but keep them explicitly in case the
+            # mtime resolution puts them on par with older files
+            self._added(targets)
+            self.evict(keep=targets)
+
+        return targets
+
+    def get(self, filepath: str):
+        """Returns the four previews of an object as images."""
+        images = []
+        for target in self.paths(filepath):
+            with Image.open(target) as image:
+                images.append(image.convert('RGBA'))
+
+        return images
+
+    def fill(self, filepaths: list, jobs: int = 1):
+        """Renders the previews of all given files that are not cached yet, using worker processes if jobs > 1.
+        Returns a dict with the counts of rendered, cached and failed files and the list of (filepath, error) of
+        the failures."""
+        summary = {'rendered': 0, 'cached': 0, 'failed': 0, 'errors': []}
+
+        # identical files, e.g. copies of an object in several folders, share their previews and are rendered once
+        by_targets = {}
+        for filepath in filepaths:
+            targets = self._targets(filepath)
+            if all(exists(target) for target in targets):
+                summary['cached'] += 1
+            else:
+                by_targets.setdefault(tuple(targets), []).append(filepath)
+
+        tasks = [(copies[0], list(targets)) for targets, copies in by_targets.items()]
+
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(
+                    _renderToFiles, *zip(*tasks), [self.size]*len(tasks), [self.openpath]*len(tasks)))
+        else:
+            results = [_renderToFiles(filepath, targets, self.size, self.openpath)
+                       for filepath, targets in tasks]
+
+        for (_, targets), (_, error) in zip(tasks, results):
+            copies = by_targets[tuple(targets)]
+            if error:
+                summary['failed'] += len(copies)
+                summary['errors'] += [(filepath, error) for filepath in copies]
+            else:
+                summary['rendered'] += len(copies)
+                self._added(targets)
+
+        self.evict()
+
+        return summary
+
+    def _added(self, targets: list):
+        self._bytes += sum(stat(target).st_size for target in targets)
+
+    def evict(self, keep: list = ()):
+        """Removes least recently used previews until the cache is smaller than max_bytes.
+        The files in keep are never removed, even if the cache stays larger than max_bytes."""
+        if self._bytes <= self.max_bytes:
+            return
+
+        keep = set(keep)
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in scandir(self.folder)
+                         if entry.name.endswith('.png'))
+        self._bytes = sum(entry[1] for entry in entries)
+
+        # remove down to 90% so that not every new preview causes a scan of the folder
+        for _, file_size, path in entries:
+            if self._bytes <= 0.9*self.max_bytes:
+                break
+            if path in keep:
+                continue
+            remove(path)
+            self._bytes -= file_size
+
+    def clear(self):
+        for entry in scandir(self.folder):
+            if entry.name.endswith('.png'):
+                remove(entry.path)
+        self._bytes = 0
+
+
+def add_parser(subparsers):
+    parser = subparsers.add_parser('thumbnails', help='Render the rotation previews of objects into the cache.')
+    parser.add_argument('input', help='Object file or folder that is searched recursively.')
+    parser.add_argument('--cache', default=THUMBNAIL_PATH, help=f'Cache folder (default: {THUMBNAIL_PATH}).')
+    parser.add_argument('--size', type=int, nargs=2, default=THUMBNAIL_SIZE, metavar=('WIDTH', 'HEIGHT'),
+                        help='Maximum size of the previews.')
+    parser.add_argument('--max-mb', type=int, default=MAX_CACHE_BYTES//(1024*1024),
+                        help='Maximum size of the cache in MB.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('--openrct2', default=obj.OPENRCTPATH, help='OpenRCT2 folder.')
+    parser.set_defaults(func=main)
+
+
+def main(args):
+    filepaths = batch.find_files(args.input, lambda filename: splitext(filename)[1].lower() in obj.OBJECT_EXTENSIONS)
+
+    cache = ThumbnailCache(args.cache, size=args.size, max_bytes=args.max_mb*1024*1024, openpath=args.openrct2)
+    summary = cache.fill(filepaths, jobs=args.jobs)
+    for filepath, error in summary['errors']:
+        print(f'FAILED {filepath}: {error}')
+
+    print(f"{summary['rendered']} rendered, {summary['cached']} cached, {summary['failed']} failed")
+
+    return 1 if summary['failed'] else 0
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Shared test setup.
+"""
+
+import rctobject.palette as pal
+
+# tests compile the palettes instead of writing them into the home folder
+pal.COMPILED_PATH = None
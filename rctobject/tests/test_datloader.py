@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Regression test of rle_decode against the previous list-append decoder.
+"""
+
+import random
+from struct import pack
+
+import pytest
+
+import rctobject.datloader as dat
+
+
+def reference_rle_decode(string: bytes):
+    """rle_decode as it was before runs were appended as whole slices."""
+    srcLength = len(string)
+    output = []
+    i = 5
+    if i >= srcLength:
+        return False
+
+    if string[0] == 0:
+        return string[5:]
+    if string[0] != 1:
+        return False
+
+    while i < srcLength:
+        byte = string[i]
+        i += 1
+        if (byte & 0x80) == 0:
+            copy = byte + 1
+            if copy + i > srcLength:
+                raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE', copy, byte, i)
+
+            for c in string[i:i + copy]:
+                output.append(c)
+            i += copy
+
+        else:
+            repeat = (~byte & 0xff)+2
+            if i + 1 > srcLength:
+                raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE')
+
+            repeated_byte = string[i]
+            i += 1
+
+            for j in range(repeat):
+                output.append(repeated_byte)
+
+    return bytes(output)
+
+
+def random_runs(rng: random.Random, num_runs: int):
+    """Encoded body of random literal and repeat runs."""
+    body = bytearray()
+    for _ in range(num_runs):
+        if rng.random() < 0.5:
+            length = rng.randint(1, 128)
+            body.append(length - 1)
+            body += bytes(rng.randrange(256) for _ in range(length))
+        else:
+            body.append(rng.randint(0x80, 0xFF))
+            body.append(rng.randrange(256))
+
+    return bytes(body)
+
+
+def chunk(body: bytes, encoding: int = 1, size: int = None):
+    return bytes([encoding]) + pack('<L', len(body) if size is None else size) + body
+
+
+def decode_both(string: bytes):
+    """Outcome of the reference and of rle_decode as bytes and as memoryview: the result or the raised error."""
+    outcomes = []
+    for decode in (reference_rle_decode, dat.rle_decode, lambda s: dat.rle_decode(s, as_memoryview=True)):
+        try:
+            result = decode(string)
+        except RuntimeError as e:
+            outcomes.append(('error', e.args))
+        else:
+            outcomes.append(bytes(result) if isinstance(result, memoryview) else result)
+
+    return outcomes
+
+
+def assert_same(string: bytes):
+    reference, decoded, view = decode_both(string)
+    assert decoded == reference
+    assert view == reference
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_random_chunks(seed):
+    rng = random.Random(seed)
+    body = random_runs(rng, rng.randint(1, 200))
+
+    assert_same(chunk(body))
+    # the size in the header is not read
+    assert_same(chunk(body, size=rng.randrange(2**32)))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_truncated_and_corrupt_chunks(seed):
+    rng = random.Random(1000 + seed)
+    string = chunk(random_runs(rng, rng.randint(1, 50)))
+
+    assert_same(string[:rng.randint(0, len(string))])
+
+    corrupt = bytearray(string)
+    for _ in range(rng.randint(1, 5)):
+        corrupt[rng.randrange(5, len(corrupt))] = rng.randrange(256)
+    assert_same(bytes(corrupt))
+
+    # a literal run longer than the rest of the chunk
+    assert_same(string + bytes([0x7F, 1, 2]))
+    # a repeat run without its byte
+    assert_same(string + bytes([0x80]))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_unencoded_chunks(seed):
+    rng = random.Random(2000 + seed)
+    body = bytes(rng.randrange(256) for _ in range(rng.randint(0, 500)))
+
+    assert_same(chunk(body, encoding=0))
+
+
+@pytest.mark.parametrize('string', [b'', b'\x01', b'\x01\x00\x00\x00\x00', b'\x02\x00\x00\x00\x00\x01\x02',
+                                    b'\xff' + bytes(10), chunk(b'')])
+def test_short_and_unknown_chunks(string):
+    assert_same(string)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Indexing of objects whose sprites are in the original DATs, without OpenRCT2 installed.
+"""
+
+from json import dumps
+from zipfile import ZipFile
+
+import pytest
+
+import rctobject.library as library
+import rctobject.objects as obj
+
+
+def write_parkobj(path, data: dict):
+    with ZipFile(path, 'w') as archive:
+        archive.writestr('object.json', dumps(data))
+
+
+def official_object(dat_name: str, object_type: str, properties: dict):
+    """json of an object as shipped with OpenRCT2, its images refer to the original DAT."""
+    return {
+        'id': f'rct2.{object_type}.{dat_name.lower()}',
+        'originalId': f'00000081|{dat_name:<8}|00000000',
+        'authors': ['Chris Sawyer'],
+        'objectType': object_type,
+        'properties': properties,
+        'images': [f'$RCT2:OBJDATA/{dat_name}.DAT[0..3]'],
+        'strings': {'name': {'en-GB': f'{dat_name} object'}},
+    }
+
+
+@pytest.fixture
+def object_folder(tmp_path):
+    folder = tmp_path / 'object'
+    folder.mkdir()
+    write_parkobj(folder / 'small.parkobj', official_object(
+        'TBR1', 'scenery_small', {'height': 64, 'shape': '4/4', 'sceneryGroup': 'SCGTREES'}))
+    tiles = [{'x': 0, 'y': 0, 'clearance': 32}, {'x': 32, 'y': 64, 'clearance': 48}]
+    write_parkobj(folder / 'large.parkobj', official_object('TLARGE', 'scenery_large', {'tiles': tiles}))
+    write_parkobj(folder / 'wall.parkobj', official_object('WALLBR', 'scenery_wall', {'height': 4}))
+
+    return folder
+
+
+def test_scan_official_objects_without_openrct2(object_folder, tmp_path, monkeypatch):
+    # neither the default OpenRCT2 folder nor any other one may be used
+    monkeypatch.setattr(obj, 'OPENRCTPATH', str(tmp_path / 'missing'))
+
+    with library.ObjectLibrary(str(tmp_path / 'index.sqlite')) as index:
+        summary = index.scan(str(object_folder))
+        assert summary['added'] == 3 and summary['failed'] == 0
+        assert index.failures() == []
+
+        entries = {entry['datName']: entry for entry in index.search()}
+
+    assert set(entries) == {'TBR1', 'TLARGE', 'WALLBR'}
+    assert entries['TBR1']['size'] == (1, 1, 8)
+    assert entries['TBR1']['sceneryGroup'] == 'SCGTREES'
+    assert entries['TLARGE']['size'] == (2, 3, 6)
+    assert entries['WALLBR']['size'] is None
+    assert entries['WALLBR']['name'] == 'WALLBR object'
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2025 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Cache files of compiled palettes.
+"""
+
+import numpy as np
+import pytest
+
+import rctobject.palette as pal
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pal, 'COMPILED_PATH', str(tmp_path))
+    monkeypatch.setattr(pal, '_compiled', {})
+    return tmp_path
+
+
+def test_compiled_tables_are_cached(cache):
+    compiled = pal.orct.compiled()
+    assert [path.name for path in cache.iterdir()] == ['orct.npz']
+
+    pal._compiled.clear()
+    loaded = pal.orct.compiled()
+    assert loaded is not compiled
+    for name in pal.CompiledPalette.ARRAYS:
+        assert np.array_equal(getattr(loaded, name), getattr(compiled, name))
+
+
+def test_broken_cache_file_is_replaced(cache):
+    (cache / 'orct.npz').write_bytes(b'broken')
+    pal.orct.compiled()
+
+    pal.CompiledPalette.load(str(cache / 'orct.npz'), pal.orct)
+
+
+def test_failed_write_leaves_no_files(cache, monkeypatch):
+    def save(self, file):
+        file.write(b'half')
+        raise OSError('disk full')
+
+    monkeypatch.setattr(pal.CompiledPalette, 'save', save)
+    assert pal.orct.compiled().name == 'orct'
+    assert list(cache.iterdir()) == []